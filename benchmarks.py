@@ -0,0 +1,456 @@
+"""Assignment 2: Benchmarks
+
+=== Module Description ===
+This module contains benchmarks for the treemap code. Each benchmark builds
+its own input, times the code being measured, and prints a short report.
+Run this module directly to run all of them, or call a single benchmark
+function from the interpreter.
+"""
+from __future__ import annotations
+import csv
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List, Optional, Tuple
+
+from fs_scanner import ListdirScanner, ScandirScanner, SnapshotScanner
+import pygame
+
+from papers import DATA_FILE, GROUPINGS, PaperTable, PaperTree, \
+    PaperTreeStream, read_papers
+from rasterisers import RASTERISERS, draw_rects
+from tm_trees import FileSystemTree, TMTree
+from transitions import Transition
+from treemap_layouts import LAYOUTS, aspect_ratios
+
+
+def _time_call(func: Callable[[], object], repeat: int = 3) -> float:
+    """Return the best wall-clock time of <repeat> calls to <func>, in
+    seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_synthetic_directory(root: str, depth: int, folders: int,
+                             files: int) -> int:
+    """Create a synthetic directory tree inside the folder <root>, and return
+    the number of files and folders created.
+
+    Every folder above <depth> contains <folders> sub-folders and <files>
+    small files.
+    """
+    count = 0
+    stack = [(root, 0)]
+    while stack:
+        path, level = stack.pop()
+        for i in range(files):
+            with open(os.path.join(path, f'file{i}.txt'), 'w') as f:
+                f.write('x' * (i + 1))
+            count += 1
+        if level < depth:
+            for i in range(folders):
+                sub = os.path.join(path, f'dir{i}')
+                os.mkdir(sub)
+                count += 1
+                stack.append((sub, level + 1))
+    return count
+
+
+def make_synthetic_tree(depth: int, fanout: int, seed: int = 0,
+                        tree_class: type = TMTree) -> TMTree:
+    """Return a tree of <tree_class> of the given <depth> in which every
+    internal tree has <fanout> subtrees, and the leaves have random sizes.
+    """
+    rng = random.Random(seed)
+
+    def build(level: int) -> TMTree:
+        if level == depth:
+            return tree_class('leaf', [], rng.randint(1, 1000))
+        return tree_class('node', [build(level + 1) for _ in range(fanout)])
+
+    return build(0)
+
+
+def bench_scanners(depth: int = 4, folders: int = 6, files: int = 10) -> None:
+    """Compare the time taken by each scanner to scan a synthetic directory
+    tree, and to build a FileSystemTree from it.
+
+    Threads help most on cold caches and network file systems, where each
+    directory read waits on I/O; on a warm local cache the GIL limits them.
+    """
+    root = tempfile.mkdtemp()
+    try:
+        count = make_synthetic_directory(root, depth, folders, files)
+        engines: List[Tuple[str, object]] = [
+            ('listdir', ListdirScanner()),
+            ('scandir, 1 thread', ScandirScanner(1)),
+            ('scandir, 4 threads', ScandirScanner(4)),
+            ('scandir, default', ScandirScanner()),
+        ]
+        print(f'== FileSystemTree build, {count} entries ==')
+        baseline = None
+        for label, engine in engines:
+            scan = _time_call(lambda: engine.scan(root))
+            build = _time_call(lambda: FileSystemTree(root, engine))
+            baseline = baseline or build
+            print(f'{label:>20}: scan {scan * 1000:8.1f} ms, '
+                  f'build {build * 1000:8.1f} ms ({baseline / build:.2f}x)')
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_snapshot(depth: int = 3, folders: int = 8, files: int = 40) -> None:
+    """Compare a full scan of a synthetic directory tree with a rescan that
+    reuses a snapshot, when nothing and when one folder has changed.
+    """
+    root = tempfile.mkdtemp()
+    snapshot = os.path.join(tempfile.mkdtemp(), 'scan.snap')
+    try:
+        count = make_synthetic_directory(root, depth, folders, files)
+        print(f'== Snapshot rescan, {count} entries ==')
+        full = _time_call(lambda: ScandirScanner().scan(root))
+        print(f'{"full scan":>20}: {full * 1000:8.1f} ms')
+
+        scanner = SnapshotScanner(snapshot)
+        first = _time_call(lambda: scanner.scan(root), repeat=1)
+        print(f'{"first scan":>20}: {first * 1000:8.1f} ms')
+        unchanged = _time_call(lambda: scanner.scan(root))
+        print(f'{"unchanged":>20}: {unchanged * 1000:8.1f} ms '
+              f'({full / unchanged:.2f}x)')
+
+        def change_and_scan() -> None:
+            with open(os.path.join(root, 'dir0', 'new.txt'), 'w') as f:
+                f.write('new')
+            scanner.scan(root)
+            os.remove(os.path.join(root, 'dir0', 'new.txt'))
+
+        changed = _time_call(change_and_scan)
+        print(f'{"one folder changed":>20}: {changed * 1000:8.1f} ms '
+              f'({full / changed:.2f}x)')
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(os.path.dirname(snapshot))
+
+
+def _full_search(tree: TMTree, pos: Tuple[int, int]) -> Optional[TMTree]:
+    """Return the tree at <pos> by visiting every subtree at every level, as
+    get_tree_at_position did before the hit index.
+    """
+    x, y = pos
+    lx, ly, width, height = tree.rect
+    if not (lx <= x <= lx + width and ly <= y <= ly + height):
+        return None
+    if not tree._subtrees or not tree._expanded:
+        return tree
+    matches = [_full_search(t, pos) for t in tree._subtrees]
+    matches = [m for m in matches if m is not None]
+    return min(matches, key=lambda m: (m.rect[0], m.rect[1]), default=None)
+
+
+def bench_hit_testing(queries: int = 2000) -> None:
+    """Compare get_tree_at_position with a search of every subtree, on
+    synthetic trees of growing fanout.
+    """
+    print('== get_tree_at_position ==')
+    rng = random.Random(1)
+    points = [(rng.randrange(1200), rng.randrange(670))
+              for _ in range(queries)]
+    for depth, fanout in [(3, 10), (3, 30), (2, 300)]:
+        tree = make_synthetic_tree(depth, fanout)
+        tree.update_rectangles((0, 0, 1200, 670))
+        full = _time_call(lambda: [_full_search(tree, p) for p in points], 1)
+        indexed = _time_call(
+            lambda: [tree.get_tree_at_position(p) for p in points], 1)
+        print(f'{fanout ** depth:>8} leaves: full search '
+              f'{full / queries * 1e6:8.1f} us, indexed '
+              f'{indexed / queries * 1e6:6.1f} us ({full / indexed:.0f}x)')
+
+
+def bench_layouts(width: int = 1200, height: int = 670) -> None:
+    """Compare the time taken by each layout engine to lay out a whole tree,
+    and the shape of the leaf rectangles it produces, on the CS1 papers tree
+    and on synthetic trees.
+
+    A sliver is a leaf rectangle that is invisible (less than a pixel wide or
+    high) or more than 10 times longer than it is wide.
+    """
+    print('== Layout engines ==')
+    trees = [
+        ('papers by year', PaperTree('CS1', [], all_papers=True,
+                                     by_year=True)),
+        ('papers by topic', PaperTree('CS1', [], all_papers=True,
+                                      by_year=False)),
+        ('synthetic 20^3', make_synthetic_tree(3, 20)),
+        ('synthetic 8^5', make_synthetic_tree(5, 8)),
+    ]
+    for label, tree in trees:
+        tree.update_rectangles((0, 0, width, height))
+        leaves = len(tree.get_draw_list())
+        print(f'{label} ({leaves} leaves):')
+        for name in LAYOUTS:
+            layout = _time_call(lambda: tree.set_layout(name))
+            draw_list = tree.get_draw_list()
+            ratios = aspect_ratios(list(zip(draw_list.x, draw_list.y,
+                                            draw_list.width,
+                                            draw_list.height)))
+            slivers = leaves - sum(1 for ratio in ratios if ratio <= 10)
+            mean = sum(ratios) / len(ratios) if ratios else 0.0
+            print(f'{name:>20}: layout {layout * 1000:8.1f} ms, mean aspect '
+                  f'{mean:7.1f}, slivers {slivers / leaves:6.1%}')
+
+
+def bench_level_of_detail(width: int = 1200, height: int = 670,
+                          threshold: int = 2) -> None:
+    """Compare laying out synthetic trees of growing size after a resize, and
+    building their draw lists, with level of detail off and on.
+    """
+    print(f'== Level of detail, threshold {threshold} px ==')
+    for depth, fanout in [(3, 20), (4, 20), (5, 14)]:
+        tree = make_synthetic_tree(depth, fanout)
+        print(f'{fanout ** depth:>8} leaves:')
+        for label, setting in [('off', 0), ('on', threshold)]:
+            tree.set_lod_threshold(setting)
+            sizes = iter([(width, height), (width - 1, height)] * 3)
+
+            def resize() -> None:
+                tree.update_rectangles((0, 0) + next(sizes))
+                tree.get_draw_list()
+            elapsed = _time_call(resize)
+            print(f'{label:>20}: layout and draw list '
+                  f'{elapsed * 1000:8.1f} ms, '
+                  f'{len(tree.get_draw_list()):>8} rectangles')
+
+
+def bench_rasterisers(width: int = 1200, height: int = 670) -> None:
+    """Compare the time taken by each rasteriser to draw the leaves of
+    synthetic trees of growing size.
+    """
+    print('== Rasterisers ==')
+    surface = pygame.Surface((width, height))
+    for depth, fanout in [(3, 10), (3, 30), (4, 20), (5, 14)]:
+        tree = make_synthetic_tree(depth, fanout)
+        tree.update_rectangles((0, 0, width, height))
+        draw_list = tree.get_draw_list()
+        print(f'{len(draw_list):>8} rectangles:')
+        baseline = None
+        for name, rasterise in RASTERISERS.items():
+            elapsed = _time_call(lambda: rasterise(surface, draw_list))
+            baseline = baseline or elapsed
+            print(f'{name:>20}: {elapsed * 1000:8.1f} ms '
+                  f'({baseline / elapsed:.2f}x)')
+
+
+def bench_transitions(width: int = 1200, height: int = 670) -> None:
+    """Compare making a frame of a transition between two layouts with laying
+    the tree out again for every frame, on synthetic trees of growing size.
+
+    The transition goes from the slice-and-dice to the squarified layout, so
+    that every rectangle moves.
+    """
+    print('== Transitions ==')
+    surface = pygame.Surface((width, height))
+    for depth, fanout in [(3, 10), (3, 20), (3, 35)]:
+        tree = make_synthetic_tree(depth, fanout)
+        tree.update_rectangles((0, 0, width, height))
+        start = tree.get_draw_list()
+        tree.set_layout('squarified')
+        end = tree.get_draw_list()
+        print(f'{len(end):>8} rectangles:')
+        make = _time_call(lambda: Transition(start, end), repeat=1)
+        print(f'{"make transition":>20}: {make * 1000:8.1f} ms')
+        transition = Transition(start, end)
+        frame = _time_call(lambda: transition.frame(0.5))
+        draw = _time_call(lambda: draw_rects(surface, transition.frame(0.5)))
+        relayout = _time_call(lambda: tree.set_layout('squarified'))
+        print(f'{"frame":>20}: {frame * 1000:8.1f} ms, drawn '
+              f'{draw * 1000:8.1f} ms')
+        print(f'{"layout per frame":>20}: {relayout * 1000:8.1f} ms '
+              f'({relayout / frame:.0f}x)')
+
+
+def _without_slots(tree_class: type) -> type:
+    """Return a copy of <tree_class>, with the same bases and methods, that
+    keeps its attributes in an instance __dict__ instead of __slots__.
+
+    A subclass cannot do this: the slots it inherits still hold every
+    attribute the initializer sets, and its __dict__ stays empty.
+    """
+    slots = set(tree_class.__slots__) | {'__slots__', '__dict__',
+                                         '__weakref__'}
+    namespace = {name: value for name, value in vars(tree_class).items()
+                 if name not in slots}
+    return type(tree_class.__name__, tree_class.__bases__, namespace)
+
+
+# TMTree as it was before it had __slots__.
+_DictTree = _without_slots(TMTree)
+
+
+def _bytes_per_node(build: Callable[[], TMTree]) -> Tuple[float, int]:
+    """Return the memory allocated per tree, in bytes, by the tree <build>
+    returns, while it is held, and the number of trees in it.
+    """
+    tracemalloc.start()
+    try:
+        tree = build()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    count = 0
+    stack = [tree]
+    while stack:
+        count += 1
+        stack.extend(stack.pop()._subtrees)
+    return allocated / count, count
+
+
+def bench_memory(depth: int = 3, folders: int = 8, files: int = 40) -> None:
+    """Compare the memory held per tree by trees with an instance __dict__
+    and by trees with __slots__, for a synthetic TMTree and for a
+    FileSystemTree of a synthetic directory tree.
+    """
+    print('== Memory per tree ==')
+    for label, tree_class in [('__dict__', _DictTree), ('__slots__', TMTree)]:
+        per_node, count = _bytes_per_node(
+            lambda: make_synthetic_tree(4, 20, tree_class=tree_class))
+        print(f'{label:>20}: {per_node:8.1f} bytes per tree, '
+              f'{count} synthetic trees')
+    root = tempfile.mkdtemp()
+    try:
+        make_synthetic_directory(root, depth, folders, files)
+        per_node, count = _bytes_per_node(lambda: FileSystemTree(root))
+        print(f'{"FileSystemTree":>20}: {per_node:8.1f} bytes per tree, '
+              f'{count} files and folders')
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_lazy(depth: int = 3, folders: int = 8, files: int = 40) -> None:
+    """Compare building a FileSystemTree of a synthetic directory tree eagerly
+    with building it lazily, and the memory each holds once built, before
+    and after expanding one folder of the lazy tree.
+    """
+    root = tempfile.mkdtemp()
+    try:
+        count = make_synthetic_directory(root, depth, folders, files)
+        print(f'== Lazy FileSystemTree, {count} entries ==')
+        for label, lazy in [('eager', False), ('lazy', True)]:
+            build = _time_call(lambda: FileSystemTree(root, lazy=lazy))
+            per_node, nodes = _bytes_per_node(
+                lambda: FileSystemTree(root, lazy=lazy))
+            print(f'{label:>20}: build {build * 1000:8.1f} ms, '
+                  f'{per_node * nodes / 1024:8.1f} kB held, {nodes} trees')
+        folder = next(subtree for subtree
+                      in FileSystemTree(root, lazy=True)._subtrees
+                      if subtree._name == 'dir0')
+        expand = _time_call(folder.expand, repeat=1)
+        print(f'{"expand one folder":>20}: {expand * 1000:8.1f} ms, '
+              f'{len(folder._subtrees)} trees read')
+    finally:
+        shutil.rmtree(root)
+
+
+def make_synthetic_papers(path: str, copies: int) -> int:
+    """Write a dataset file of papers to <path>, with <copies> copies of
+    every paper in DATA_FILE, each with its own title, and return the number
+    of papers written.
+    """
+    with open(DATA_FILE, newline='') as data:
+        header, *rows = csv.reader(data)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(copies):
+            writer.writerows([authors, f'{title} #{i}', *rest]
+                             for authors, title, *rest in rows)
+    return copies * len(rows)
+
+
+def bench_papers(copies: int = 1000) -> None:
+    """Compare parsing a dataset of papers <copies> times the size of
+    DATA_FILE with reading it from the cache, and building the PaperTree at
+    once with building it from a PaperTreeStream.
+    """
+    folder = tempfile.mkdtemp()
+    old_cache_home = os.environ.get('XDG_CACHE_HOME')
+    try:
+        data_file = os.path.join(folder, 'papers.csv')
+        cache = os.path.join(folder, 'papers.cache')
+        count = make_synthetic_papers(data_file, copies)
+        print(f'== Paper ingest, {count} papers ==')
+        parse = _time_call(lambda: read_papers(data_file, use_cache=False),
+                           repeat=1)
+        print(f'{"parse":>20}: {parse * 1000:8.1f} ms')
+        read_papers(data_file, cache_path=cache)
+        cached = _time_call(lambda: read_papers(data_file, cache_path=cache))
+        print(f'{"cached":>20}: {cached * 1000:8.1f} ms '
+              f'({parse / cached:.1f}x)')
+
+        # Keep PaperTree's cache file out of the user's cache folder.
+        os.environ['XDG_CACHE_HOME'] = folder
+        build = _time_call(lambda: PaperTree('papers', [], all_papers=True,
+                                             data_file=data_file))
+        print(f'{"PaperTree, cached":>20}: {build * 1000:8.1f} ms')
+        for max_depth in [None, 2]:
+            stream = _time_call(
+                lambda: PaperTreeStream('papers', data_file,
+                                        max_depth=max_depth).finish(),
+                repeat=1)
+            label = 'stream' if max_depth is None else \
+                f'stream, depth {max_depth}'
+            print(f'{label:>20}: {stream * 1000:8.1f} ms')
+    finally:
+        if old_cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = old_cache_home
+        shutil.rmtree(folder)
+
+
+def bench_regrouping(copies: int = 100) -> None:
+    """Compare loading a dataset of papers <copies> times the size of
+    DATA_FILE into a PaperTable with regrouping it by each grouping in
+    GROUPINGS, the first time, when the grouping's dimensions are worked
+    out, and again, when they are reused.
+    """
+    folder = tempfile.mkdtemp()
+    try:
+        data_file = os.path.join(folder, 'papers.csv')
+        cache = os.path.join(folder, 'papers.cache')
+        count = make_synthetic_papers(data_file, copies)
+        print(f'== Paper regrouping, {count} papers ==')
+        start = time.perf_counter()
+        table = PaperTable('papers', read_papers(data_file, cache_path=cache))
+        load = time.perf_counter() - start
+        print(f'{"load":>20}: {load * 1000:8.1f} ms')
+        for grouping in GROUPINGS[1:] + GROUPINGS[:1]:
+            first = _time_call(lambda: table.regroup(grouping), repeat=1)
+            table.regroup(GROUPINGS[1] if grouping == GROUPINGS[0]
+                          else GROUPINGS[0])
+            again = _time_call(lambda: table.regroup(grouping), repeat=1)
+            print(f'{", ".join(grouping):>20}: {first * 1000:8.1f} ms, '
+                  f'again {again * 1000:8.3f} ms')
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    bench_scanners()
+    bench_snapshot()
+    bench_hit_testing()
+    bench_layouts()
+    bench_level_of_detail()
+    bench_rasterisers()
+    bench_transitions()
+    bench_memory()
+    bench_lazy()
+    bench_papers()
+    bench_regrouping()
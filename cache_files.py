@@ -0,0 +1,101 @@
+"""Assignment 2: Cache files
+
+=== Module Description ===
+This module contains what the binary cache files kept in the user's cache
+folder have in common: the scan snapshots of fs_scanner and the parsed papers
+of papers.
+
+Each cache file lives in the treemap folder of the user's cache folder, under
+a hash of the path it was made from. It starts with a magic string naming its
+format, and with that path, so that a file of another format, or made from
+another path, is never mistaken for it. It is always replaced in a single
+step, so a reader never sees a partly written file.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import struct
+from typing import Optional
+
+_PATH_LENGTH = struct.Struct('<I')
+
+
+def cache_file_path(path: str, extension: str) -> str:
+    """Return the cache file, ending in <extension>, for the file or folder at
+    <path>, in the treemap folder of $XDG_CACHE_HOME, or of ~/.cache if it is
+    not set.
+    """
+    cache = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    key = hashlib.sha1(os.fsencode(os.path.abspath(path))).hexdigest()
+    return os.path.join(cache, 'treemap', key + extension)
+
+
+def cache_header(magic: bytes, path: str) -> bytearray:
+    """Return the start of a cache file in the format <magic>, made from the
+    file or folder at <path>, for the rest of the file to be added to.
+    """
+    data = bytearray(magic)
+    encoded = os.fsencode(path)
+    data += _PATH_LENGTH.pack(len(encoded))
+    data += encoded
+    return data
+
+
+def read_cache_header(data: bytes, magic: bytes, path: str) -> Optional[int]:
+    """Return the offset just after the header of the cache file <data>, or
+    None if <data> is not in the format <magic>, or was not made from <path>.
+
+    Raise struct.error if <data> is too short to hold the header.
+    """
+    if not data.startswith(magic):
+        return None
+    offset = len(magic)
+    length, = _PATH_LENGTH.unpack_from(data, offset)
+    offset += _PATH_LENGTH.size
+    if data[offset:offset + length] != os.fsencode(path):
+        return None
+    return offset + length
+
+
+def read_cache_file(cache_path: str) -> Optional[bytes]:
+    """Return the contents of the cache file <cache_path>, or None if it
+    cannot be read.
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_cache_file(cache_path: str, data: bytes) -> None:
+    """Replace the cache file <cache_path> with <data>, in a single step,
+    making its folder first if needed.
+
+    The data is written to a temporary file beside it, which is then renamed
+    over it, or removed if it cannot be.
+    """
+    folder = os.path.dirname(cache_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = cache_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'hashlib', 'os', 'struct', '__future__'
+        ],
+        'allowed-io': ['read_cache_file', 'write_cache_file']
+    })
@@ -0,0 +1,539 @@
+"""Assignment 2: File system scanners
+
+=== Module Description ===
+This module contains the scanner engines used by FileSystemTree to read the
+structure of a file or folder from disk. A scanner does not create any TMTree
+nodes itself: it returns a tree of ScanEntry records, which FileSystemTree
+then turns into FileSystemTree nodes.
+
+ListdirScanner is the original walk, using os.listdir, os.path.isdir and
+os.path.getsize for every entry. ScandirScanner uses os.scandir, whose DirEntry
+objects cache the result of stat(), and spreads the directory reads across a
+bounded pool of threads.
+
+SnapshotScanner saves each scan in a compact binary snapshot file, and on the
+next scan of the same path re-reads only the folders that changed since.
+
+BackgroundScan runs a scanner on a background thread and hands over each
+folder as soon as it has been read, so that a tree can be built progressively.
+
+folder_sizes and read_folder support trees that read folders lazily: the
+first finds the total size of every folder in one pass, and the second reads
+a single folder when its contents are needed.
+"""
+from __future__ import annotations
+import os
+import stat
+import struct
+import sys
+import threading
+from queue import Queue
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cache_files import cache_file_path, cache_header, read_cache_file, \
+    read_cache_header, write_cache_file
+
+
+class ScanEntry:
+    """A file or folder read from disk by a scanner.
+
+    === Public Attributes ===
+    name:
+        The name of the file or folder, not its full path.
+    size:
+        The size of the file or folder, as reported by stat.
+    is_dir:
+        Whether or not this entry is a folder.
+    mtime:
+        The modification time of this entry in nanoseconds, or 0 if the
+        scanner did not record it.
+    inode:
+        The inode number of this entry, or 0 if the scanner did not record it.
+    children:
+        The entries contained in this folder, in the order they were listed.
+        This is empty for files.
+
+    === Representation Invariants ===
+    - size >= 0
+    - if not is_dir, then children is empty
+    """
+    __slots__ = ('name', 'size', 'is_dir', 'mtime', 'inode', 'children')
+
+    name: str
+    size: int
+    is_dir: bool
+    mtime: int
+    inode: int
+    children: List[ScanEntry]
+
+    def __init__(self, name: str, size: int, is_dir: bool,
+                 mtime: int = 0, inode: int = 0) -> None:
+        """Initialize a new ScanEntry with no children.
+        """
+        self.name = name
+        self.size = size
+        self.is_dir = is_dir
+        self.mtime = mtime
+        self.inode = inode
+        self.children = []
+
+
+def _entry_from_stat(name: str, st: os.stat_result) -> ScanEntry:
+    """Return a new ScanEntry called <name> described by the stat result <st>.
+    """
+    return ScanEntry(name, st.st_size, stat.S_ISDIR(st.st_mode),
+                     st.st_mtime_ns, st.st_ino)
+
+
+class Scanner:
+    """A scanner engine that reads a file or folder from disk.
+
+    This is an abstract class that should not be instantiated directly.
+    """
+
+    def scan(self, path: str) -> ScanEntry:
+        """Return the ScanEntry tree for the file or folder at <path>.
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        root = self.stat_entry(path)
+        if root.is_dir:
+            self.scan_folders(path, root, None)
+        return root
+
+    def stat_entry(self, path: str) -> ScanEntry:
+        """Return a ScanEntry, with no children, for the file or folder at
+        <path>.
+        """
+        return _entry_from_stat(os.path.basename(path), os.stat(path))
+
+    def scan_folders(self, path: str, entry: ScanEntry,
+                     report: Optional[Callable[[ScanEntry], None]]) -> None:
+        """Read the children of <entry>, the folder at <path>, and of every
+        folder below it.
+
+        If <report> is not None, call it with each folder's entry as soon as
+        that folder's children have been read, and before any of its
+        sub-folders are read. <report> may be called from another thread.
+        """
+        raise NotImplementedError
+
+
+class ListdirScanner(Scanner):
+    """The original scanner: a single-threaded, recursive walk that uses
+    os.listdir, os.path.isdir and os.path.getsize for every entry.
+
+    It does not record modification times or inode numbers.
+    """
+
+    def stat_entry(self, path: str) -> ScanEntry:
+        """Return a ScanEntry, with no children, for the file or folder at
+        <path>.
+        """
+        return ScanEntry(os.path.basename(path), os.path.getsize(path),
+                         os.path.isdir(path))
+
+    def scan_folders(self, path: str, entry: ScanEntry,
+                     report: Optional[Callable[[ScanEntry], None]]) -> None:
+        """Read the children of <entry>, the folder at <path>, and of every
+        folder below it, calling <report> with each folder's entry once its
+        children have been read.
+        """
+        paths = [os.path.join(path, x) for x in os.listdir(path)]
+        entry.children = [self.stat_entry(x) for x in paths]
+        if report is not None:
+            report(entry)
+        for sub_path, child in zip(paths, entry.children):
+            if child.is_dir:
+                self.scan_folders(sub_path, child, report)
+
+
+class ScandirScanner(Scanner):
+    """A scanner that reads folders with os.scandir, using the stat() result
+    cached on each DirEntry, and reads up to <max_workers> folders at a time.
+
+    === Public Attributes ===
+    max_workers:
+        The largest number of threads used to read folders. If this is 1, the
+        scan is done on the calling thread, without a pool.
+    """
+    max_workers: int
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        """Initialize a new ScandirScanner that uses at most <max_workers>
+        threads, or a default based on the number of CPUs if <max_workers> is
+        None.
+        """
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        self.max_workers = max(1, max_workers)
+
+    def scan_folders(self, path: str, entry: ScanEntry,
+                     report: Optional[Callable[[ScanEntry], None]]) -> None:
+        """Read the children of <entry>, the folder at <path>, and of every
+        folder below it, calling <report> with each folder's entry once its
+        children have been read.
+        """
+        if self.max_workers == 1:
+            stack = [(path, entry)]
+            while stack:
+                folder = stack.pop()
+                stack.extend(_read_dir(*folder))
+                if report is not None:
+                    report(folder[1])
+            return
+
+        # Folders waiting to be read are shared between the workers through
+        # <todo>; each worker queues the sub-folders it finds, and the scan is
+        # over once every queued folder has been marked done.
+        todo = Queue()
+        errors = []
+
+        def worker() -> None:
+            while True:
+                folder = todo.get()
+                if folder is None:
+                    return
+                try:
+                    if not errors:
+                        subs = _read_dir(*folder)
+                        if report is not None:
+                            report(folder[1])
+                        for sub in subs:
+                            todo.put(sub)
+                except Exception as error:  # Re-raised on the calling thread.
+                    errors.append(error)
+                finally:
+                    # Always mark the folder done, or todo.join() never
+                    # returns.
+                    todo.task_done()
+
+        todo.put((path, entry))
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(self.max_workers)]
+        for thread in threads:
+            thread.start()
+        todo.join()
+        for _ in threads:
+            todo.put(None)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+
+def _read_dir(path: str, entry: ScanEntry) -> List[Tuple[str, ScanEntry]]:
+    """Fill in the children of <entry>, the folder at <path>, and return the
+    (path, entry) pairs of the folders found in it, which still need reading.
+
+    A folder that cannot be read, e.g. for lack of permission, is left with
+    no children, and an entry that cannot be stat()ed is left out, so that
+    the rest of the scan goes on.
+    """
+    folders = []
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return folders
+    with it:
+        for dir_entry in it:
+            try:
+                st = dir_entry.stat()
+            except FileNotFoundError:
+                # A broken symbolic link: describe the link itself.
+                st = dir_entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            child = _entry_from_stat(dir_entry.name, st)
+            entry.children.append(child)
+            if child.is_dir:
+                folders.append((dir_entry.path, child))
+    return folders
+
+
+def read_folder(path: str) -> List[ScanEntry]:
+    """Return an entry, with no children, for each file and folder in the
+    folder at <path>, in the order they are listed.
+    """
+    folder = ScanEntry(os.path.basename(path), 0, True)
+    _read_dir(path, folder)
+    return folder.children
+
+
+def folder_sizes(path: str, scanner: Optional[Scanner] = None) \
+        -> Dict[str, int]:
+    """Return the total size of the folder at <path>, and of every folder
+    below it, keyed by the folder's path.
+
+    A folder's total size is the sum of the sizes of the files and total sizes
+    of the folders in it, or its own size if it is empty, as in a
+    FileSystemTree. Only the totals are kept, not the entries they were
+    summed from.
+
+    The folders are read by <scanner>, or by a default ScandirScanner if
+    <scanner> is None. A SnapshotScanner reads again only the folders that
+    changed since its last scan.
+    """
+    root = (scanner or ScandirScanner()).scan(path)
+    if not root.is_dir:
+        return {}
+    folders = []
+    stack = [(path, root)]
+    while stack:
+        folder_path, folder = stack.pop()
+        folders.append((folder_path, folder))
+        stack.extend((os.path.join(folder_path, child.name), child)
+                     for child in folder.children if child.is_dir)
+
+    # Every folder comes after its parent in <folders>, so in reverse the
+    # total of each sub-folder is known before it is needed.
+    sizes = {}
+    for folder_path, folder in reversed(folders):
+        if folder.children:
+            sizes[folder_path] = sum(
+                sizes[os.path.join(folder_path, child.name)] if child.is_dir
+                else child.size for child in folder.children)
+        else:
+            sizes[folder_path] = folder.size
+    return sizes
+
+
+# The snapshot file starts with the cache_header of SNAPSHOT_MAGIC and the
+# scanned path, and then holds one record per entry, in preorder. Every record starts with the
+# _FILE_RECORD fields; folders add the _FOLDER_RECORD fields after them, and
+# are followed by the records of their children. The record ends with the
+# entry's name.
+SNAPSHOT_MAGIC = b'TMSNAP1\n'
+_FILE_RECORD = struct.Struct('<HBQQ')  # name length, is_dir, size, inode
+_FOLDER_RECORD = struct.Struct('<qI')  # mtime, number of children
+
+
+def save_snapshot(snapshot_path: str, path: str, root: ScanEntry) -> None:
+    """Save the ScanEntry tree <root>, scanned from <path>, to the snapshot
+    file <snapshot_path>.
+
+    Raise OSError if the snapshot cannot be written; write_cache_file
+    replaces it in a single step, so an old snapshot is never left half
+    overwritten.
+    """
+    data = cache_header(SNAPSHOT_MAGIC, path)
+    stack = [root]
+    while stack:
+        entry = stack.pop()
+        name = os.fsencode(entry.name)
+        data += _FILE_RECORD.pack(len(name), entry.is_dir, entry.size,
+                                  entry.inode)
+        if entry.is_dir:
+            data += _FOLDER_RECORD.pack(entry.mtime, len(entry.children))
+            stack.extend(reversed(entry.children))
+        data += name
+    write_cache_file(snapshot_path, data)
+
+
+def load_snapshot(snapshot_path: str, path: str) -> Optional[ScanEntry]:
+    """Return the ScanEntry tree saved in the snapshot file <snapshot_path>,
+    or None if there is no such file, it is not a snapshot of <path>, or it
+    cannot be read.
+    """
+    data = read_cache_file(snapshot_path)
+    if data is None:
+        return None
+
+    try:
+        offset = read_cache_header(data, SNAPSHOT_MAGIC, path)
+        if offset is None:
+            return None
+
+        root = None
+        # The folders whose children are still being read, with the number
+        # of children left to read for each.
+        parents = []
+        encoding = sys.getfilesystemencoding()
+        errors = sys.getfilesystemencodeerrors()
+        unpack_file = _FILE_RECORD.unpack_from
+        unpack_folder = _FOLDER_RECORD.unpack_from
+        while root is None or parents:
+            name_length, is_dir, size, inode = unpack_file(data, offset)
+            offset += _FILE_RECORD.size
+            mtime = count = 0
+            if is_dir:
+                mtime, count = unpack_folder(data, offset)
+                offset += _FOLDER_RECORD.size
+            name = data[offset:offset + name_length].decode(encoding, errors)
+            offset += name_length
+
+            entry = ScanEntry(name, size, bool(is_dir), mtime, inode)
+            if root is None:
+                root = entry
+            else:
+                parent = parents[-1]
+                parent[0].children.append(entry)
+                parent[1] -= 1
+                if parent[1] == 0:
+                    parents.pop()
+            if count:
+                parents.append([entry, count])
+        return root
+    except (struct.error, UnicodeDecodeError):
+        return None
+
+
+def default_snapshot_path(path: str) -> str:
+    """Return the default snapshot file for scans of <path>, in the user's
+    cache folder.
+    """
+    return cache_file_path(path, '.snap')
+
+
+class SnapshotScanner(Scanner):
+    """A scanner that remembers each scan in a snapshot file, and on the next
+    scan of the same path re-reads only the folders that changed since.
+
+    A folder is re-read when its modification time or inode number differs
+    from the snapshot. Adding, removing or renaming an entry changes the
+    modification time of its folder, but writing to a file does not, so a
+    file whose size changed in an otherwise unchanged folder keeps its old
+    size until its folder changes.
+
+    === Public Attributes ===
+    snapshot_path:
+        The snapshot file read before, and written after, each scan.
+    scanner:
+        The scanner used for folders that are not in the snapshot.
+    """
+    snapshot_path: str
+    scanner: Scanner
+
+    def __init__(self, snapshot_path: str,
+                 scanner: Optional[Scanner] = None) -> None:
+        """Initialize a new SnapshotScanner that uses the snapshot file
+        <snapshot_path>, and <scanner>, or a default ScandirScanner if
+        <scanner> is None, to read new folders.
+        """
+        self.snapshot_path = snapshot_path
+        self.scanner = scanner or ScandirScanner()
+
+    def scan_folders(self, path: str, entry: ScanEntry,
+                     report: Optional[Callable[[ScanEntry], None]]) -> None:
+        """Read the children of <entry>, the folder at <path>, and of every
+        folder below it, reusing the snapshot for unchanged folders and
+        calling <report> with each folder's entry once its children have been
+        read. Then save the result as the new snapshot, if anything changed.
+        """
+        old = load_snapshot(self.snapshot_path, path)
+        changed = old is None
+        stack = [(path, entry, old)]
+        while stack:
+            folder_path, folder, old = stack.pop()
+            if old is None or not old.is_dir:
+                self.scanner.scan_folders(folder_path, folder, report)
+                changed = True
+                continue
+
+            if old.mtime == folder.mtime and old.inode == folder.inode:
+                # Same listing as before: keep the files, but the sub-folders
+                # may have changed inside.
+                for child in old.children:
+                    if child.is_dir:
+                        sub_path = os.path.join(folder_path, child.name)
+                        sub = self.stat_entry(sub_path)
+                        stack.append((sub_path, sub, child))
+                        child = sub
+                    folder.children.append(child)
+            else:
+                old_children = {child.name: child for child in old.children}
+                for sub_path, sub in _read_dir(folder_path, folder):
+                    stack.append((sub_path, sub, old_children.get(sub.name)))
+                changed = True
+
+            if report is not None:
+                report(folder)
+
+        if changed:
+            try:
+                save_snapshot(self.snapshot_path, path, entry)
+            except OSError:
+                pass  # The scan is still valid; it just won't be reused.
+
+
+class BackgroundScan:
+    """A scan that runs on a background thread, and whose folders can be
+    collected one by one as soon as they have been read.
+
+    === Public Attributes ===
+    root:
+        The entry for the scanned file or folder. Its children are filled in
+        by the background thread.
+    error:
+        The error that stopped the scan early, if any. The folders read
+        before it are still collected.
+
+    === Private Attributes ===
+    _ready:
+        The entries of the folders that have been read but not yet collected,
+        followed by None once the scan is over.
+    _done:
+        Whether or not the end of the scan has been collected.
+    """
+    root: ScanEntry
+    error: Optional[Exception]
+    _ready: Queue
+    _done: bool
+
+    def __init__(self, path: str, scanner: Scanner) -> None:
+        """Start scanning the file or folder at <path> with <scanner>.
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        self.root = scanner.stat_entry(path)
+        self._ready = Queue()
+        self._done = not self.root.is_dir
+        self.error = None
+        if not self._done:
+            threading.Thread(target=self._run, args=(path, scanner),
+                             daemon=True).start()
+
+    def _run(self, path: str, scanner: Scanner) -> None:
+        """Scan the folder at <path>, queueing each folder as it is read.
+        """
+        try:
+            scanner.scan_folders(path, self.root, self._ready.put)
+        except Exception as error:  # Kept for the collecting thread.
+            self.error = error
+        finally:
+            self._ready.put(None)
+
+    def collect(self, limit: int) -> List[ScanEntry]:
+        """Return the entries of up to <limit> folders that have been read
+        since the last call, without waiting for any more to be read.
+
+        The error that stopped the scan, if any, is not raised, so that it
+        cannot stop the thread collecting the folders; it is kept in error.
+        """
+        folders = []
+        while len(folders) < limit and not self._done:
+            if self._ready.empty():
+                break
+            entry = self._ready.get()
+            if entry is None:
+                self._done = True
+            else:
+                folders.append(entry)
+        return folders
+
+    def is_done(self) -> bool:
+        """Return True iff every folder read by this scan has been collected.
+        """
+        return self._done
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'os', 'stat', 'threading', 'queue',
+            'struct', 'sys', 'cache_files', '__future__'
+        ]
+    })
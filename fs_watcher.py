@@ -0,0 +1,597 @@
+"""Assignment 2: Live updates for FileSystemTree
+
+=== Module Description ===
+This module keeps a FileSystemTree up to date with the files and folders on
+disk after it has been built, so the visualiser does not have to be restarted
+to see changes.
+
+A change backend reports what changed on disk. InotifyBackend uses the Linux
+inotify API, and PollingBackend, used wherever inotify is not available,
+checks folder modification times and re-reads a few folders on each poll.
+FileSystemWatcher is the TreeSource that applies the reported changes to the
+tree, by adding, removing, moving or resizing single nodes and adjusting the
+data_size of their ancestors.
+"""
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fs_scanner import Scanner, ScandirScanner
+from tm_trees import FileSystemTree, TMTree, TreeSource
+
+# A change reported by a backend: the kind of change, the path it happened
+# to, and for 'move' the new path. The kinds are:
+#   'create': a file or folder appeared at path
+#   'delete': the file or folder at path disappeared
+#   'modify': the size of the file at path may have changed
+#   'move': the file or folder at path is now at the new path
+#   'folder': anything in the folder at path may have changed, so its
+#             contents should be read again
+Change = Tuple[str, str, Optional[str]]
+
+
+class ChangeBackend:
+    """Reports changes to the files and folders below a root folder.
+
+    This is an abstract class that should not be instantiated directly.
+    """
+
+    def watch_folder(self, path: str) -> None:
+        """Start reporting changes in the folder at <path>.
+        """
+        raise NotImplementedError
+
+    def read_changes(self) -> List[Change]:
+        """Return the changes seen since the last call, without waiting for
+        any new ones.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Stop reporting changes and release any resources held.
+        """
+
+
+# Constants from <sys/inotify.h>.
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    """Return the C library if it provides inotify, or None otherwise.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1  # pylint: disable=pointless-statement
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyBackend(ChangeBackend):
+    """A change backend that uses the Linux inotify API, with one watch for
+    each folder.
+
+    === Private Attributes ===
+    _libc:
+        The C library providing inotify.
+    _fd:
+        The inotify file descriptor.
+    _folders:
+        The path of the folder for each watch descriptor.
+    _moves:
+        The source path of each move whose destination has not been seen yet,
+        keyed by the inotify cookie shared by both halves of the move.
+    """
+    _libc: ctypes.CDLL
+    _fd: int
+    _folders: Dict[int, str]
+    _moves: Dict[int, str]
+
+    def __init__(self) -> None:
+        """Initialize a new InotifyBackend that does not watch any folders
+        yet.
+
+        Raise OSError if inotify is not available.
+        """
+        libc = _load_libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._libc = libc
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._folders = {}
+        self._moves = {}
+
+    def watch_folder(self, path: str) -> None:
+        """Start reporting changes in the folder at <path>.
+
+        Raise OSError if the watch cannot be added, e.g. because the limit on
+        the number of watches has been reached.
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                          _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return  # Already gone; its parent reports the deletion.
+            raise OSError(error, os.strerror(error), path)
+        self._folders[wd] = path
+
+    def read_changes(self) -> List[Change]:
+        """Return the changes seen since the last call, without waiting for
+        any new ones.
+        """
+        changes = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = \
+                    _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._add_change(changes, wd, mask, cookie, name)
+
+        # A move whose destination was not seen went out of the watched tree.
+        for source in self._moves.values():
+            changes.append(('delete', source, None))
+        self._moves.clear()
+        return changes
+
+    def _add_change(self, changes: List[Change], wd: int, mask: int,
+                    cookie: int, name: str) -> None:
+        """Append the change described by one inotify event to <changes>.
+        """
+        if mask & _IN_Q_OVERFLOW:
+            # Events were lost: read every watched folder again.
+            changes.extend(('folder', path, None)
+                           for path in self._folders.values())
+            return
+        if mask & _IN_IGNORED:
+            self._folders.pop(wd, None)
+            return
+        folder = self._folders.get(wd)
+        if folder is None or mask & _IN_DELETE_SELF:
+            return
+        path = os.path.join(folder, name)
+
+        if mask & _IN_MOVED_FROM:
+            self._moves[cookie] = path
+        elif mask & _IN_MOVED_TO:
+            source = self._moves.pop(cookie, None)
+            if source is None:
+                changes.append(('create', path, None))
+            else:
+                changes.append(('move', source, path))
+                self._rename_folders(source, path)
+        elif mask & _IN_CREATE:
+            changes.append(('create', path, None))
+        elif mask & _IN_DELETE:
+            changes.append(('delete', path, None))
+        elif mask & (_IN_MODIFY | _IN_ATTRIB):
+            changes.append(('modify', path, None))
+
+    def _rename_folders(self, source: str, destination: str) -> None:
+        """Update the paths of the watched folders at or below <source>, which
+        has been moved to <destination>.
+        """
+        prefix = source + os.sep
+        for wd, path in self._folders.items():
+            if path == source:
+                self._folders[wd] = destination
+            elif path.startswith(prefix):
+                self._folders[wd] = destination + path[len(source):]
+
+    def close(self) -> None:
+        """Stop reporting changes and close the inotify file descriptor.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingBackend(ChangeBackend):
+    """A change backend that polls the watched folders.
+
+    Every <interval> seconds, each watched folder whose modification time
+    changed is reported, so that its contents are read again. Writing to a
+    file does not change its folder's modification time, so a few more
+    folders, taken in turn, are also reported on every round; over enough
+    rounds every file's size is checked.
+
+    === Public Attributes ===
+    interval:
+        The least number of seconds between two rounds of polling.
+    sweep:
+        The number of folders reported in turn on every round, whether or not
+        their modification time changed.
+
+    === Private Attributes ===
+    _mtimes:
+        The last seen modification time of each watched folder.
+    _order:
+        The watched folders, in the order they are swept.
+    _cursor:
+        The position in _order where the next sweep starts.
+    _next_round:
+        The time, from time.monotonic(), when the next round may start.
+    """
+    interval: float
+    sweep: int
+    _mtimes: Dict[str, int]
+    _order: List[str]
+    _cursor: int
+    _next_round: float
+
+    def __init__(self, interval: float = 2.0, sweep: int = 16) -> None:
+        """Initialize a new PollingBackend that does not watch any folders
+        yet.
+        """
+        self.interval = interval
+        self.sweep = sweep
+        self._mtimes = {}
+        self._order = []
+        self._cursor = 0
+        self._next_round = 0.0
+
+    def watch_folder(self, path: str) -> None:
+        """Start reporting changes in the folder at <path>.
+        """
+        try:
+            self._mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        self._order.append(path)
+
+    def read_changes(self) -> List[Change]:
+        """Return the folders that need to be read again, if a new round of
+        polling is due.
+        """
+        now = time.monotonic()
+        if now < self._next_round:
+            return []
+        self._next_round = now + self.interval
+
+        changed = []
+        for path, mtime in list(self._mtimes.items()):
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                del self._mtimes[path]  # Gone; its parent reports it.
+                continue
+            if current != mtime:
+                self._mtimes[path] = current
+                changed.append(path)
+
+        self._order = [path for path in self._order if path in self._mtimes]
+        swept = set(changed)
+        for _ in range(min(self.sweep, len(self._order))):
+            self._cursor %= len(self._order)
+            path = self._order[self._cursor]
+            self._cursor += 1
+            if path not in swept:
+                swept.add(path)
+                changed.append(path)
+        return [('folder', path, None) for path in changed]
+
+
+def make_backend() -> ChangeBackend:
+    """Return an InotifyBackend if inotify is available, or a PollingBackend
+    otherwise.
+    """
+    try:
+        return InotifyBackend()
+    except OSError:
+        return PollingBackend()
+
+
+class FileSystemWatcher(TreeSource):
+    """A tree source that keeps a FileSystemTree up to date with the files and
+    folders on disk.
+
+    Each change is applied to the node it concerns: the data_size of its
+    ancestors is adjusted by the difference, and the rest of the tree is left
+    alone.
+
+    === Public Attributes ===
+    tree:
+        The tree being kept up to date.
+    path:
+        The path of the file or folder represented by tree.
+
+    === Private Attributes ===
+    _scanner:
+        The scanner used to read new folders.
+    _backend:
+        The backend reporting changes, or None until watching has started.
+    _after:
+        A source that must be done before watching starts, or None.
+    """
+    tree: FileSystemTree
+    path: str
+    _scanner: Scanner
+    _backend: Optional[ChangeBackend]
+    _after: Optional[TreeSource]
+
+    def __init__(self, tree: FileSystemTree, path: str,
+                 backend: Optional[ChangeBackend] = None,
+                 scanner: Optional[Scanner] = None,
+                 after: Optional[TreeSource] = None) -> None:
+        """Start keeping <tree>, built from the file or folder at <path>, up to
+        date, using changes reported by <backend>, or by make_backend() if
+        <backend> is None.
+
+        If <after> is not None, start watching only once <after> is done, e.g.
+        once a FileSystemTreeStream has finished building <tree>.
+        """
+        self.tree = tree
+        self.path = path
+        self._scanner = scanner or ScandirScanner()
+        self._backend = backend
+        self._after = after
+        if after is None:
+            self._start()
+
+    def _start(self) -> None:
+        """Start watching every folder below self.path.
+        """
+        if self._backend is None:
+            self._backend = make_backend()
+        try:
+            self._watch_path(self.path)
+        except OSError:
+            self._fall_back_to_polling()
+
+    def _fall_back_to_polling(self) -> None:
+        """Replace the backend, which failed to watch a folder, most likely
+        because it is out of inotify watches, with a PollingBackend watching
+        every folder below self.path.
+        """
+        self._backend.close()
+        self._backend = PollingBackend()
+        self._watch_path(self.path)
+
+    def _watch_path(self, path: str) -> None:
+        """Watch the folder at <path>, if it is one, and every folder below it.
+
+        The folders are found with os.scandir, which can tell folders from
+        files without a stat() call for each file.
+        """
+        if not os.path.isdir(path):
+            return
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            self._backend.watch_folder(folder)
+            try:
+                with os.scandir(folder) as it:
+                    stack.extend(entry.path for entry in it if entry.is_dir())
+            except OSError:
+                continue  # Gone already, or unreadable.
+
+    def poll(self, budget: float) -> bool:
+        """Apply the changes reported since the last call, and return True iff
+        the tree changed.
+        """
+        if self._backend is None:
+            if self._after is None or not self._after.is_done():
+                return False
+            self._start()
+
+        changed = False
+        for kind, path, new_path in self._backend.read_changes():
+            if kind == 'create':
+                changed = self._create(path) or changed
+            elif kind == 'delete':
+                changed = self._delete(path) is not None or changed
+            elif kind == 'modify':
+                changed = self._modify(path) or changed
+            elif kind == 'move':
+                changed = self._move(path, new_path) or changed
+            else:
+                changed = self._reread_folder(path) or changed
+        return changed
+
+    def close(self) -> None:
+        """Stop watching for changes.
+        """
+        if self._backend is not None:
+            self._backend.close()
+
+    def _find(self, path: str) -> Optional[TMTree]:
+        """Return the node for the file or folder at <path>, or None if it is
+        not in the tree.
+        """
+        relative = os.path.relpath(path, self.path)
+        if relative == os.curdir:
+            return self.tree
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return None
+        tree = self.tree
+        for name in relative.split(os.sep):
+            tree = _child_named(tree, name)
+            if tree is None:
+                return None
+        return tree
+
+    def _create(self, path: str) -> bool:
+        """Add the file or folder at <path> to the tree, and return True iff
+        the tree changed.
+        """
+        parent = self._find(os.path.dirname(path))
+        if parent is None or _is_unread(parent):
+            return False
+        if _child_named(parent, os.path.basename(path)) is not None:
+            return self._modify(path)
+        # Watch a new folder before reading it, so that nothing created in it
+        # in the meantime is missed.
+        try:
+            self._watch_path(path)
+        except OSError:
+            self._fall_back_to_polling()
+        try:
+            entry = self._scanner.scan(path)
+        except OSError:
+            return False  # Already gone again.
+        _attach(parent, FileSystemTree._from_entry(entry))
+        return True
+
+    def _delete(self, path: str) -> Optional[TMTree]:
+        """Remove the file or folder at <path> from the tree, and return its
+        node, or None if it was not in the tree.
+        """
+        tree = self._find(path)
+        if tree is None or tree is self.tree:
+            return None
+        parent = tree._parent_tree
+        parent._subtrees.remove(tree)
+        tree._parent_tree = None
+        if parent._subtrees:
+            parent._add_to_size(-tree.data_size)
+        else:
+            parent._add_to_size(
+                _folder_size(os.path.dirname(path)) - parent.data_size)
+        return tree
+
+    def _modify(self, path: str) -> bool:
+        """Update the size of the file, or empty folder, at <path>, and return
+        True iff it changed.
+        """
+        tree = self._find(path)
+        if tree is None or tree._subtrees or _is_unread(tree):
+            return False
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            return False
+        if size == tree.data_size:
+            return False
+        tree._add_to_size(size - tree.data_size)
+        return True
+
+    def _move(self, path: str, new_path: str) -> bool:
+        """Move the node for <path> to <new_path>, keeping its subtrees, and
+        return True iff the tree changed.
+        """
+        new_parent = self._find(os.path.dirname(new_path))
+        if new_parent is None or _is_unread(new_parent):
+            return self._delete(path) is not None
+        existing = _child_named(new_parent, os.path.basename(new_path))
+        if existing is not None:
+            self._delete(new_path)  # Replaced by the moved file.
+        tree = self._delete(path)
+        if tree is None:
+            return self._create(new_path)
+        tree._name = os.path.basename(new_path)
+        _attach(new_parent, tree)
+        return True
+
+    def _reread_folder(self, path: str) -> bool:
+        """Read the folder at <path> again and bring its children in the tree
+        up to date, and return True iff the tree changed.
+        """
+        tree = self._find(path)
+        if tree is None or _is_unread(tree):
+            return False
+        try:
+            with os.scandir(path) as it:
+                names = {entry.name: entry.is_dir() for entry in it}
+        except OSError:
+            return False
+
+        changed = False
+        for subtree in list(tree._subtrees):
+            if subtree._name not in names:
+                self._delete(os.path.join(path, subtree._name))
+                changed = True
+        for name, is_dir in names.items():
+            child_path = os.path.join(path, name)
+            if _child_named(tree, name) is None:
+                changed = self._create(child_path) or changed
+            elif not is_dir:
+                changed = self._modify(child_path) or changed
+        return changed
+
+
+def _child_named(tree: TMTree, name: str) -> Optional[TMTree]:
+    """Return the subtree of <tree> called <name>, or None if there is none.
+    """
+    for subtree in tree._subtrees:
+        if subtree._name == name:
+            return subtree
+    return None
+
+
+def _is_unread(tree: FileSystemTree) -> bool:
+    """Return True iff <tree> is a folder of a lazy tree whose contents have
+    not been read yet.
+
+    Changes inside such a folder are left alone: its data_size is corrected
+    when its contents are read.
+    """
+    return tree._unread is not None
+
+
+def _attach(parent: TMTree, tree: TMTree) -> None:
+    """Add <tree> as the last subtree of <parent>, and adjust the data_size of
+    <parent> and its ancestors.
+    """
+    if parent._subtrees:
+        delta = tree.data_size
+    else:
+        delta = tree.data_size - parent.data_size  # No longer an empty folder.
+    parent._subtrees.append(tree)
+    tree._parent_tree = parent
+    parent._add_to_size(delta)
+
+
+def _folder_size(path: str) -> int:
+    """Return the size of the empty folder at <path>, as reported by stat, or
+    0 if it no longer exists.
+    """
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'os', 'sys', 'time', 'errno', 'struct',
+            'ctypes', 'ctypes.util', '__future__', 'fs_scanner', 'tm_trees'
+        ]
+    })
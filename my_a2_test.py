@@ -278,3 +278,1110 @@ def test_build_tree_from_dict(sample_papers_dict):
     paper_tree_list = _build_tree_from_dict(sample_papers_dict)
     assert len(paper_tree_list) == 1
     assert len(paper_tree_list[0]._subtrees) == 2  # Two years: 2019 and 2020
+
+
+from fs_scanner import ListdirScanner, ScandirScanner
+
+
+def _make_sample_directory(root: str) -> None:
+    """Create a small directory tree with nested and empty folders in <root>.
+    """
+    os.makedirs(os.path.join(root, 'a', 'b'))
+    os.makedirs(os.path.join(root, 'empty'))
+    for name, size in [('one.txt', 3), (os.path.join('a', 'two.txt'), 5),
+                       (os.path.join('a', 'b', 'three.txt'), 7)]:
+        with open(os.path.join(root, name), 'w') as f:
+            f.write('x' * size)
+
+
+def _tree_shape(tree: TMTree) -> tuple:
+    """Return a nested tuple of the names and sizes in <tree>, with the
+    subtrees sorted by name.
+    """
+    return (tree._name, tree.data_size,
+            tuple(sorted(_tree_shape(t) for t in tree._subtrees)))
+
+
+def test_scanners_build_same_tree() -> None:
+    """Test that every scanner engine builds the same FileSystemTree."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _make_sample_directory(temp_dir)
+        expected = _tree_shape(FileSystemTree(temp_dir, ListdirScanner()))
+        for workers in [1, 4]:
+            tree = FileSystemTree(temp_dir, ScandirScanner(workers))
+            assert _tree_shape(tree) == expected
+        assert expected[1] == 15 + os.path.getsize(
+            os.path.join(temp_dir, 'empty'))
+
+
+from tm_trees import FileSystemTreeStream
+
+
+def test_stream_builds_same_tree() -> None:
+    """Test that a streamed FileSystemTree ends up the same as one built in
+    a single scan, and that sizes stay consistent while it grows."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _make_sample_directory(temp_dir)
+        stream = FileSystemTreeStream(temp_dir, ScandirScanner(2))
+        while not stream.is_done():
+            stream.poll(0.01)
+            assert stream.tree.data_size == sum(
+                t.data_size for t in stream.tree._subtrees) or \
+                not stream.tree._subtrees
+        assert _tree_shape(stream.tree) == \
+            _tree_shape(FileSystemTree(temp_dir))
+
+
+import fs_scanner
+from fs_scanner import SnapshotScanner, load_snapshot
+
+
+def test_snapshot_rescans_only_changed_folders(monkeypatch) -> None:
+    """Test that a snapshot rescan re-reads only the folders that changed,
+    and builds the same tree as a full scan."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = os.path.join(temp_dir, 'root')
+        _make_sample_directory(root)
+        snapshot = os.path.join(temp_dir, 'scan.snap')
+        scanner = SnapshotScanner(snapshot)
+        FileSystemTree(root, scanner)
+        assert load_snapshot(snapshot, root) is not None
+        assert load_snapshot(snapshot, temp_dir) is None
+
+        with open(os.path.join(root, 'a', 'b', 'four.txt'), 'w') as f:
+            f.write('x' * 11)
+        os.remove(os.path.join(root, 'one.txt'))
+
+        read = []
+        original = fs_scanner._read_dir
+        monkeypatch.setattr(fs_scanner, '_read_dir',
+                            lambda p, e: read.append(p) or original(p, e))
+        tree = FileSystemTree(root, scanner)
+        assert sorted(read) == sorted([root, os.path.join(root, 'a', 'b')])
+        monkeypatch.undo()
+        assert _tree_shape(tree) == _tree_shape(FileSystemTree(root))
+
+
+import time
+
+from fs_watcher import FileSystemWatcher, InotifyBackend, PollingBackend
+
+
+def _watch_until_current(watcher: FileSystemWatcher, root: str) -> bool:
+    """Poll <watcher> until its tree matches a fresh scan of <root>, for at
+    most a few seconds, and return True iff it did.
+    """
+    expected = _tree_shape(FileSystemTree(root))
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        watcher.poll(0.05)
+        if _tree_shape(watcher.tree) == expected:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_watcher_applies_changes() -> None:
+    """Test that the watcher keeps a FileSystemTree up to date through
+    creations, deletions, renames and size changes, with each backend."""
+    backends = [lambda: PollingBackend(interval=0, sweep=100)]
+    try:
+        InotifyBackend().close()
+        backends.append(InotifyBackend)
+    except OSError:
+        pass
+
+    for make_backend in backends:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_sample_directory(temp_dir)
+            tree = FileSystemTree(temp_dir)
+            watcher = FileSystemWatcher(tree, temp_dir, make_backend())
+            a_tree = [t for t in tree._subtrees if t._name == 'a'][0]
+
+            with open(os.path.join(temp_dir, 'one.txt'), 'a') as f:
+                f.write('more')
+            os.makedirs(os.path.join(temp_dir, 'new', 'deep'))
+            with open(os.path.join(temp_dir, 'new', 'deep', 'f.txt'), 'w') as f:
+                f.write('12345')
+            os.rename(os.path.join(temp_dir, 'a'),
+                      os.path.join(temp_dir, 'empty', 'moved'))
+            os.remove(os.path.join(temp_dir, 'empty', 'moved', 'two.txt'))
+            assert _watch_until_current(watcher, temp_dir)
+            assert tree.data_size == sum(t.data_size for t in tree._subtrees)
+            if isinstance(watcher._backend, InotifyBackend):
+                # The moved folder keeps its node instead of being rebuilt.
+                assert a_tree._name == 'moved'
+                assert a_tree._parent_tree._name == 'empty'
+            watcher.close()
+
+
+import random
+
+import tm_trees
+
+
+def _make_random_tree(rng: random.Random, depth: int, fanout: int) -> TMTree:
+    """Return a random TMTree of the given <depth>, whose internal nodes have
+    between 1 and <fanout> subtrees.
+    """
+    if depth == 0:
+        return TMTree('leaf', [], rng.randint(0, 100))
+    return TMTree('node', [_make_random_tree(rng, depth - 1, fanout)
+                           for _ in range(rng.randint(1, fanout))])
+
+
+def _leaves(tree: TMTree) -> List[TMTree]:
+    """Return every leaf in <tree>."""
+    if not tree._subtrees:
+        return [tree]
+    return [leaf for subtree in tree._subtrees for leaf in _leaves(subtree)]
+
+
+def test_incremental_sizes_match_full_recompute(monkeypatch) -> None:
+    """Test that change_size, move and delete_self keep every data_size equal
+    to a full recompute, with the validation mode checking each edit."""
+    monkeypatch.setattr(tm_trees, 'VALIDATE_SIZES', True)
+    rng = random.Random(148)
+    tree = _make_random_tree(rng, 4, 4)
+    for _ in range(200):
+        leaves = _leaves(tree)
+        leaf = rng.choice(leaves)
+        action = rng.randrange(3)
+        if action == 0:
+            leaf.change_size(rng.choice([0.01, -0.01, 0.5, -0.5]))
+        elif action == 1:
+            folders = [t for t in leaves if t._parent_tree is not None]
+            leaf.move(rng.choice(folders)._parent_tree)
+        elif leaf._parent_tree is not None and len(leaves) > 10:
+            assert leaf.delete_self()
+            assert leaf._parent_tree is None
+    assert tree._sizes_are_consistent()
+    total = tree.data_size
+    assert tree.update_data_sizes() == total
+
+
+def test_validation_detects_stale_sizes() -> None:
+    """Test that the validation check notices a data_size that is out of
+    date."""
+    leaf = TMTree('leaf', [], 5)
+    tree = TMTree('root', [leaf, TMTree('other', [], 3)])
+    assert tree._sizes_are_consistent()
+    leaf.data_size = 7
+    assert not tree._sizes_are_consistent()
+    assert not TMTree('root', []).delete_self()
+
+
+def _count_layouts(monkeypatch) -> List[TMTree]:
+    """Make TMTree record every tree whose subtrees are laid out, and return
+    the list the trees are recorded in."""
+    laid_out = []
+    original = TMTree._layout_children
+
+    def layout_children(self, rect, layout):
+        laid_out.append(self)
+        return original(self, rect, layout)
+
+    monkeypatch.setattr(TMTree, '_layout_children', layout_children)
+    return laid_out
+
+
+def test_change_size_lays_out_only_its_region(monkeypatch) -> None:
+    """Test that changing one leaf's size lays out only the trees whose size
+    or rectangle changed, and gives the same rectangles as a full layout."""
+    left_leaf = TMTree('l1', [], 1000)
+    left = TMTree('left', [left_leaf, TMTree('l2', [], 1000)])
+    right = TMTree('right', [TMTree('r1', [], 1000), TMTree('r2', [], 1000)])
+    tree = TMTree('root', [left, right])
+    tree.update_rectangles((0, 0, 200, 100))
+
+    laid_out = _count_layouts(monkeypatch)
+    left_leaf.change_size(0.001)
+    tree.update_rectangles((0, 0, 200, 100))
+    assert laid_out == [tree, left]
+
+    rects = [t.rect for t in [tree, left, right] + _leaves(tree)]
+    for t in [tree, left, right]:
+        t._layout_dirty = True
+    tree.update_rectangles((0, 0, 200, 100))
+    assert rects == [t.rect for t in [tree, left, right] + _leaves(tree)]
+
+
+def test_expand_lays_out_only_its_region(monkeypatch) -> None:
+    """Test that expanding one folder lays out only that folder."""
+    inner = TMTree('inner', [TMTree('i1', [], 10), TMTree('i2', [], 30)])
+    folder = TMTree('folder', [inner, TMTree('f1', [], 20)])
+    tree = TMTree('root', [folder, TMTree('other', [TMTree('o1', [], 5)])])
+    tree.update_rectangles((0, 0, 300, 100))
+    folder.collapse()
+    tree.update_rectangles((0, 0, 300, 100))
+
+    laid_out = _count_layouts(monkeypatch)
+    folder.expand()
+    assert laid_out == [folder]
+    tree.update_rectangles((0, 0, 300, 100))
+    assert laid_out == [folder]
+
+
+def _reference_tree_at_position(tree: TMTree, pos: Tuple[int, int]):
+    """Return the tree at <pos> by visiting every subtree, as
+    get_tree_at_position did before it used the hit index."""
+    x, y = pos
+    lx, ly, width, height = tree.rect
+    if not (lx <= x <= lx + width and ly <= y <= ly + height):
+        return None
+    if not tree._subtrees or not tree._expanded:
+        return tree
+    matches = [_reference_tree_at_position(t, pos) for t in tree._subtrees]
+    matches = [m for m in matches if m is not None]
+    if not matches:
+        return None
+    return min(matches, key=lambda m: (m.rect[0], m.rect[1]))
+
+
+def test_hit_index_matches_full_search() -> None:
+    """Test that get_tree_at_position finds the same tree as a search of
+    every subtree, including on shared edges and zero-width rectangles."""
+    rng = random.Random(7)
+    for _ in range(20):
+        tree = _make_random_tree(rng, 4, 5)
+        for leaf in _leaves(tree):
+            if rng.random() < 0.2:
+                leaf.change_size(-1.0)  # Some zero-sized leaves.
+        width, height = rng.randint(20, 60), rng.randint(20, 60)
+        tree.update_rectangles((0, 0, width, height))
+        if rng.random() < 0.5:
+            rng.choice(tree._subtrees).collapse()
+        for x in range(-1, width + 2):
+            for y in range(-1, height + 2):
+                assert tree.get_tree_at_position((x, y)) is \
+                    _reference_tree_at_position(tree, (x, y))
+
+
+def test_draw_list_cached_until_display_changes(monkeypatch) -> None:
+    """Test that the draw list is reused until the layout changes or a tree
+    is expanded or collapsed, and that collapsed trees are drawn as one
+    rectangle."""
+    inner = TMTree('inner', [TMTree('i1', [], 10), TMTree('i2', [], 30)])
+    leaf = TMTree('leaf', [], 20)
+    tree = TMTree('root', [inner, leaf])
+    tree.update_rectangles((0, 0, 120, 60))
+
+    draw_list = tree.get_draw_list()
+    assert len(draw_list) == 3
+    assert tree.get_rectangles() == [(t.rect, t._colour)
+                                     for t in _leaves(tree)]
+    tree.update_rectangles((0, 0, 120, 60))
+    assert tree.get_draw_list() is draw_list
+
+    inner.collapse()
+    assert tree.get_draw_list() is not draw_list
+    assert tree.get_draw_list().trees == [inner, leaf]
+    draw_list = tree.get_draw_list()
+
+    inner.expand()
+    assert tree.get_draw_list() is not draw_list
+    draw_list = tree.get_draw_list()
+
+    leaf.change_size(1.0)
+    tree.update_rectangles((0, 0, 120, 60))
+    assert tree.get_draw_list() is not draw_list
+    assert list(tree.get_draw_list().width) == [t.rect[2]
+                                                for t in _leaves(tree)]
+
+
+from treemap_layouts import LAYOUTS, aspect_ratios, slice_and_dice, squarified
+
+
+def _assert_tiles(rect: Tuple[int, int, int, int],
+                  rects: List[Tuple[int, int, int, int]]) -> None:
+    """Assert that <rects> fill <rect> exactly, without overlapping."""
+    x, y, width, height = rect
+    covered = [[0] * height for _ in range(width)]
+    for rx, ry, rw, rh in rects:
+        assert rw >= 0 and rh >= 0
+        for i in range(rx, rx + rw):
+            for j in range(ry, ry + rh):
+                covered[i - x][j - y] += 1
+    assert all(count == 1 for column in covered for count in column)
+
+
+def test_layout_engines_tile_their_rectangle() -> None:
+    """Test that every layout engine fills its rectangle exactly, and that
+    squarified rectangles are closer to square than slice-and-dice ones."""
+    rng = random.Random(9)
+    for _ in range(50):
+        sizes = [rng.choice([0, rng.randint(1, 1000)])
+                 for _ in range(rng.randint(1, 30))]
+        rect = (rng.randint(0, 5), rng.randint(0, 5),
+                rng.randint(1, 80), rng.randint(1, 80))
+        for engine in LAYOUTS.values():
+            rects = engine(rect, sizes)
+            assert len(rects) == len(sizes)
+            _assert_tiles(rect, rects)
+
+    sizes = [rng.randint(1, 1000) for _ in range(40)]
+    rect = (0, 0, 400, 300)
+    sliced = aspect_ratios(slice_and_dice(rect, sizes))
+    squares = aspect_ratios(squarified(rect, sizes))
+    assert sum(squares) / len(squares) < sum(sliced) / len(sliced) / 4
+
+
+def test_set_layout_is_inherited() -> None:
+    """Test that a layout engine set on a tree is used by every tree within
+    it, and that hit testing still finds the right tree."""
+    rng = random.Random(11)
+    tree = _make_random_tree(rng, 3, 6)
+    tree.update_rectangles((0, 0, 90, 70))
+    assert tree.get_layout() == 'slice_and_dice'
+
+    tree.set_layout('squarified')
+    child = tree._subtrees[0]
+    assert child.get_layout() == 'squarified'
+    assert [t.rect for t in tree._subtrees] == \
+        squarified(tree.rect, [t.data_size for t in tree._subtrees])
+    assert [t.rect for t in child._subtrees] == \
+        squarified(child.rect, [t.data_size for t in child._subtrees])
+    for x in range(-1, 92):
+        for y in range(-1, 72):
+            assert tree.get_tree_at_position((x, y)) is \
+                _reference_tree_at_position(tree, (x, y))
+
+    child.set_layout('slice_and_dice')
+    assert child._subtrees[0].get_layout() == 'slice_and_dice'
+    assert [t.rect for t in child._subtrees] == \
+        slice_and_dice(child.rect, [t.data_size for t in child._subtrees])
+    child.set_layout(None)
+    assert child.get_layout() == 'squarified'
+
+
+def test_lod_culls_small_regions() -> None:
+    """Test that level of detail draws every region below the threshold as a
+    single block, leaves out empty rectangles, and otherwise lays out the
+    same rectangles as a full layout."""
+    full = _make_random_tree(random.Random(13), 5, 8)
+    tree = _make_random_tree(random.Random(13), 5, 8)
+    rect = (0, 0, 60, 40)
+    full.update_rectangles(rect)
+    tree.set_lod_threshold(3)
+    tree.update_rectangles(rect)
+
+    draw_list = tree.get_draw_list()
+    assert 0 < len(draw_list) < len(full.get_draw_list())
+    assert all(w > 0 and h > 0 for w, h in zip(draw_list.width,
+                                                draw_list.height))
+    _assert_tiles(rect, list(zip(draw_list.x, draw_list.y,
+                                 draw_list.width, draw_list.height)))
+
+    full_nodes = {id(t): f for t, f in zip(_preorder(tree), _preorder(full))}
+    for drawn in draw_list.trees:
+        assert drawn.rect == full_nodes[id(drawn)].rect
+        if drawn._subtrees:
+            assert min(drawn.rect[2], drawn.rect[3]) < 3
+    drawn_ids = {id(t) for t in draw_list.trees}
+    for x in range(61):
+        for y in range(41):
+            hit = tree.get_tree_at_position((x, y))
+            assert id(hit) in drawn_ids or 0 in hit.rect[2:]
+            parent = hit.get_parent()
+            while parent is not None:
+                assert not parent._lod_culled
+                parent = parent.get_parent()
+
+    # Growing the display lays the culled regions out.
+    tree.update_rectangles((0, 0, 600, 400))
+    full.update_rectangles((0, 0, 600, 400))
+    for drawn in tree.get_draw_list().trees:
+        assert drawn.rect == full_nodes[id(drawn)].rect
+    tree.set_lod_threshold(0)
+    assert len(tree.get_draw_list()) == len(full.get_draw_list())
+
+
+def _preorder(tree: TMTree) -> List[TMTree]:
+    """Return every tree in <tree>, in preorder."""
+    return [tree] + [t for subtree in tree._subtrees
+                     for t in _preorder(subtree)]
+
+
+def test_rasterisers_draw_the_same_pixels() -> None:
+    """Test that every rasteriser draws a draw list with the same pixels,
+    including rectangles off the edge of the surface."""
+    pytest.importorskip('numpy')
+    import pygame
+    from rasterisers import RASTERISERS
+
+    tree = _make_random_tree(random.Random(17), 4, 6)
+    tree.update_rectangles((-5, 3, 90, 70))
+    tree._subtrees[0].collapse()
+    surfaces = []
+    for rasterise in RASTERISERS.values():
+        surface = pygame.Surface((80, 80))
+        surface.fill((1, 2, 3))
+        rasterise(surface, tree.get_draw_list())
+        surfaces.append(pygame.image.tobytes(surface, 'RGB'))
+    assert len(set(surfaces)) == 1
+
+
+def test_scaled_draw_list_fills_new_size() -> None:
+    """Test that stretching a draw list to a new display size keeps its
+    rectangles filling the display, in the same order and colours."""
+    tree = _make_random_tree(random.Random(19), 3, 5)
+    tree.update_rectangles((0, 0, 57, 31))
+    draw_list = tree.get_draw_list()
+    for new_size in [(57, 31), (80, 45), (20, 13)]:
+        scaled = draw_list.scaled((57, 31), new_size)
+        assert scaled.trees == draw_list.trees
+        assert scaled.red == draw_list.red
+        _assert_tiles((0, 0) + new_size,
+                      list(zip(scaled.x, scaled.y,
+                               scaled.width, scaled.height)))
+    assert draw_list.scaled((57, 31), (57, 31)).width == draw_list.width
+
+
+from tm_trees import LayoutWorker
+
+
+def _wait_for_worker(worker: LayoutWorker) -> None:
+    """Wait until <worker>'s job has finished and been collected."""
+    deadline = time.time() + 10
+    while not worker.collect():
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+def test_layout_worker_runs_jobs_in_background() -> None:
+    """Test that a LayoutWorker lays a tree out on another thread, reports
+    each finished job once, and re-raises the error that stopped a job."""
+    done = []
+    worker = LayoutWorker(lambda: done.append(True))
+    tree = _make_random_tree(random.Random(23), 4, 6)
+    tree.collapse_all()
+    assert not worker.is_busy() and not worker.collect()
+
+    worker.submit(lambda: (tree.expand_all(),
+                           tree.update_rectangles((0, 0, 300, 200))))
+    assert worker.is_busy()
+    _wait_for_worker(worker)
+    assert done == [True] and not worker.is_busy()
+    assert not worker.collect()
+    assert tree.get_tree_at_position((150, 100)) is \
+        _reference_tree_at_position(tree, (150, 100))
+
+    worker.submit(lambda: tree.set_layout('no such layout'))
+    with pytest.raises(KeyError):
+        _wait_for_worker(worker)
+    assert not worker.is_busy()
+
+
+def test_restore_layout_after_zooming_in() -> None:
+    """Test that a layout saved before laying a subtree out on its own is put
+    back exactly, and that forgetting it lays the subtree out again."""
+    tree = _make_random_tree(random.Random(29), 4, 5)
+    tree.set_lod_threshold(2)
+    tree.update_rectangles((0, 0, 120, 80))
+    before = [(t, t.rect) for t in _preorder(tree)]
+    draw_list = tree.get_draw_list()
+    subtree = max(tree._subtrees, key=lambda t: len(_preorder(t)))
+
+    saved = subtree.save_layout()
+    subtree.update_rectangles((0, 0, 120, 80))
+    assert subtree.get_draw_list() is not draw_list
+    subtree.restore_layout(saved)
+    assert [(t, t.rect) for t in _preorder(tree)] == before
+    assert tree.get_draw_list() is draw_list
+
+    subtree.update_rectangles((0, 0, 120, 80))
+    subtree.restore_layout(None)
+    tree.update_rectangles((0, 0, 120, 80))
+    assert [(t, t.rect) for t in _preorder(tree)] == before
+    assert tree.get_draw_list().trees == draw_list.trees
+
+
+from transitions import Transition
+
+
+def test_transition_starts_and_ends_on_its_draw_lists() -> None:
+    """Test that a transition's first and last frames draw the same pixels as
+    the draw lists it goes between, and that trees collapsed between them
+    shrink into the tree they are drawn as."""
+    import pygame
+    from rasterisers import draw_rects
+
+    def pixels(draw_list) -> bytes:
+        surface = pygame.Surface((100, 60))
+        draw_rects(surface, draw_list)
+        return pygame.image.tobytes(surface, 'RGB')
+
+    tree = _make_random_tree(random.Random(31), 3, 5)
+    tree.update_rectangles((0, 0, 100, 60))
+    start = tree.get_draw_list()
+    leaves = _leaves(tree)
+    leaves[0].change_size(0.5)
+    leaves[-1].delete_self()
+    tree.update_rectangles((0, 0, 100, 60))
+    end = tree.get_draw_list()
+    transition = Transition(start, end)
+    assert pixels(transition.frame(0.0)) == pixels(start)
+    assert pixels(transition.frame(1.0)) == pixels(end)
+    assert len(transition.frame(0.5)) == len(transition)
+
+    collapsed = max(tree._subtrees, key=lambda t: len(_leaves(t)))
+    inside = [t for t in end.trees if t in _leaves(collapsed)]
+    collapsed.collapse()
+    tree.update_rectangles((0, 0, 100, 60))
+    last = Transition(end, tree.get_draw_list()).frame(1.0)
+    rects = dict(zip(last.trees, zip(last.x, last.y, last.width,
+                                     last.height)))
+    assert rects[collapsed] == collapsed.rect
+    x, y, width, height = collapsed.rect
+    for t in inside:
+        left, top, w, h = rects[t]
+        assert x <= left and left + w <= x + width
+        assert y <= top and top + h <= y + height
+
+
+import subprocess
+import sys
+
+from treemap_export import _image_name, export_treemap
+
+
+def test_export_treemap_writes_png_and_svg(monkeypatch, tmp_path) -> None:
+    """Test that a folder and a CSV file of papers are exported to PNG and
+    SVG images of the requested size."""
+    import pygame
+
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+
+    with tempfile.TemporaryDirectory() as root:
+        _make_sample_directory(root)
+        folder = os.path.join(root, 'folder')
+        os.mkdir(folder)
+        _make_sample_directory(folder)
+        csv_path = os.path.join(os.path.dirname(__file__),
+                                'sample_papers.csv')
+        for source in (root, csv_path):
+            png = os.path.join(root, 'map.png')
+            svg = os.path.join(root, 'map.svg')
+            times = export_treemap(source, png, 120, 80, snapshot=False)
+            assert set(times) == {'load', 'layout', 'write'}
+            assert pygame.image.load(png).get_size() == (120, 80)
+            export_treemap(source, svg, 120, 80, 'squarified',
+                           snapshot=False)
+            with open(svg) as f:
+                text = f.read()
+            assert text.startswith('<svg') and text.endswith('</svg>\n')
+            assert text.count('<rect') > 2
+
+
+def test_image_names_are_unique_per_path() -> None:
+    """Test that roots whose paths differ only in separators and underscores
+    are exported to different image files."""
+    names = {_image_name(os.path.join(os.sep, *parts), 'png')
+             for parts in [('a_b',), ('a', 'b'), ('a', 'b_'), ('a_', 'b')]}
+    assert len(names) == 4
+    assert all(name.startswith('a_') and name.endswith('.png')
+               for name in names)
+
+
+def test_export_does_not_import_visualiser() -> None:
+    """Test that the headless exporter does not load the pygame window code
+    of treemap_visualiser."""
+    subprocess.run([sys.executable, '-c',
+                    'import sys, treemap_export; '
+                    'assert "treemap_visualiser" not in sys.modules'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+
+import json
+import threading
+
+from profiling import Profiler
+
+
+def test_profiler_counts_phases_and_dumps_json() -> None:
+    """Test that a Profiler counts runs of each phase from any thread, even
+    runs that raise, and writes its counters to a JSON file."""
+    profiler = Profiler()
+    threads = [threading.Thread(target=lambda: [
+        profiler.add('layout', 0.002) for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with pytest.raises(ValueError):
+        with profiler.phase('draw'):
+            raise ValueError
+    profiler.frame_drawn()
+
+    summary = profiler.summary()
+    assert list(summary) == ['layout', 'draw']
+    assert summary['layout']['count'] == 400
+    assert summary['layout']['total_ms'] == pytest.approx(800)
+    assert summary['layout']['mean_ms'] == pytest.approx(2)
+    assert summary['draw']['count'] == 1
+    assert profiler.fps() == 1
+    assert len(profiler.overlay_lines()) == 3
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'profile.json')
+        profiler.dump(path)
+        with open(path) as f:
+            dumped = json.load(f)
+    assert dumped['fps'] == 1
+    assert dumped['phases']['layout']['count'] == 400
+
+
+def test_trees_have_no_instance_dict() -> None:
+    """Test that every kind of tree keeps its attributes in __slots__, without
+    a per-instance __dict__."""
+    with tempfile.TemporaryDirectory() as root:
+        _make_sample_directory(root)
+        trees = [TMTree('leaf', [], 3), FileSystemTree(root),
+                 PaperTree('paper', [], 'Author', 'doi', 5)]
+    for tree in trees:
+        assert not hasattr(tree, '__dict__')
+        with pytest.raises(AttributeError):
+            tree.misspelt_attribute = 1
+
+
+def test_lazy_file_system_tree_reads_folders_when_expanded() -> None:
+    """Test that a lazy FileSystemTree has the sizes of an eager one, reads a
+    folder only when it is expanded, and ends up with the same tree."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _make_sample_directory(temp_dir)
+        eager = FileSystemTree(temp_dir)
+        lazy = FileSystemTree(temp_dir, lazy=True)
+        assert lazy.data_size == eager.data_size
+        assert sorted((t._name, t.data_size) for t in lazy._subtrees) == \
+            sorted((t._name, t.data_size) for t in eager._subtrees)
+
+        folder = [t for t in lazy._subtrees if t._name == 'a'][0]
+        assert folder._subtrees == []
+        assert folder.get_suffix().startswith(' (folder')
+        folder.expand()
+        assert sorted(t._name for t in folder._subtrees) == ['b', 'two.txt']
+        assert [t for t in folder._subtrees if t._name == 'b'][0]._subtrees \
+            == []
+
+        lazy = FileSystemTree(temp_dir, lazy=True)
+        lazy.expand_all()
+        assert _tree_shape(lazy) == _tree_shape(eager)
+
+
+from papers import read_papers
+
+
+def _paper_shape(tree: PaperTree) -> tuple:
+    """Return a nested tuple of the names, sizes, authors and dois in <tree>,
+    in the order of its subtrees.
+    """
+    return (tree._name, tree.data_size, tree._authors, tree._doi,
+            tuple(_paper_shape(t) for t in tree._subtrees))
+
+
+def test_paper_tree_matches_dict_builder_and_uses_cache(monkeypatch) -> None:
+    """Test that PaperTree builds the same tree as the dictionary builder,
+    and that the parsed papers are cached until the dataset file changes."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        monkeypatch.setenv('XDG_CACHE_HOME', temp_dir)
+        for by_year in [True, False]:
+            expected = PaperTree('CS1', _build_tree_from_dict(
+                _load_papers_to_dict(by_year)))
+            for _ in range(2):  # Parsed, then read from the cache.
+                tree = PaperTree('CS1', [], all_papers=True, by_year=by_year)
+                assert _paper_shape(tree) == _paper_shape(expected)
+
+        data_file = os.path.join(temp_dir, 'papers.csv')
+        cache = os.path.join(temp_dir, 'papers.cache')
+        with open('sample_papers.csv') as sample:
+            lines = sample.read()
+        with open(data_file, 'w') as f:
+            f.write(lines)
+        first = read_papers(data_file, cache_path=cache)
+        assert os.path.exists(cache)
+        cached = read_papers(data_file, cache_path=cache)
+        assert cached.titles == first.titles == ['Paper1', 'Paper2', 'Paper3']
+        assert list(cached.citations) == [10, 20, 30]
+        assert [cached.categories[i] for i in cached.category_index] == \
+            ['CategoryA:SubcategoryA', 'CategoryA:SubcategoryB',
+             'CategoryB:SubcategoryA']
+
+        with open(data_file, 'a') as f:
+            f.write('Author4,Paper4,2020,CategoryC,doi4,40\n')
+        changed = read_papers(data_file, cache_path=cache)
+        assert changed.titles[-1] == 'Paper4'
+        assert changed.years == ['2019', '2020']
+
+
+from papers import PaperTreeStream
+
+
+def test_paper_tree_stream_builds_tree_in_chunks(monkeypatch,
+                                                 tmp_path) -> None:
+    """Test that a PaperTreeStream read in small chunks builds the same tree
+    as PaperTree, and that a maximum depth keeps only the papers' totals
+    below it."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    for by_year in [True, False]:
+        expected = PaperTree('CS1', [], all_papers=True, by_year=by_year)
+        stream = PaperTreeStream('CS1', by_year=by_year, chunk_size=10)
+        assert stream.poll(0.0) is False and not stream.is_done()
+        assert _paper_shape(stream.finish()) == _paper_shape(expected)
+        assert stream.is_done()
+
+    tree = PaperTreeStream('CS1', max_depth=2).finish()
+    assert tree.data_size == expected.data_size
+    assert tree._sizes_are_consistent()
+    papers = 0
+    for year in tree._subtrees:
+        for category in year._subtrees:
+            assert category._subtrees == []
+            papers += category._papers
+    assert papers == len(_leaves(expected))
+    assert year._subtrees[0].get_suffix().startswith(' (category, ')
+
+
+from papers import GROUPINGS, load_paper_table
+
+
+def test_paper_table_regroups_without_reloading(monkeypatch,
+                                                tmp_path) -> None:
+    """Test that a PaperTable starts grouped like PaperTree, regroups its
+    papers by every grouping with the same total, and keeps each paper's
+    tree from one grouping to the next."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    table = load_paper_table('CS1', 'sample_papers.csv')
+    expected = PaperTree('CS1', [], all_papers=True,
+                         data_file='sample_papers.csv')
+    assert _paper_shape(table.tree) == _paper_shape(expected)
+    first = table.tree._subtrees
+    papers = {id(t) for t in _leaves(table.tree)}
+
+    table.regroup(('author',))
+    assert all(t._parent_tree is None for t in first)
+    assert [t._name for t in table.tree._subtrees] == \
+        ['Author1', 'Author2', 'Author3']
+    table.regroup(('citations', 'category'))
+    assert [(t._name, t.data_size) for t in table.tree._subtrees] == \
+        [('10-99 citations', 60)]
+    for grouping in GROUPINGS:
+        table.regroup(grouping)
+        assert table.tree.data_size == 60
+        assert table.tree._sizes_are_consistent()
+        assert sorted(t._name for t in _leaves(table.tree)) == \
+            ['Paper1', 'Paper2', 'Paper3']
+        assert all(t._parent_tree is table.tree
+                   for t in table.tree._subtrees)
+        assert {id(t) for t in _leaves(table.tree)} == papers
+    table.regroup(GROUPINGS[0])
+    assert _paper_shape(table.tree) == _paper_shape(expected)
+
+
+def test_scandir_scanner_passes_worker_errors_back(monkeypatch) -> None:
+    """Test that an error other than OSError in a scanner thread is raised
+    on the calling thread, instead of leaving the scan waiting forever."""
+    real_read_dir = fs_scanner._read_dir
+
+    def failing_read_dir(path: str, entry):
+        if os.path.basename(path) == 'a':
+            raise ValueError('bad folder')
+        return real_read_dir(path, entry)
+
+    monkeypatch.setattr(fs_scanner, '_read_dir', failing_read_dir)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _make_sample_directory(temp_dir)
+        with pytest.raises(ValueError):
+            ScandirScanner(4).scan(temp_dir)
+
+
+def test_stream_skips_unreadable_folders(monkeypatch) -> None:
+    """Test that a folder that cannot be read is left empty while the rest
+    of the tree is streamed, and that a watcher waiting for the stream
+    starts once it is done."""
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if isinstance(path, str) and os.path.basename(path) == 'a':
+            raise PermissionError(13, 'Permission denied', path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', scandir)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _make_sample_directory(temp_dir)
+        stream = FileSystemTreeStream(temp_dir, ScandirScanner(2))
+        watcher = FileSystemWatcher(stream.tree, temp_dir,
+                                    PollingBackend(interval=0), after=stream)
+        deadline = time.monotonic() + 5
+        while not stream.is_done() and time.monotonic() < deadline:
+            stream.poll(0.01)
+        assert stream.is_done()
+        folder = [t for t in stream.tree._subtrees if t._name == 'a'][0]
+        assert folder._subtrees == []
+        assert sorted(t._name for t in stream.tree._subtrees) == \
+            ['a', 'empty', 'one.txt']
+
+        watcher.poll(0.01)
+        assert watcher._backend is not None
+        watcher.close()
+
+
+from fs_scanner import default_snapshot_path
+from treemap_export import load_tree
+
+
+def test_load_tree_sees_files_rewritten_in_place(monkeypatch, tmp_path) -> None:
+    """Test that, by default, a file rewritten in place is loaded with its new
+    size, and no snapshot is written to the cache folder."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    root = tmp_path / 'root'
+    _make_sample_directory(str(root))
+    size = load_tree(str(root)).data_size
+
+    folder_mtime = os.stat(root).st_mtime_ns
+    with open(root / 'one.txt', 'w') as f:
+        f.write('x' * 100)
+    assert os.stat(root).st_mtime_ns == folder_mtime
+    assert load_tree(str(root)).data_size == size + 97
+    assert not os.path.exists(default_snapshot_path(str(root)))
+
+
+import treemap_visualiser
+from treemap_visualiser import Visualiser
+
+
+def _phase_count(visualiser: Visualiser, name: str) -> int:
+    """Return how many times <visualiser> has run the profiler phase <name>.
+    """
+    return visualiser.profiler.summary().get(name, {}).get('count', 0)
+
+
+def test_event_loop_handles_motion_burst_at_once(monkeypatch) -> None:
+    """Test, with pygame's dummy video driver, that a burst of queued mouse
+    motion events costs the event loop one hit test and one redraw."""
+    import pygame
+
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    pos = [(10, 10)]
+    monkeypatch.setattr(pygame.mouse, 'get_pos', lambda: pos[0])
+    visualiser = Visualiser()
+    visualiser.transitions = False
+    counts = []
+    wait = Visualiser._wait_for_events
+
+    def scripted_wait(timeout):
+        step = len(counts)
+        counts.append((_phase_count(visualiser, 'hit test'),
+                       _phase_count(visualiser, 'frame')))
+        if step == 0:
+            # Handle events until the first layout is done.
+            events = []
+            while not any(e.type == treemap_visualiser.LAYOUT_DONE
+                          for e in events):
+                events += wait(2000)
+            return events
+        if step == 1:
+            # Move below the treemap, once the next frame is due.
+            pos[0] = (10, visualiser.height - 5)
+            pygame.time.wait(1000 // treemap_visualiser.MAX_FPS + 5)
+            return [pygame.event.Event(pygame.MOUSEMOTION, pos=(10, y))
+                    for y in range(20, 70)]
+        return [pygame.event.Event(pygame.QUIT)]
+
+    visualiser._wait_for_events = scripted_wait
+    with tempfile.TemporaryDirectory() as root:
+        _make_sample_directory(root)
+        try:
+            visualiser.run_visualisation(FileSystemTree(root))
+        finally:
+            pygame.quit()
+    assert len(counts) == 3 and counts[1][1] >= 1
+    assert visualiser.hover_node is None
+    assert counts[2][0] - counts[1][0] == 1
+    assert counts[2][1] - counts[1][1] == 1
+
+
+def test_incremental_frames_match_full_repaint(monkeypatch) -> None:
+    """Test, with pygame's dummy video driver, that frames which redraw only
+    the outlines that changed leave the same pixels on the screen as drawing
+    the whole treemap again."""
+    import pygame
+
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    visualiser = Visualiser()
+    with tempfile.TemporaryDirectory() as root:
+        _make_sample_directory(root)
+        tree = FileSystemTree(root)
+    pygame.init()
+    try:
+        visualiser.screen = pygame.display.set_mode(
+            (visualiser.width, visualiser.height))
+        tree.expand_all()
+        tree.update_rectangles((0, 0, visualiser.width,
+                                visualiser.height - visualiser.font_height))
+        visualiser.tree = tree
+        leaves = []
+        stack = [tree]
+        while stack:
+            subtree = stack.pop()
+            stack.extend(subtree._subtrees)
+            if not subtree._subtrees and subtree.rect[2] and subtree.rect[3]:
+                leaves.append(subtree)
+        assert len(leaves) >= 3
+
+        visualiser.render_display()
+        draws = _phase_count(visualiser, 'draw')
+        for hover, selected in [(leaves[0], None), (leaves[1], leaves[0]),
+                                (leaves[2], leaves[0]), (None, leaves[2]),
+                                (None, None)]:
+            visualiser.hover_node = hover
+            visualiser.selected_node = selected
+            visualiser._display_text = None
+            visualiser.render_display()
+        assert _phase_count(visualiser, 'draw') == draws
+        incremental = pygame.image.tobytes(visualiser.screen, 'RGB')
+
+        visualiser._treemap_cache = None
+        visualiser.render_display()
+        assert _phase_count(visualiser, 'draw') == draws + 1
+        assert pygame.image.tobytes(visualiser.screen, 'RGB') == incremental
+    finally:
+        pygame.quit()
+
+
+def test_expand_all_descends_into_expanded_trees() -> None:
+    """Test that expand_all on an expanded tree still expands the collapsed
+    trees within it, and lays them out."""
+    leaves = [TMTree('leaf1', [], 10), TMTree('leaf2', [], 20)]
+    subtree = TMTree('subtree', leaves)
+    tree = TMTree('root', [subtree, TMTree('leaf3', [], 30)])
+    tree.update_rectangles((0, 0, 100, 60))
+    tree.collapse_all()
+    tree.expand()
+    assert tree._expanded and not subtree._expanded
+
+    tree.expand_all()
+    assert subtree._expanded
+    assert all(leaf.rect[2] * leaf.rect[3] > 0 for leaf in leaves)
+    x, y, width, height = leaves[1].rect
+    assert tree.get_tree_at_position((x + width // 2, y + height // 2)) \
+        is leaves[1]
+
+
+def _parents_are_consistent(tree: TMTree) -> bool:
+    """Return True iff every tree in <tree> is the parent of its subtrees."""
+    return all(subtree._parent_tree is tree
+               and _parents_are_consistent(subtree)
+               for subtree in tree._subtrees)
+
+
+def test_paper_table_keeps_edits_when_regrouped(monkeypatch,
+                                                tmp_path) -> None:
+    """Test that papers deleted or resized in one grouping of a PaperTable
+    stay deleted or resized in the others, with the right totals."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    table = load_paper_table('CS1', 'sample_papers.csv')
+    leaves = {t._name: t for t in _leaves(table.tree)}
+    leaves['Paper1'].delete_self()
+    leaves['Paper3'].change_size(0.5)
+    assert table.tree.data_size == 65
+
+    for grouping in GROUPINGS[1:] + GROUPINGS[:1]:
+        table.regroup(grouping)
+        assert table.tree.data_size == 65
+        assert table.tree._sizes_are_consistent()
+        assert _parents_are_consistent(table.tree)
+        assert sorted((t._name, t.data_size) for t in _leaves(table.tree)) \
+            == [('Paper2', 20), ('Paper3', 45)]
+
+    table.regroup(('author',))
+    author2 = [t for t in table.tree._subtrees if t._name == 'Author2'][0]
+    author2.delete_self()
+    table.regroup(('category',))
+    assert [t._name for t in _leaves(table.tree)] == ['Paper3']
+    assert [(t._name, t.data_size) for t in table.tree._subtrees] == \
+        [('CategoryB', 45)]
+    assert _parents_are_consistent(table.tree)
+
+
+def test_closing_while_worker_is_busy_lets_next_visualisation_start(
+        monkeypatch) -> None:
+    """Test, with pygame's dummy video driver, that closing the window while
+    a layout job is still running waits for the job, so that another
+    visualisation can start straight after."""
+    import pygame
+
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    visualiser = Visualiser()
+    with tempfile.TemporaryDirectory() as root:
+        _make_sample_directory(root)
+        tree = FileSystemTree(root)
+    pygame.init()
+    try:
+        visualiser.screen = pygame.display.set_mode(
+            (visualiser.width, visualiser.height))
+        visualiser.tree = tree
+        visualiser._start_job(lambda: time.sleep(0.5))
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+        visualiser.event_loop()
+        assert not visualiser._worker.is_busy()
+
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+        visualiser.run_visualisation(TMTree('root', [TMTree('leaf', [], 3)]))
+        assert not visualiser._worker.is_busy()
+    finally:
+        pygame.quit()
+
+
+import errno
+
+
+class _FullBackend(PollingBackend):
+    """A PollingBackend that, like inotify out of watches, cannot watch any
+    folder called 'new'."""
+
+    def watch_folder(self, path: str) -> None:
+        if os.path.basename(path) == 'new':
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), path)
+        super().watch_folder(path)
+
+
+def test_watcher_polls_when_new_folder_cannot_be_watched() -> None:
+    """Test that a watcher whose backend cannot watch a folder created after
+    it started falls back to polling, instead of raising from poll()."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _make_sample_directory(temp_dir)
+        backend = _FullBackend(interval=0)
+        watcher = FileSystemWatcher(FileSystemTree(temp_dir), temp_dir,
+                                    backend)
+        os.makedirs(os.path.join(temp_dir, 'new', 'inner'))
+        with open(os.path.join(temp_dir, 'new', 'inner', 'five.txt'),
+                  'w') as f:
+            f.write('x' * 5)
+        assert _watch_until_current(watcher, temp_dir)
+        assert type(watcher._backend) is PollingBackend
+        watcher.close()
+
+
+from cache_files import read_cache_file, write_cache_file
+from papers import default_cache_path
+
+
+def test_caches_share_folder_and_atomic_writes(monkeypatch, tmp_path) -> None:
+    """Test that snapshots and paper caches go to the same cache folder, and
+    that a cache file that cannot be replaced leaves no temporary file."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    folder = str(tmp_path / 'treemap')
+    assert os.path.dirname(default_snapshot_path('papers.csv')) == folder
+    assert os.path.dirname(default_cache_path('papers.csv')) == folder
+    assert default_snapshot_path('papers.csv') != \
+        default_cache_path('papers.csv')
+
+    path = os.path.join(folder, 'data.cache')
+    write_cache_file(path, b'data')
+    assert read_cache_file(path) == b'data'
+    assert os.listdir(folder) == ['data.cache']
+
+    os.mkdir(os.path.join(folder, 'taken'))
+    with pytest.raises(OSError):
+        write_cache_file(os.path.join(folder, 'taken'), b'data')
+    assert sorted(os.listdir(folder)) == ['data.cache', 'taken']
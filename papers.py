@@ -60,12 +60,28 @@ Recommended steps:
    on your code.
 """
 import csv
-from typing import List, Dict
-from tm_trees import TMTree
+from contextlib import contextmanager
+import gc
+import os
+import struct
+import time
+from array import array
+from itertools import accumulate, islice
+from typing import Iterator, List, Dict, Optional, Sequence, TextIO, \
+    Tuple
+from cache_files import cache_file_path, cache_header, read_cache_file, \
+    read_cache_header, write_cache_file
+from tm_trees import TMTree, TreeSource
 
 # Filename for the dataset
 DATA_FILE = 'cs1_papers.csv'
 
+# The number of lines of a dataset file a PaperTreeStream reads at a time.
+CHUNK_SIZE = 2048
+
+# The number of columns in a dataset file.
+_COLUMNS = 6
+
 
 class PaperTree(TMTree):
     """A tree representation of Computer Science Education research paper data.
@@ -93,22 +109,31 @@ class PaperTree(TMTree):
         as a subtree, or None if this tree is not part of a larger tree.
     _expanded:
         Whether or not this tree is considered expanded for visualization.
+    _papers:
+        The number of papers whose citations were added to this tree's
+        data_size without a tree of their own, because they were below the
+        depth kept by a PaperTreeStream; 0 for every other tree.
 
     === Representation Invariants ===
     - All TMTree RIs are inherited.
+    - If _papers > 0, then _subtrees is empty.
     """
     _authors: str
     _doi: str
+    _papers: int
+    __slots__ = ('_authors', '_doi', '_papers')
 
     def __init__(self, name: str, subtrees: List[TMTree], authors: str = '',
                  doi: str = '', citations: int = 0, by_year: bool = True,
-                 all_papers: bool = False) -> None:
+                 all_papers: bool = False,
+                 data_file: Optional[str] = None) -> None:
         """Initialize a new PaperTree with the given <name> and <subtrees>,
         <authors> and <doi>, and with <citations> as the size of the data.
 
         If <all_papers> is True, then this tree is to be the root of the paper
-        tree. In that case, load data about papers from DATA_FILE to build the
-        tree.
+        tree. In that case, load data about papers from <data_file>, or from
+        DATA_FILE if <data_file> is None, to build the tree. The file is read
+        by read_papers, which keeps it parsed in a cache file.
 
         If <all_papers> is False, Do NOT load new data.
 
@@ -117,14 +142,14 @@ class PaperTree(TMTree):
         <by_year> is False, then the year in the dataset is simply ignored.
         """
         if all_papers:
-            temp_dict = _load_papers_to_dict(by_year)
-            temp_subtrees = _build_tree_from_dict(temp_dict)
+            temp_subtrees = _load_paper_trees(data_file or DATA_FILE, by_year)
         else:
             temp_subtrees = subtrees
 
         super().__init__(name, temp_subtrees, citations)
         self._authors = authors
         self._doi = doi
+        self._papers = 0
 
     def get_separator(self) -> str:
         """Return the file separator for this Tree.
@@ -134,21 +159,675 @@ class PaperTree(TMTree):
     def get_suffix(self) -> str:
         """Return the final descriptor of this tree.
         """
-        if len(self._subtrees) == 0:
+        if self._papers:
+            return f' (category, {self._papers} papers)'
+        elif len(self._subtrees) == 0:
             return ' (file)'
         else:
             return ' (category)'
 
 
-def _load_papers_to_dict(by_year: bool = True) -> Dict:
-    """Return a nested dictionary of the data read from the papers dataset file.
+class PaperTreeStream(TreeSource):
+    """A PaperTree that is built progressively from a dataset file, read a
+    chunk of lines at a time, so that the whole file is never in memory.
+
+    The tree starts out as just the root. Each call to poll() reads the next
+    chunks of the file and merges their papers into the tree: the category
+    trees they are in are added if they are new, and the data_size of their
+    ancestors is updated.
+
+    If a maximum depth is given, trees are only kept down to that depth,
+    where the root is at depth 0. A category tree at the maximum depth keeps
+    only the total citations and number of the papers below it, so the
+    memory used grows with the number of categories, not of papers.
+
+    === Public Attributes ===
+    tree:
+        The tree being built.
+
+    === Private Attributes ===
+    _file:
+        The dataset file being read, or None once it has all been read.
+    _rows:
+        The rows of the dataset file that have not been read yet.
+    _by_year:
+        Whether or not the first level of subtrees are the years.
+    _max_depth:
+        The depth of the deepest trees kept, or None to keep every paper.
+    _chunk_size:
+        The number of lines read at a time.
+    _categories:
+        The category trees, keyed by the id of the tree they are in and their
+        name.
+    _innermost:
+        The deepest tree kept for the papers of each year, if _by_year, and
+        categories, as written in the file, and whether the papers are below
+        the maximum depth, so that only their citations are kept.
+    _paper_trees:
+        The trees of the papers, keyed the same way as _categories.
+
+    === Representation Invariants ===
+    - _max_depth is None or _max_depth >= 1
+    """
+    tree: PaperTree
+    _file: Optional[TextIO]
+    _rows: Iterator[List[str]]
+    _by_year: bool
+    _max_depth: Optional[int]
+    _chunk_size: int
+    _categories: Dict[Tuple[int, str], PaperTree]
+    _innermost: Dict[Tuple[str, str], Tuple[PaperTree, bool]]
+    _paper_trees: Dict[Tuple[int, str], PaperTree]
+
+    def __init__(self, name: str, data_file: Optional[str] = None,
+                 by_year: bool = True, max_depth: Optional[int] = None,
+                 chunk_size: int = CHUNK_SIZE) -> None:
+        """Start building a tree called <name> of the papers in <data_file>,
+        or in DATA_FILE if <data_file> is None, <chunk_size> lines at a time.
+
+        <by_year> is as for PaperTree. If <max_depth> is not None, keep trees
+        only down to that depth.
+
+        Precondition: <max_depth> is None or <max_depth> >= 1
+        """
+        self.tree = PaperTree(name, [])
+        self._file = open(data_file or DATA_FILE, 'r', newline='')
+        self._rows = csv.reader(self._file)
+        next(self._rows, None)  # Skip the header line
+        self._by_year = by_year
+        self._max_depth = max_depth
+        self._chunk_size = chunk_size
+        self._categories = {}
+        self._innermost = {}
+        self._paper_trees = {}
+
+    def poll(self, budget: float) -> bool:
+        """Merge the papers of the next chunks of the file into the tree,
+        spending roughly at most <budget> seconds, and return True iff the
+        tree changed.
+
+        Raise ValueError if a line does not have one field for each column,
+        or its citations are not a whole number.
+        """
+        deadline = time.perf_counter() + budget
+        changed = False
+        while self._file is not None and time.perf_counter() < deadline:
+            rows = list(islice(self._rows, self._chunk_size))
+            if not rows:
+                self.close()
+                break
+            self._add_rows(rows)
+            changed = True
+        return changed
+
+    def finish(self) -> PaperTree:
+        """Merge every paper left in the file into the tree, and return the
+        tree.
+        """
+        with _paused_gc():
+            while self.poll(1.0):
+                pass
+        return self.tree
+
+    def _add_rows(self, rows: List[List[str]]) -> None:
+        """Merge the papers in <rows>, the fields of lines of the file, into
+        the tree.
+
+        The data_size of each tree that changed, and of its ancestors, is
+        updated once for the whole chunk.
+        """
+        sizes: Dict[PaperTree, int] = {}
+        for row in rows:
+            if not row:
+                continue  # A blank line.
+            if len(row) != _COLUMNS:
+                raise ValueError(f'every paper must have {_COLUMNS} fields')
+            authors, title, year, categories, doi, citations = row
+            key = (year if self._by_year else '', categories)
+            innermost = self._innermost.get(key)
+            if innermost is None:
+                innermost = self._innermost[key] = self._category_tree(key)
+            parent, below_max_depth = innermost
+            citations = int(citations)
+
+            if below_max_depth:
+                parent._papers += 1
+            else:
+                paper = PaperTree(title, [], authors, doi, citations)
+                paper._parent_tree = parent
+                old = self._paper_trees.get((id(parent), title))
+                if old is None:
+                    parent._subtrees.append(paper)
+                else:  # A later paper with the same title replaces it.
+                    parent._subtrees[parent._subtrees.index(old)] = paper
+                    citations -= old.data_size
+                self._paper_trees[(id(parent), title)] = paper
+                parent._layout_dirty = True
+            sizes[parent] = sizes.get(parent, 0) + citations
+
+        for tree, size in sizes.items():
+            tree._add_to_size(size)
+
+    def _category_tree(self, key: Tuple[str, str]) -> Tuple[PaperTree, bool]:
+        """Return the deepest tree kept for the papers of the year and
+        categories <key>, and whether the papers are below the maximum depth,
+        adding the category trees down to it that are not in the tree yet.
+        """
+        year, categories = key
+        path = categories.split(':')
+        if self._by_year:
+            path.insert(0, year)
+        # The papers are one level below their innermost category.
+        below_max_depth = self._max_depth is not None and \
+            len(path) + 1 > self._max_depth
+        if below_max_depth:
+            path = path[:self._max_depth]
+
+        parent = self.tree
+        for name in path:
+            tree = self._categories.get((id(parent), name))
+            if tree is None:
+                tree = PaperTree(name, [])
+                tree._parent_tree = parent
+                parent._subtrees.append(tree)
+                parent._layout_dirty = True
+                self._categories[(id(parent), name)] = tree
+            parent = tree
+        return parent, below_max_depth
+
+    def is_done(self) -> bool:
+        """Return True iff every paper in the file has been merged into the
+        tree.
+        """
+        return self._file is None
+
+    def close(self) -> None:
+        """Stop reading the file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class PaperColumns:
+    """The papers of a dataset file, stored by column rather than by paper.
+
+    The year and categories of a paper are each stored as an index into a
+    list of the distinct values of that column, as there are far fewer of
+    them than there are papers.
+
+    === Public Attributes ===
+    authors:
+        The authors of each paper.
+    titles:
+        The title of each paper.
+    dois:
+        The url of each paper.
+    citations:
+        The number of citations of each paper.
+    years:
+        The distinct years of the papers, in the order they first appear.
+    year_index:
+        The index in years of the year of each paper.
+    categories:
+        The distinct categories of the papers, each as it appears in the
+        dataset, with the levels separated by colons, in the order they first
+        appear.
+    category_index:
+        The index in categories of the categories of each paper.
+
+    === Representation Invariants ===
+    - authors, titles, dois, citations, year_index and category_index all
+      have the same length, the number of papers.
+    """
+    authors: List[str]
+    titles: List[str]
+    dois: List[str]
+    citations: array
+    years: List[str]
+    year_index: array
+    categories: List[str]
+    category_index: array
+
+    def __init__(self) -> None:
+        """Initialize a new PaperColumns with no papers.
+        """
+        self.authors, self.titles, self.dois = [], [], []
+        self.citations = array('q')
+        self.years, self.year_index = [], array('I')
+        self.categories, self.category_index = [], array('I')
+
+    def __len__(self) -> int:
+        """Return the number of papers.
+        """
+        return len(self.titles)
+
+    def add_rows(self, rows: List[List[str]]) -> None:
+        """Add a paper for each of <rows>, the fields of a line of a dataset
+        file.
+
+        Raise ValueError if a row does not have one field for each column, or
+        its citations are not a whole number.
+        """
+        rows = list(filter(None, rows))  # Skip blank lines.
+        if not rows:
+            return
+        if set(map(len, rows)) != {_COLUMNS}:
+            raise ValueError(f'every paper must have {_COLUMNS} fields')
+        authors, titles, years, categories, dois, citations = zip(*rows)
+        self.authors.extend(authors)
+        self.titles.extend(titles)
+        self.dois.extend(dois)
+        self.citations.extend(map(int, citations))
+        self.year_index.extend(_index_values(years, self.years))
+        self.category_index.extend(_index_values(categories,
+                                                 self.categories))
+
+
+def _index_values(values: Tuple[str, ...], distinct: List[str]) -> array:
+    """Return the index of each of <values> in <distinct>, adding the values
+    that are not in <distinct> yet to its end.
+    """
+    index = {value: i for i, value in enumerate(distinct)}
+    for value in dict.fromkeys(values):
+        if value not in index:
+            index[value] = len(distinct)
+            distinct.append(value)
+    return array('I', map(index.__getitem__, values))
+
+
+def read_papers(data_file: str, use_cache: bool = True,
+                cache_path: Optional[str] = None) -> PaperColumns:
+    """Return the papers in the dataset file <data_file>.
+
+    If <use_cache>, keep the papers in the cache file <cache_path>, or in the
+    user's cache folder if <cache_path> is None, and read them from it
+    instead of parsing <data_file> again while the modification time and
+    size of <data_file> are unchanged.
+    """
+    cache_path = cache_path or default_cache_path(data_file)
+    status = os.stat(data_file)
+    if use_cache:
+        columns = load_paper_cache(cache_path, data_file, status)
+        if columns is not None:
+            return columns
+
+    columns = PaperColumns()
+    with open(data_file, 'r', newline='') as data:
+        rows = csv.reader(data)
+        next(rows, None)  # Skip the header line
+        # Add the rows a chunk at a time, so that only one chunk of them is
+        # in memory as well as the columns.
+        chunk = list(islice(rows, CHUNK_SIZE))
+        while chunk:
+            columns.add_rows(chunk)
+            chunk = list(islice(rows, CHUNK_SIZE))
+
+    if use_cache:
+        try:
+            save_paper_cache(cache_path, data_file, status, columns)
+        except (OSError, UnicodeEncodeError):
+            pass  # The papers are still valid; they just won't be reused.
+    return columns
+
+
+# The cache file starts with the cache_header of PAPER_CACHE_MAGIC and the
+# absolute path of the dataset file, and the _CACHE_HEADER fields. Then come the string columns, authors, titles,
+# dois, years and categories, each as the _STRINGS fields, the offset of the
+# end of every string in the column, and the UTF-8 text of the whole column.
+# The year and category indexes and the citations follow. The arrays are in
+# the machine's byte order, as the cache is never shared between machines.
+PAPER_CACHE_MAGIC = b'TMPAPERS1\n'
+_CACHE_HEADER = struct.Struct('<qQI')  # mtime, size, number of papers
+_STRINGS = struct.Struct('<II')  # number of strings, length of the text
+
+
+def save_paper_cache(cache_path: str, data_file: str,
+                     status: os.stat_result, columns: PaperColumns) -> None:
+    """Save the papers <columns>, read from the dataset file <data_file>
+    whose stat() was <status>, to the cache file <cache_path>.
+
+    The cache file is replaced by write_cache_file.
+    """
+    data = cache_header(PAPER_CACHE_MAGIC, os.path.abspath(data_file))
+    data += _CACHE_HEADER.pack(status.st_mtime_ns, status.st_size,
+                               len(columns))
+    for strings in [columns.authors, columns.titles, columns.dois,
+                    columns.years, columns.categories]:
+        text = ''.join(strings).encode('utf-8')
+        data += _STRINGS.pack(len(strings), len(text))
+        data += array('I', accumulate(map(len, strings))).tobytes()
+        data += text
+    for numbers in [columns.year_index, columns.category_index,
+                    columns.citations]:
+        data += numbers.tobytes()
+    write_cache_file(cache_path, data)
+
+
+def load_paper_cache(cache_path: str, data_file: str,
+                     status: os.stat_result) -> Optional[PaperColumns]:
+    """Return the papers saved in the cache file <cache_path>, or None if
+    there is no such file, it is not a cache of the dataset file <data_file>
+    as of its stat() <status>, or it cannot be read.
+    """
+    data = read_cache_file(cache_path)
+    if data is None:
+        return None
+
+    try:
+        offset = read_cache_header(data, PAPER_CACHE_MAGIC,
+                                   os.path.abspath(data_file))
+        if offset is None:
+            return None
+        mtime, size, count = _CACHE_HEADER.unpack_from(data, offset)
+        offset += _CACHE_HEADER.size
+        if (mtime, size) != (status.st_mtime_ns, status.st_size):
+            return None
+
+        columns = PaperColumns()
+        string_columns = []
+        for _ in range(5):
+            strings, offset = _unpack_strings(data, offset)
+            string_columns.append(strings)
+        columns.authors, columns.titles, columns.dois, columns.years, \
+            columns.categories = string_columns
+        for numbers in [columns.year_index, columns.category_index,
+                        columns.citations]:
+            end = offset + count * numbers.itemsize
+            numbers.frombytes(data[offset:end])
+            offset = end
+        if len(columns.authors) != count or offset != len(data):
+            return None
+        return columns
+    except (struct.error, ValueError):  # Truncated, or not UTF-8.
+        return None
+
+
+def _unpack_strings(data: bytes, offset: int) -> Tuple[List[str], int]:
+    """Return the column of strings saved in <data> at <offset>, as written
+    by save_paper_cache, and the offset just after it.
+    """
+    count, length = _STRINGS.unpack_from(data, offset)
+    offset += _STRINGS.size
+    ends = array('I')
+    ends.frombytes(data[offset:offset + count * ends.itemsize])
+    offset += count * ends.itemsize
+    text = data[offset:offset + length].decode('utf-8')
+    starts = [0]
+    starts.extend(ends[:-1])
+    return [text[start:end] for start, end in zip(starts, ends)], \
+        offset + length
+
+
+def default_cache_path(data_file: str) -> str:
+    """Return the default cache file for the papers in the dataset file
+    <data_file>, in the user's cache folder.
+    """
+    return cache_file_path(data_file, '.papers')
+
+
+def _load_paper_trees(data_file: str, by_year: bool) -> List[PaperTree]:
+    """Return a list of trees of the papers in the dataset file <data_file>,
+    with the years as the roots if <by_year>.
+    """
+    columns = read_papers(data_file)
+    grouping = ('year', 'category') if by_year else ('category',)
+    return _group_papers(columns, [_dimension(columns, name)
+                                   for name in grouping])
+
+
+@contextmanager
+def _paused_gc() -> Iterator[None]:
+    """Pause the garbage collector for the body of a with statement that
+    makes many trees.
+
+    Every tree made stays alive, so the garbage collector would only walk
+    them again and again as they are made, without freeing anything.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# A way to group papers: the path of category trees of each group, and the
+# index of the group of each paper.
+Dimension = Tuple[List[List[str]], Sequence[int]]
+
+# The dimensions papers can be grouped by.
+DIMENSIONS = ('year', 'category', 'author', 'citations')
+
+# The groupings the visualiser switches between, in order. The first is the
+# grouping of PaperTree(all_papers=True, by_year=True).
+GROUPINGS = [('year', 'category'), ('category',), ('author',),
+             ('citations', 'category')]
+
+
+def _dimension(columns: PaperColumns, name: str) -> Dimension:
+    """Return the dimension called <name> in DIMENSIONS of the papers in
+    <columns>.
+
+    Papers are grouped by their year, by the levels of their categories, by
+    their first author, or by the number of digits in their citations.
+    """
+    if name == 'year':
+        return [[year] for year in columns.years], columns.year_index
+    if name == 'category':
+        return [categories.split(':') for categories in columns.categories], \
+            columns.category_index
+    if name == 'author':
+        values = [authors.split(' and ', 1)[0] for authors in columns.authors]
+    elif name == 'citations':
+        values = [_citation_bucket(citations)
+                  for citations in columns.citations]
+    else:
+        raise ValueError(f'no such dimension: {name}')
+    distinct = []
+    index = _index_values(values, distinct)
+    return [[value] for value in distinct], index
+
+
+def _citation_bucket(citations: int) -> str:
+    """Return the name of the group of papers with <citations> citations.
+    """
+    if citations <= 0:
+        return '0 citations'
+    digits = len(str(citations))
+    return f'{10 ** (digits - 1)}-{10 ** digits - 1} citations'
+
+
+def _group_papers(columns: PaperColumns, dimensions: List[Dimension],
+                  papers: Optional[List[Optional[PaperTree]]] = None) \
+        -> List[PaperTree]:
+    """Return a list of trees of the papers in <columns>, grouped by each of
+    <dimensions> in turn, with a tree for each paper in the innermost group.
+
+    If <papers> is not None, it has the tree to use for each paper, in the
+    order of <columns>, instead of a new one, or None for a paper to leave
+    out.
+
+    Grouped by year and category, these are the trees _build_tree_from_dict
+    returns for the dictionary _load_papers_to_dict reads from the same
+    papers.
+
+    Each paper is added straight to the tree of its innermost group, which
+    is found once for each distinct combination of groups, and the sizes of
+    the group trees are summed at the end.
+
+    Precondition: <dimensions> is not empty.
+    """
+    trees = []
+    # The trees of the groups, keyed by the id of the group tree they are
+    # in, or 0 at the top level, and their name.
+    group_trees: Dict[Tuple[int, str], PaperTree] = {}
+    # The papers already added, keyed the same way.
+    paper_trees: Dict[Tuple[int, str], PaperTree] = {}
+    # The innermost group tree of each distinct combination of groups.
+    innermost: Dict[Tuple[int, ...], PaperTree] = {}
+
+    with _paused_gc():
+        keys = zip(*(index for _, index in dimensions))
+        for i, key in enumerate(keys):
+            if papers is not None and papers[i] is None:
+                continue
+            parent = innermost.get(key)
+            if parent is None:
+                parent_id, subtrees = 0, trees
+                for (paths, _), group in zip(dimensions, key):
+                    for name in paths[group]:
+                        tree = group_trees.get((parent_id, name))
+                        if tree is None:
+                            tree = PaperTree(name, [])
+                            group_trees[(parent_id, name)] = tree
+                            tree._parent_tree = parent
+                            subtrees.append(tree)
+                        parent, parent_id = tree, id(tree)
+                        subtrees = tree._subtrees
+                innermost[key] = parent
+
+            title = columns.titles[i]
+            if papers is None:
+                paper = PaperTree(title, [], columns.authors[i],
+                                  columns.dois[i], columns.citations[i])
+            else:
+                paper = papers[i]
+            paper._parent_tree = parent
+            old = paper_trees.get((id(parent), title))
+            if old is None:
+                parent._subtrees.append(paper)
+            else:  # A later paper with the same title replaces it.
+                parent._subtrees[parent._subtrees.index(old)] = paper
+            paper_trees[(id(parent), title)] = paper
+
+        for tree in trees:
+            tree.update_data_sizes()
+    return trees
+
+
+class PaperTable:
+    """The papers of a dataset file, loaded once, and a PaperTree of them
+    that can be regrouped by different dimensions without reading the file
+    again.
+
+    The group of each paper in each dimension is worked out once, the first
+    time the dimension is used. Each paper keeps its tree from one grouping
+    to the next, and only the trees of the groups are made again, so papers
+    deleted from tree, or whose size was changed, stay that way when it is
+    regrouped. A moved paper is regrouped by its own year, category, author
+    and citations, like the others.
+
+    === Public Attributes ===
+    columns:
+        The papers.
+    tree:
+        The root of the tree of the papers.
+    grouping:
+        The names of the dimensions in DIMENSIONS the papers in tree are
+        grouped by, outermost first.
+
+    === Private Attributes ===
+    _dimensions:
+        Each dimension worked out so far, by name.
+    _paper_trees:
+        The tree of each paper in columns, in the same order, or None if the
+        paper has been deleted from tree.
+    """
+    columns: PaperColumns
+    tree: PaperTree
+    grouping: Tuple[str, ...]
+    _dimensions: Dict[str, Dimension]
+    _paper_trees: List[Optional[PaperTree]]
+
+    def __init__(self, name: str, columns: PaperColumns,
+                 grouping: Tuple[str, ...] = GROUPINGS[0]) -> None:
+        """Initialize a new PaperTable of the papers in <columns>, with a tree
+        called <name> of the papers grouped by <grouping>.
+
+        Precondition: <grouping> is not empty.
+        """
+        self.columns = columns
+        self._dimensions = {}
+        with _paused_gc():
+            self._paper_trees = [
+                PaperTree(title, [], authors, doi, citations)
+                for title, authors, doi, citations in zip(
+                    columns.titles, columns.authors, columns.dois,
+                    columns.citations)]
+        self.grouping = grouping
+        self.tree = PaperTree(name, self._group(grouping))
+
+    def _group(self, grouping: Tuple[str, ...]) -> List[PaperTree]:
+        """Return a new list of trees of the papers in _paper_trees grouped by
+        <grouping>.
+        """
+        for name in grouping:
+            if name not in self._dimensions:
+                self._dimensions[name] = _dimension(self.columns, name)
+        return _group_papers(self.columns, [self._dimensions[name]
+                                            for name in grouping],
+                             self._paper_trees)
+
+    def _forget_deleted_papers(self) -> None:
+        """Set to None each paper in _paper_trees that is no longer in tree.
+
+        A deleted paper, or a paper in a deleted group, has a parent that is
+        not a tree in tree, or no parent at all.
+        """
+        groups = set()
+        stack = [self.tree]
+        while stack:
+            current = stack.pop()
+            if current._subtrees:
+                groups.add(id(current))
+                stack.extend(current._subtrees)
+        papers = self._paper_trees
+        for i, paper in enumerate(papers):
+            if paper is not None and id(paper._parent_tree) not in groups:
+                papers[i] = None
+
+    def regroup(self, grouping: Tuple[str, ...]) -> None:
+        """Group the papers in tree by <grouping> instead, keeping any papers
+        deleted or resized in the old grouping deleted or resized.
+
+        Precondition: <grouping> is not empty.
+        """
+        if grouping == self.grouping:
+            return
+        self._forget_deleted_papers()
+        for subtree in self.tree._subtrees:
+            subtree._parent_tree = None
+        subtrees = self._group(grouping)
+        for subtree in subtrees:
+            subtree._parent_tree = self.tree
+        self.tree._subtrees = subtrees
+        self.tree.data_size = sum(subtree.data_size for subtree in subtrees)
+        self.tree._layout_dirty = True
+        self.grouping = grouping
+
+
+def load_paper_table(name: str, data_file: Optional[str] = None,
+                     grouping: Tuple[str, ...] = GROUPINGS[0]) -> PaperTable:
+    """Return a PaperTable of the papers in <data_file>, or in DATA_FILE if
+    <data_file> is None, read by read_papers, with a tree called <name> of
+    the papers grouped by <grouping>.
+    """
+    return PaperTable(name, read_papers(data_file or DATA_FILE), grouping)
+
+
+def _load_papers_to_dict(by_year: bool = True,
+                         data_file: Optional[str] = None) -> Dict:
+    """Return a nested dictionary of the data read from the papers dataset file
+    <data_file>, or DATA_FILE if <data_file> is None.
 
     If <by_year>, then use years as the roots of the subtrees of the root of
     the whole tree. Otherwise, ignore years and use categories only.
     """
     result = {}
 
-    with open(DATA_FILE, 'r') as data:
+    with open(data_file or DATA_FILE, 'r') as data:
         data.readline()  # Skip the header line
         file = csv.reader(data)
 
@@ -201,7 +880,10 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'allowed-import-modules': ['python_ta', 'typing', 'csv', 'tm_trees'],
-        'allowed-io': ['_load_papers_to_dict'],
-        'max-args': 8
+        'allowed-import-modules': ['python_ta', 'typing', 'csv', 'contextlib',
+                                   'gc', 'os', 'struct', 'time', 'array',
+                                   'itertools', 'cache_files', 'tm_trees'],
+        'allowed-io': ['PaperTreeStream.__init__', '_load_papers_to_dict',
+                       'read_papers'],
+        'max-args': 9
     })
@@ -0,0 +1,154 @@
+"""Assignment 2: Profiling
+
+=== Module Description ===
+This module contains Profiler, which keeps timing counters for the phases of
+the visualiser's work, such as scanning, laying out and drawing the tree, so
+that it is easy to see where the time goes on a big tree.
+
+The visualiser times each phase where it calls it, and can show the counters
+over the treemap and write them to a JSON file when it closes.
+"""
+from __future__ import annotations
+from collections import deque
+from contextlib import contextmanager
+import json
+import threading
+import time
+from typing import Deque, Dict, Iterator, List
+
+
+class PhaseStats:
+    """The timing counters of one phase.
+
+    === Public Attributes ===
+    count:
+        The number of times the phase ran.
+    total:
+        The time taken by every run of the phase, in seconds.
+    longest:
+        The time taken by the longest run of the phase, in seconds.
+    last:
+        The time taken by the last run of the phase, in seconds.
+    """
+    count: int
+    total: float
+    longest: float
+    last: float
+
+    def __init__(self) -> None:
+        """Initialize the counters of a phase that has not run yet.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.last = 0.0
+
+    def add(self, elapsed: float) -> None:
+        """Count a run of the phase that took <elapsed> seconds.
+        """
+        self.count += 1
+        self.total += elapsed
+        self.longest = max(self.longest, elapsed)
+        self.last = elapsed
+
+
+class Profiler:
+    """Timing counters for named phases, and a frame rate counter.
+
+    Phases may be timed from any thread, such as the layout worker's.
+
+    === Private Attributes ===
+    _phases:
+        The counters of each phase, in the order the phases first ran.
+    _frames:
+        The time, from time.perf_counter, at which each frame of the last
+        second was drawn.
+    _lock:
+        Held while changing the counters.
+    """
+    _phases: Dict[str, PhaseStats]
+    _frames: Deque[float]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        """Initialize a new Profiler with no phases.
+        """
+        self._phases = {}
+        self._frames = deque()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the body of a with statement as a run of the phase <name>.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, elapsed: float) -> None:
+        """Count a run of the phase <name> that took <elapsed> seconds.
+        """
+        with self._lock:
+            stats = self._phases.get(name)
+            if stats is None:
+                stats = self._phases[name] = PhaseStats()
+            stats.add(elapsed)
+
+    def frame_drawn(self) -> None:
+        """Count a frame drawn now, for the frame rate.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self._frames.append(now)
+            while self._frames[0] < now - 1:
+                self._frames.popleft()
+
+    def fps(self) -> int:
+        """Return the number of frames drawn in the last second.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            return sum(1 for frame in self._frames if frame >= now - 1)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the counters of each phase: its count, and its total, mean,
+        longest and last times in milliseconds.
+        """
+        with self._lock:
+            return {name: {'count': stats.count,
+                           'total_ms': stats.total * 1000,
+                           'mean_ms': stats.total * 1000 / stats.count,
+                           'max_ms': stats.longest * 1000,
+                           'last_ms': stats.last * 1000}
+                    for name, stats in self._phases.items()}
+
+    def overlay_lines(self) -> List[str]:
+        """Return the lines of text to show over the treemap: the frame rate,
+        then the last and mean time of each phase.
+        """
+        lines = [f'{self.fps():>4} fps']
+        for name, stats in self.summary().items():
+            lines.append(f'{name:>10} {stats["last_ms"]:8.2f} ms '
+                         f'(mean {stats["mean_ms"]:.2f})')
+        return lines
+
+    def dump(self, path: str) -> None:
+        """Write the frame rate and the counters of each phase, as returned by
+        summary, to the JSON file <path>.
+        """
+        with open(path, 'w') as f:
+            json.dump({'fps': self.fps(), 'phases': self.summary()}, f,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': ['python_ta', 'typing', 'collections',
+                                   'contextlib', 'json', 'threading', 'time',
+                                   '__future__'],
+        'allowed-io': ['dump']
+    })
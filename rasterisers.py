@@ -0,0 +1,107 @@
+"""Assignment 2: Treemap rasterisers
+
+=== Module Description ===
+This module contains the rasterisers that the visualiser can use to draw a
+tree's DrawList onto a pygame surface. Every rasteriser is a function that
+takes the surface and the draw list, and replaces what is on the surface with
+each rectangle in the draw list filled with its colour, on a black
+background.
+
+draw_rects makes one pygame.draw.rect call per rectangle. numpy_rects paints
+every rectangle at once into a NumPy pixel buffer, and copies it onto the
+surface with pygame.surfarray. It is only available if NumPy is installed.
+"""
+from __future__ import annotations
+from typing import Callable, Dict
+
+import pygame
+
+from tm_trees import DrawList
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def draw_rects(surface: pygame.Surface, draw_list: DrawList) -> None:
+    """Draw each rectangle in <draw_list> onto <surface>, cleared to black,
+    with its own pygame.draw.rect call.
+    """
+    surface.fill((0, 0, 0))
+    for x, y, w, h, r, g, b in zip(draw_list.x, draw_list.y,
+                                   draw_list.width, draw_list.height,
+                                   draw_list.red, draw_list.green,
+                                   draw_list.blue):
+        pygame.draw.rect(surface, (r, g, b), (x, y, w, h))
+
+
+def numpy_rects(surface: pygame.Surface, draw_list: DrawList) -> None:
+    """Draw every rectangle in <draw_list> onto <surface>, cleared to black,
+    at once using a NumPy pixel buffer.
+
+    The rectangles in a draw list do not overlap, so each pixel is covered by
+    at most one of them. Each rectangle adds its packed colour at its top-left
+    and bottom-right corners, and subtracts it at the other two, into a
+    difference array; summing the array along both axes then gives every
+    pixel the colour of the rectangle covering it, or 0 if there is none.
+
+    Precondition: the rectangles in <draw_list> do not overlap.
+    """
+    width, height = surface.get_size()
+    if not len(draw_list):
+        surface.fill((0, 0, 0))
+        return
+    x = numpy.frombuffer(draw_list.x, numpy.int32).astype(numpy.int64)
+    y = numpy.frombuffer(draw_list.y, numpy.int32).astype(numpy.int64)
+    right = numpy.clip(x + numpy.frombuffer(draw_list.width, numpy.int32),
+                       0, width)
+    bottom = numpy.clip(y + numpy.frombuffer(draw_list.height, numpy.int32),
+                        0, height)
+    left = numpy.clip(x, 0, width)
+    top = numpy.clip(y, 0, height)
+    red, green, blue = (numpy.frombuffer(channel, numpy.uint8).astype(
+        numpy.int64) for channel in (draw_list.red, draw_list.green,
+                                     draw_list.blue))
+    colour = red << 16 | green << 8 | blue
+
+    # The difference array has one extra row and column, for the corners on
+    # the right and bottom edges. The packed colours are below 2 ** 24, so
+    # bincount's float64 sums are exact.
+    stride = height + 1
+    corners = numpy.concatenate([left * stride + top, right * stride + bottom,
+                                 right * stride + top, left * stride + bottom])
+    weights = numpy.concatenate([colour, colour, -colour, -colour])
+    diff = numpy.bincount(corners, weights, (width + 1) * stride)
+    packed = diff.reshape(width + 1, stride).cumsum(0).cumsum(1)
+    packed = packed[:width, :height].astype(numpy.uint32)
+
+    if surface.get_bitsize() in (24, 32) \
+            and surface.get_masks()[:3] == (0xFF0000, 0xFF00, 0xFF):
+        # The surface stores pixels packed the same way.
+        pygame.surfarray.blit_array(surface, packed)
+    else:
+        pixels = numpy.empty((width, height, 3), numpy.uint8)
+        pixels[..., 0] = packed >> 16
+        pixels[..., 1] = packed >> 8
+        pixels[..., 2] = packed
+        pygame.surfarray.blit_array(surface, pixels)
+
+
+# The rasterisers, by the name used to select them.
+RASTERISERS: Dict[str, Callable[[pygame.Surface, DrawList], None]] = {
+    'pygame': draw_rects,
+}
+if numpy is not None:
+    RASTERISERS['numpy'] = numpy_rects
+DEFAULT_RASTERISER = 'numpy' if numpy is not None else 'pygame'
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': ['python_ta', 'typing', 'pygame', 'numpy',
+                                   'tm_trees', '__future__'],
+        'generated-members': 'pygame.*'
+    })
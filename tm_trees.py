@@ -21,8 +21,33 @@ computer's file system.
 from __future__ import annotations
 import os
 import math
-from random import randint
-from typing import List, Tuple, Optional
+from array import array
+from bisect import bisect_left
+from random import getrandbits
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Optional
+
+from fs_scanner import BackgroundScan, Scanner, ScandirScanner, ScanEntry, \
+    folder_sizes, read_folder
+from treemap_layouts import DEFAULT_LAYOUT, LAYOUTS
+
+# The layout of a tree, as returned by TMTree.save_layout: for each tree whose
+# layout is saved, the tree, its rect, _layout_dirty, _hit_index, _lod_culled
+# and _draw_list, and the _draw_list of each ancestor.
+SavedLayout = Tuple[List[Tuple['TMTree', Tuple[int, int, int, int], bool,
+                               Optional[Tuple[int, array]], bool,
+                               Optional['DrawList']]],
+                    List[Tuple['TMTree', Optional['DrawList']]]]
+
+# The level-of-detail threshold, in pixels, used when a treemap is displayed
+# or exported: trees narrower or shorter than this are drawn as one block,
+# instead of laying out and drawing everything inside them.
+LOD_THRESHOLD = 2
+
+# When True, every incremental change to a data_size is checked against a full
+# recompute of the whole tree. This is very slow, and meant for testing.
+VALIDATE_SIZES = False
 
 
 class TMTree:
@@ -31,8 +56,7 @@ class TMTree:
 
     This is an abstract class that should not be instantiated directly.
 
-    You may NOT add any attributes, public or private, to this class.
-    However, part of this asignment will involve you implementing new public
+    Part of this asignment will involve you implementing new public
     *methods* for this interface.
     You should not add any new public methods other than those required by
     the client code.
@@ -57,6 +81,28 @@ class TMTree:
         as a subtree, or None if this tree is not part of a larger tree.
     _expanded:
         Whether or not this tree is considered expanded for visualization.
+    _layout_dirty:
+        Whether or not the rectangles of this tree's subtrees need to be laid
+        out again, even if rect does not change.
+    _hit_index:
+        The axis the subtrees were last sliced along, and the sorted start
+        coordinate of each subtree along it, used to find the subtrees under
+        a position by binary search. None if the subtrees have not been laid
+        out as slices.
+    _layout:
+        The name of the layout engine in LAYOUTS used to lay out the subtrees
+        of this tree, or None to use the same engine as its parent.
+    _lod_threshold:
+        The level-of-detail threshold, in pixels, for this tree and every tree
+        within it that does not set its own, or None to use the same threshold
+        as its parent. 0 turns level of detail off.
+    _lod_culled:
+        Whether or not this tree's rectangle was too small, at the last
+        layout, for its subtrees to be laid out and drawn. It is then drawn as
+        a single block standing in for all of them.
+    _draw_list:
+        The cached DrawList of the displayed-tree rooted at this tree, or None
+        if it has not been built since the tree's display last changed.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -84,6 +130,18 @@ class TMTree:
     _subtrees: List[TMTree]
     _parent_tree: Optional[TMTree]
     _expanded: bool
+    _layout_dirty: bool
+    _hit_index: Optional[Tuple[int, array]]
+    _layout: Optional[str]
+    _lod_threshold: Optional[int]
+    _lod_culled: bool
+    _draw_list: Optional[DrawList]
+
+    # Keep the attributes in fixed slots rather than a __dict__, as a scanned
+    # file system can have millions of trees.
+    __slots__ = ('rect', 'data_size', '_colour', '_name', '_subtrees',
+                 '_parent_tree', '_expanded', '_layout_dirty', '_hit_index',
+                 '_layout', '_lod_threshold', '_lod_culled', '_draw_list')
 
     def __init__(self, name: str, subtrees: List[TMTree],
                  data_size: int = 0) -> None:
@@ -100,15 +158,29 @@ class TMTree:
         Precondition: if <name> is None, then <subtrees> is empty.
         """
         self.rect = (0, 0, 0, 0)
+        self._layout_dirty = True
+        self._hit_index = None
+        self._layout = None
+        self._lod_threshold = None
+        self._lod_culled = False
+        self._draw_list = None
         self._name = name
         self._subtrees = subtrees[:]
         self._parent_tree = None
         self._expanded = True
 
-        self._colour = (randint(0, 255), randint(0, 255), randint(0, 255))
+        # One random 24-bit number is much cheaper than three randint calls.
+        colour = getrandbits(24)
+        self._colour = (colour >> 16, (colour >> 8) & 255, colour & 255)
 
-        self.data_size = data_size
-        self._sum_size()
+        # Each subtree already satisfies the size invariant, so only this
+        # level needs summing.
+        if self._name is None:
+            self.data_size = 0
+        elif self._subtrees:
+            self.data_size = sum(tree.data_size for tree in self._subtrees)
+        else:
+            self.data_size = data_size
 
         for tree in self._subtrees:
             tree._parent_tree = self
@@ -128,6 +200,47 @@ class TMTree:
 
         return self.data_size
 
+    def _add_to_size(self, delta: int) -> None:
+        """Add <delta> to the data_size of this tree and of each of its
+        ancestors, and mark their layouts as dirty.
+
+        This keeps the data_size invariant in O(depth) after a single edit,
+        instead of summing the whole tree again.
+        """
+        tree = self
+        while True:
+            tree.data_size += delta
+            tree._layout_dirty = True
+            if tree._parent_tree is None:
+                break
+            tree = tree._parent_tree
+        if VALIDATE_SIZES:
+            assert tree._sizes_are_consistent(), \
+                'data_size no longer equals the sum of the subtrees'
+
+    def _sizes_are_consistent(self) -> bool:
+        """Return True iff the data_size of this tree and of every tree in it
+        equals the sum of its subtrees' sizes, as a full recompute by
+        _sum_size would find. Nothing is changed.
+        """
+        # Visit the trees in postorder, so each tree's expected size is known
+        # before its parent's.
+        expected = {}
+        stack = [(self, False)]
+        while stack:
+            tree, visited = stack.pop()
+            if tree.is_empty() or not tree._subtrees:
+                expected[id(tree)] = 0 if tree.is_empty() else tree.data_size
+            elif visited:
+                total = sum(expected[id(t)] for t in tree._subtrees)
+                if total != tree.data_size:
+                    return False
+                expected[id(tree)] = total
+            else:
+                stack.append((tree, True))
+                stack.extend((t, False) for t in tree._subtrees)
+        return expected[id(self)] == self.data_size
+
     def get_parent(self) -> Optional[TMTree]:
         """Returns the parent of this tree.
         """
@@ -141,42 +254,171 @@ class TMTree:
     def update_rectangles(self, rect: Tuple[int, int, int, int]) -> None:
         """Update the rectangles in this tree and its descendents using the
         treemap algorithm to fill the area defined by pygame rectangle <rect>.
-        """
-        if self.is_empty() or self.data_size == 0:
-            return
-
-        if self._subtrees and self._expanded:
-            self.rect = rect
-            x, y, width, height = rect
-
-            # Divide the rectangles horizontally or vertically based on the aspect ratio
-            if width > height:
-                total_data_size = sum(subtree.data_size for subtree in self._subtrees)
-                nx = x
-
-                for subtree in self._subtrees:
-                    new_width = math.floor(width * (subtree.data_size / total_data_size))
-                    if subtree == self._subtrees[-1] and (nx + new_width - x) != width:
-                        new_width = (width + x) - nx
-                    subtree.rect = (nx, y, new_width, height)
-                    nx += new_width
-            else:
-                total_data_size = sum(subtree.data_size for subtree in self._subtrees)
-                ny = y
 
-                for subtree in self._subtrees:
-                    new_height = math.floor(height * (subtree.data_size / total_data_size))
-                    if subtree == self._subtrees[-1] and (ny + new_height - y) != height:
-                        new_height = (height + y) - ny
-                    subtree.rect = (x, ny, width, new_height)
-                    ny += new_height
+        Only the trees that need it are laid out again: a subtree whose
+        rectangle is unchanged, and whose layout is not dirty, keeps the
+        rectangles it already has.
 
-            # Update rectangles recursively for each subtree
-            for tree in self._subtrees:
-                tree.update_rectangles(tree.rect)
+        If level of detail is on, a tree whose rectangle is narrower or
+        shorter than the threshold is not descended into, so the work done is
+        bounded by the number of pixels rather than the size of the tree.
+        """
+        if self._update_rectangles(rect, self.get_layout(),
+                                   self.get_lod_threshold()):
+            self._forget_draw_lists()
+
+    def _update_rectangles(self, rect: Tuple[int, int, int, int],
+                           layout: str, lod_threshold: int) -> bool:
+        """Update the rectangles in this tree and its descendents to fill
+        <rect>, as in update_rectangles, and return True iff any of them
+        changed. <layout> and <lod_threshold> are the layout engine and
+        level-of-detail threshold inherited from this tree's parent.
+
+        The cached draw list of every tree laid out again is forgotten.
+        """
+        if self.is_empty():
+            return False
+        if rect == self.rect and not self._layout_dirty:
+            return False
+
+        self.rect = rect
+        self._draw_list = None
+        if self._lod_threshold is not None:
+            lod_threshold = self._lod_threshold
+        self._lod_culled = self._expanded and bool(self._subtrees) \
+            and min(rect[2], rect[3]) < lod_threshold
+        if not self._subtrees or not self._expanded or self._lod_culled:
+            # The subtrees are not shown; lay them out when they are.
+            self._layout_dirty = bool(self._subtrees)
+            return True
+
+        self._layout_dirty = False
+        if self._layout is not None:
+            layout = self._layout
+        rects = self._layout_children(rect, layout)
+        for subtree, subtree_rect in zip(self._subtrees, rects):
+            subtree._update_rectangles(subtree_rect, layout, lod_threshold)
+        self._hit_index = _build_hit_index(rect, rects)
+        return True
+
+    def _layout_children(self, rect: Tuple[int, int, int, int],
+                         layout: str) -> List[Tuple[int, int, int, int]]:
+        """Return the rectangle of each subtree, in order, when this tree
+        fills <rect> using the layout engine called <layout>.
+
+        The subtrees always fill <rect> exactly, in proportion to their
+        data_size.
+        """
+        return LAYOUTS[layout](rect, [subtree.data_size
+                                      for subtree in self._subtrees])
 
-        elif not self._subtrees or not self._expanded:
-            self.rect = rect
+    def get_layout(self) -> str:
+        """Return the name of the layout engine used to lay out this tree's
+        subtrees: the one set on this tree, or else on its nearest ancestor
+        that has one, or else DEFAULT_LAYOUT.
+        """
+        tree = self
+        while tree is not None:
+            if tree._layout is not None:
+                return tree._layout
+            tree = tree._parent_tree
+        return DEFAULT_LAYOUT
+
+    def set_layout(self, layout: Optional[str]) -> None:
+        """Use the layout engine called <layout> for this tree and every tree
+        within it that does not set its own, and update their rectangles.
+        If <layout> is None, use the engine of this tree's parent instead.
+
+        Precondition: <layout> is None or a key of LAYOUTS.
+        """
+        self._layout = layout
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._subtrees:
+                tree._layout_dirty = True
+                stack.extend(tree._subtrees)
+        self.update_rectangles(self.rect)
+
+    def get_lod_threshold(self) -> int:
+        """Return the level-of-detail threshold, in pixels, of this tree: the
+        one set on this tree, or else on its nearest ancestor that has one, or
+        else 0, which means level of detail is off.
+        """
+        tree = self
+        while tree is not None:
+            if tree._lod_threshold is not None:
+                return tree._lod_threshold
+            tree = tree._parent_tree
+        return 0
+
+    def set_lod_threshold(self, threshold: Optional[int]) -> None:
+        """Use a level-of-detail threshold of <threshold> pixels for this tree
+        and every tree within it that does not set its own, and update their
+        rectangles. If <threshold> is None, use the threshold of this tree's
+        parent instead.
+
+        With a threshold above 0, a tree whose rectangle is narrower or
+        shorter than <threshold> is drawn as a single block standing in for
+        everything within it, and rectangles with no area are not drawn.
+        """
+        self._lod_threshold = threshold
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._subtrees:
+                tree._layout_dirty = True
+                stack.extend(tree._subtrees)
+        self.update_rectangles(self.rect)
+
+    def save_layout(self) -> SavedLayout:
+        """Return the layout of this tree, so that restore_layout can put it
+        back after this tree has been laid out on its own, for example to zoom
+        in on it.
+
+        The layout is the rectangle and cached layout data of every tree that
+        laying out this tree could change, and the cached draw lists of this
+        tree's ancestors.
+        """
+        trees = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            trees.append((tree, tree.rect, tree._layout_dirty,
+                          tree._hit_index, tree._lod_culled, tree._draw_list))
+            if tree._subtrees and tree._expanded:
+                stack.extend(tree._subtrees)
+        ancestors = []
+        tree = self._parent_tree
+        while tree is not None:
+            ancestors.append((tree, tree._draw_list))
+            tree = tree._parent_tree
+        return trees, ancestors
+
+    def restore_layout(self, saved: Optional[SavedLayout]) -> None:
+        """Put back the layout <saved> by save_layout, as long as nothing in
+        the tree has changed since.
+
+        If <saved> is None, forget the layout of this tree instead, so that
+        the next call to update_rectangles on its root lays it out again
+        within its parent.
+        """
+        if saved is None:
+            tree = self
+            while tree is not None:
+                tree._layout_dirty = True
+                tree._draw_list = None
+                tree = tree._parent_tree
+            return
+        trees, ancestors = saved
+        for tree, rect, dirty, hit_index, lod_culled, draw_list in trees:
+            tree.rect = rect
+            tree._layout_dirty = dirty
+            tree._hit_index = hit_index
+            tree._lod_culled = lod_culled
+            tree._draw_list = draw_list
+        for tree, draw_list in ancestors:
+            tree._draw_list = draw_list
 
     def get_rectangles(self) -> List[Tuple[Tuple[int, int, int, int],
     Tuple[int, int, int]]]:
@@ -185,18 +427,46 @@ class TMTree:
         appropriate pygame rectangle to display for a leaf, and the colour
         to fill it with.
         """
-        rectangles = []
+        draw_list = self.get_draw_list()
+        return list(zip(zip(draw_list.x, draw_list.y,
+                            draw_list.width, draw_list.height),
+                        zip(draw_list.red, draw_list.green, draw_list.blue)))
+
+    def get_draw_list(self) -> DrawList:
+        """Return the rectangles and colours of every leaf in the
+        displayed-tree rooted at this tree, as a DrawList.
 
-        def traverse(tree: TMTree) -> None:
-            if tree._expanded and not tree.is_empty():
-                if tree._subtrees:
-                    for subtree in tree._subtrees:
-                        traverse(subtree)
-                else:
-                    rectangles.append((tree.rect, tree._colour))
+        The draw list is cached, and only built again after the layout of
+        this tree changes, or a tree in it is expanded or collapsed. The
+        returned DrawList must not be modified.
 
-        traverse(self)
-        return rectangles
+        If level of detail is on, a tree culled by it is drawn as a single
+        rectangle, and rectangles with no area are left out.
+        """
+        if self._draw_list is None:
+            draw_list = DrawList()
+            skip_empty = self.get_lod_threshold() > 0
+            stack = [self]
+            while stack:
+                tree = stack.pop()
+                if tree.is_empty():
+                    continue
+                if tree._subtrees and tree._expanded \
+                        and not tree._lod_culled:
+                    stack.extend(reversed(tree._subtrees))
+                elif not skip_empty or (tree.rect[2] and tree.rect[3]):
+                    draw_list.append(tree, tree.rect, tree._colour)
+            self._draw_list = draw_list
+        return self._draw_list
+
+    def _forget_draw_lists(self) -> None:
+        """Forget the cached draw list of this tree and of each of its
+        ancestors, because what they display has changed.
+        """
+        tree = self
+        while tree is not None:
+            tree._draw_list = None
+            tree = tree._parent_tree
 
     def get_tree_at_position(self, pos: Tuple[int, int]) -> Optional[TMTree]:
         """Return the leaf in the displayed-tree rooted at this tree whose
@@ -205,27 +475,41 @@ class TMTree:
 
         If <pos> is on the shared edge between two rectangles, return the
         tree represented by the rectangle that is closer to the origin.
-        """
-        if self.rect is None:
-            return None
 
+        When this tree's layout is clean, only the subtrees whose interval in
+        _hit_index contains <pos> are searched, so each level costs
+        O(log fanout) instead of a visit to every subtree.
+        """
         x, y = pos
         lx, ly, ux, uy = self.rect
 
-        if lx <= x <= lx + ux and ly <= y <= ly + uy:
-            if self._subtrees == [] or not self._expanded:
-                return self
-            else:
-                matches = [tree.get_tree_at_position(pos) for tree in self._subtrees]
-                matches = [match for match in matches if match is not None]
-
-                if matches:
-                    closest = min(matches, key=lambda match: (match.rect[0], match.rect[1]))
-                    return closest
-                else:
-                    return None
-        else:
+        if not (lx <= x <= lx + ux and ly <= y <= ly + uy):
             return None
+        if not self._subtrees or not self._expanded or self._lod_culled:
+            return self
+
+        subtrees = self._subtrees
+        if self._layout_dirty or self._hit_index is None:
+            first, axis, starts = 0, None, None
+        else:
+            axis, starts = self._hit_index
+            # The first subtree whose interval ends at or after pos; the
+            # interval of subtree i ends where subtree i + 1 starts.
+            first = bisect_left(starts, pos[axis], 1) - 1
+
+        closest = None
+        for i in range(first, len(subtrees)):
+            if starts is not None and starts[i] > pos[axis]:
+                break  # This and every later subtree start after pos.
+            match = subtrees[i].get_tree_at_position(pos)
+            if match is not None and (
+                    closest is None
+                    or (match.rect[0], match.rect[1])
+                    < (closest.rect[0], closest.rect[1])):
+                closest = match
+            if axis == 0 and closest is not None and closest.rect[0] < x:
+                break  # Every later subtree starts at x or further right.
+        return closest
 
     def update_data_sizes(self) -> int:
         """Update the data_size for this tree and its subtrees, based on the
@@ -239,21 +523,42 @@ class TMTree:
         """If this tree is a leaf, and <destination> is not a leaf, move this
         tree to be the last subtree of <destination>. Otherwise, do nothing.
         """
+        if destination is None or self._parent_tree is None:
+            return
+        self._load_subtrees()
+        destination._load_subtrees()
         if not self._subtrees and destination._subtrees:
             self._parent_tree._subtrees.remove(self)
-            self._parent_tree.update_data_sizes()
+            self._parent_tree._add_to_size(-self.data_size)
 
             destination._subtrees.append(self)
-            destination.update_data_sizes()
+            self._parent_tree = destination
+            destination._add_to_size(self.data_size)
+
+    def delete_self(self) -> bool:
+        """Remove this tree from the tree it is part of, and return True iff
+        it was removed.
+
+        Do nothing, and return False, if this tree has no parent.
+        """
+        parent = self._parent_tree
+        if parent is None:
+            return False
+        parent._subtrees.remove(self)
+        parent._add_to_size(-self.data_size)
+        self._parent_tree = None
+        return True
 
     def change_size(self, factor: float) -> None:
-        """Change the value of this tree's data_size attribute by <factor>.
+        """Change the value of this tree's data_size attribute by <factor>,
+        and the data_size of each of its ancestors by the same amount.
 
         Always round up the amount to change, so that it's an int, and
         some change is made.
 
         Do nothing if this tree is not a leaf.
         """
+        self._load_subtrees()
         if self._subtrees or self.is_empty():
             return
 
@@ -262,19 +567,24 @@ class TMTree:
         change_direction = 1 if factor >= 0 else -1
         change = change_direction * change
 
-        self.data_size += change
+        self._add_to_size(change)
 
     def expand(self) -> None:
         """Expand this tree, so that it's subtrees are shown.
         If this tree is expanded, or a leaf, do nothing.
         """
+        self._load_subtrees()
         if not self._expanded or not self._subtrees:
             self._expanded = True
+            self._layout_dirty = True
             self.update_rectangles(self.rect)
 
     def expand_all(self) -> None:
         """Expand this tree, and all trees within it.
-        If this tree is exanded, or a leaf, do nothing.
+        If this tree is a leaf, do nothing.
+
+        Trees that are already expanded are still descended into, since the
+        trees within them may be collapsed, or not loaded yet.
         """
         # Create a stack for iterative traversal
         stack = [self]
@@ -282,15 +592,28 @@ class TMTree:
         # Iterate through the stack
         while stack:
             current = stack.pop()
+            current._load_subtrees()
 
-            # If the current tree is not expanded and has subtrees, expand it
-            if not current._expanded and current._subtrees:
+            # Expand the current tree if it has subtrees, and lay it out
+            # again, since trees within it may be expanded below.
+            if current._subtrees:
                 current._expanded = True
-                current.update_rectangles(current.rect)
+                current._layout_dirty = True
 
                 # Add all subtrees of the current tree to the stack
                 stack.extend(current._subtrees)
 
+        # Lay out everything that was expanded in a single pass.
+        self.update_rectangles(self.rect)
+
+    def _load_subtrees(self) -> None:
+        """Make sure the subtrees of this tree are in _subtrees, for trees
+        that only find their subtrees when they are first needed.
+
+        Every tree is called on before it is expanded or edited. A TMTree
+        always has its subtrees, so it does nothing.
+        """
+
     def collapse(self) -> None:
         """Collapse the selected group of trees."""
         if self._subtrees:  # Check if the tree has any subtrees
@@ -299,9 +622,13 @@ class TMTree:
     def collapse_subtrees(self) -> None:
         """Collapse all subtrees of this tree.
         """
-        self._expanded = False
-        for subtree in self._subtrees:
-            subtree.collapse_subtrees()
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._expanded = False
+            tree._draw_list = None
+            stack.extend(tree._subtrees)
+        self._forget_draw_lists()
 
     def collapse_all(self) -> None:
         """Collapse every tree contained in the root of this tree.
@@ -346,6 +673,117 @@ class TMTree:
         raise NotImplementedError
 
 
+class DrawList:
+    """The rectangles and colours of the leaves of a displayed-tree, in the
+    order they are drawn.
+
+    Each rectangle is stored across parallel arrays, one per field, rather
+    than as a tuple per leaf, so that a cached draw list is compact and
+    reading it allocates nothing.
+
+    === Public Attributes ===
+    x, y, width, height:
+        The pygame rectangle of each leaf.
+    red, green, blue:
+        The colour of each leaf.
+    trees:
+        The tree drawn by each rectangle.
+    """
+    x: array
+    y: array
+    width: array
+    height: array
+    red: array
+    green: array
+    blue: array
+    trees: List[TMTree]
+
+    def __init__(self) -> None:
+        """Initialize a new, empty DrawList.
+        """
+        self.x = array('i')
+        self.y = array('i')
+        self.width = array('i')
+        self.height = array('i')
+        self.red = array('B')
+        self.green = array('B')
+        self.blue = array('B')
+        self.trees = []
+
+    def __len__(self) -> int:
+        """Return the number of rectangles in this draw list.
+        """
+        return len(self.trees)
+
+    def append(self, tree: TMTree, rect: Tuple[int, int, int, int],
+               colour: Tuple[int, int, int]) -> None:
+        """Add the rectangle <rect>, filled with <colour>, drawn for <tree>.
+        """
+        x, y, width, height = rect
+        self.x.append(x)
+        self.y.append(y)
+        self.width.append(width)
+        self.height.append(height)
+        red, green, blue = colour
+        self.red.append(red)
+        self.green.append(green)
+        self.blue.append(blue)
+        self.trees.append(tree)
+
+    def scaled(self, size: Tuple[int, int],
+               new_size: Tuple[int, int]) -> DrawList:
+        """Return a copy of this draw list for a display at (0, 0) that is
+        resized from <size> to <new_size>, with every rectangle stretched in
+        proportion.
+
+        The edges of each rectangle are scaled, rather than its width and
+        height, so rectangles that shared an edge still do.
+        """
+        width, height = size
+        new_width, new_height = new_size
+        scaled = DrawList()
+        if not width or not height:
+            return scaled
+        left = [x * new_width // width for x in self.x]
+        top = [y * new_height // height for y in self.y]
+        right = [(x + w) * new_width // width
+                 for x, w in zip(self.x, self.width)]
+        bottom = [(y + h) * new_height // height
+                  for y, h in zip(self.y, self.height)]
+        scaled.x = array('i', left)
+        scaled.y = array('i', top)
+        scaled.width = array('i', [r - l for l, r in zip(left, right)])
+        scaled.height = array('i', [b - t for t, b in zip(top, bottom)])
+        scaled.red = array('B', self.red)
+        scaled.green = array('B', self.green)
+        scaled.blue = array('B', self.blue)
+        scaled.trees = self.trees[:]
+        return scaled
+
+
+def _build_hit_index(rect: Tuple[int, int, int, int],
+                     rects: List[Tuple[int, int, int, int]]) \
+        -> Optional[Tuple[int, array]]:
+    """Return the hit index for subtrees laid out in <rects> inside <rect>,
+    or None if they are not slices of <rect> along a single axis.
+
+    The index is the axis the subtrees are sliced along (0 for x, 1 for y),
+    and the sorted start coordinate of each subtree along that axis.
+    """
+    x, y, width, height = rect
+    if all(r[1] == y and r[3] == height for r in rects):
+        axis = 0
+    elif all(r[0] == x and r[2] == width for r in rects):
+        axis = 1
+    else:
+        return None
+    starts = array('i', [r[axis] for r in rects])
+    for i in range(1, len(rects)):
+        if starts[i] != starts[i - 1] + rects[i - 1][axis + 2]:
+            return None
+    return axis, starts
+
+
 class FileSystemTree(TMTree):
     """A tree representation of files and folders in a file system.
 
@@ -357,15 +795,107 @@ class FileSystemTree(TMTree):
 
     The data_size attribute for regular files is simply the size of the file,
     as reported by os.path.getsize.
+
+    A lazy tree reads the contents of each folder only when the folder is
+    first expanded or edited. Until then, the folder is shown as a single
+    block of its total size.
+
+    === Private Attributes ===
+    _unread:
+        The path of this folder and the total size of every folder in the
+        tree, keyed by path, if this is a folder whose contents have not been
+        read yet, and None otherwise.
     """
+    _unread: Optional[Tuple[str, Dict[str, int]]]
+
+    __slots__ = ('_unread',)
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, scanner: Optional[Scanner] = None,
+                 lazy: bool = False) -> None:
         """Store the file tree structure contained in the given file or folder.
 
+        The structure is read from disk by <scanner>, or by a ScandirScanner
+        with the default number of threads if <scanner> is None.
+
+        If <lazy>, only keep the total size of each folder, as found by
+        folder_sizes, and read the contents of a folder below <path> only
+        when they are first needed.
+
         Precondition: <path> is a valid path for this computer.
         """
-        temp_subtrees = [FileSystemTree(os.path.join(path, x)) for x in os.listdir(path)] if os.path.isdir(path) else []
-        super().__init__(os.path.basename(path), temp_subtrees, os.path.getsize(path))
+        if scanner is None:
+            scanner = ScandirScanner()
+        sizes = folder_sizes(path, scanner) if lazy else {}
+        if path not in sizes:
+            self._init_from_entry(scanner.scan(path))
+            return
+        TMTree.__init__(self, os.path.basename(path), [], sizes[path])
+        self._unread = (path, sizes)
+        self._load_subtrees()
+
+    def _init_from_entry(self, entry: ScanEntry) -> None:
+        """Initialize this tree, and a new subtree for each child, from the
+        scanned <entry>.
+        """
+        temp_subtrees = [FileSystemTree._from_entry(child)
+                         for child in entry.children]
+        TMTree.__init__(self, entry.name, temp_subtrees, entry.size)
+        self._unread = None
+
+    @classmethod
+    def _from_entry(cls, entry: ScanEntry) -> FileSystemTree:
+        """Return a new FileSystemTree built from the scanned <entry>.
+        """
+        tree = cls.__new__(cls)
+        tree._init_from_entry(entry)
+        return tree
+
+    @classmethod
+    def _placeholder(cls, name: str) -> FileSystemTree:
+        """Return a new, empty folder called <name> whose contents have not
+        been read yet. Its data_size is 0 until they are.
+        """
+        tree = cls.__new__(cls)
+        TMTree.__init__(tree, name, [], 0)
+        tree._unread = None
+        return tree
+
+    def _load_subtrees(self) -> None:
+        """Read the contents of this folder, if they have not been read yet,
+        into a new subtree for each file and an unread subtree for each
+        folder.
+
+        This tree's data_size, and its ancestors', are corrected if the
+        contents have changed size since the folder sizes were found. If the
+        folder cannot be read, it is left as an empty folder.
+        """
+        if self._unread is None:
+            return
+        path, sizes = self._unread
+        self._unread = None
+        try:
+            entries = read_folder(path)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir:
+                child_path = os.path.join(path, entry.name)
+                if child_path not in sizes:  # Created since the sizes.
+                    sizes.update(folder_sizes(child_path))
+                subtree = FileSystemTree._placeholder(entry.name)
+                subtree.data_size = sizes.get(child_path, entry.size)
+                subtree._unread = (child_path, sizes)
+                subtree._expanded = False
+            else:
+                subtree = FileSystemTree._from_entry(entry)
+            subtree._parent_tree = self
+            self._subtrees.append(subtree)
+
+        if self._subtrees:
+            total = sum(subtree.data_size for subtree in self._subtrees)
+            if total != self.data_size:
+                self._add_to_size(total - self.data_size)
+        self._layout_dirty = True
 
     def get_separator(self) -> str:
         """Return the file separator for this OS.
@@ -383,7 +913,9 @@ class FileSystemTree(TMTree):
             return convert_size(data_size / 1024, suffixes[suffix])
 
         components = []
-        if len(self._subtrees) == 0:
+        if self._unread is not None:
+            components.append('folder')
+        elif len(self._subtrees) == 0:
             components.append('file')
         else:
             components.append('folder')
@@ -392,12 +924,206 @@ class FileSystemTree(TMTree):
         return f' ({", ".join(components)})'
 
 
+class LayoutWorker:
+    """Runs slow changes to a tree, such as expanding or laying out a huge
+    tree, on a background thread, one at a time.
+
+    While a job runs, the tree it works on is its snapshot: no other thread
+    may read or change that tree until collect() returns True. The thread
+    that submitted the job keeps showing what it read before the job, such as
+    the tree's last draw list, and swaps in the result once it is collected.
+
+    === Private Attributes ===
+    _thread:
+        The thread running the current job, or None if there is no job that
+        has not been collected.
+    _on_done:
+        Called on the worker thread after each job finishes, or None.
+    _error:
+        The exception raised by the current job, if any.
+    """
+    _thread: Optional[threading.Thread]
+    _on_done: Optional[Callable[[], None]]
+    _error: Optional[Exception]
+
+    def __init__(self, on_done: Optional[Callable[[], None]] = None) -> None:
+        """Initialize a new LayoutWorker with no job, that calls <on_done>, if
+        it is not None, from the worker thread each time a job finishes.
+        """
+        self._thread = None
+        self._on_done = on_done
+        self._error = None
+
+    def submit(self, job: Callable[[], object]) -> None:
+        """Start running <job> on a background thread.
+
+        Precondition: self.is_busy() is False.
+        """
+        assert self._thread is None, 'the last job has not been collected'
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(job,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, job: Callable[[], object]) -> None:
+        """Run <job>, keeping any exception it raises for collect().
+        """
+        try:
+            job()
+        except Exception as error:  # Re-raised on the submitting thread.
+            self._error = error
+        if self._on_done is not None:
+            self._on_done()
+
+    def is_busy(self) -> bool:
+        """Return True iff a job has been submitted and not yet collected.
+        """
+        return self._thread is not None
+
+    def collect(self) -> bool:
+        """Return True iff the current job has finished, after which the tree
+        may be used again. Return False if it is still running, or there is
+        no job.
+
+        Raise the exception that stopped the job, if there was one.
+        """
+        if self._thread is None or self._thread.is_alive():
+            return False
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        return True
+
+    def wait(self) -> None:
+        """Wait for the current job, if any, to finish, and collect it without
+        raising the exception that stopped it, so that a new job can be
+        submitted.
+        """
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+        self._error = None
+
+
+class TreeSource:
+    """Something that changes a TMTree over time, such as a scan that is
+    still in progress. The visualiser polls each of its sources regularly from
+    its event loop, and redraws the tree whenever a source changes it.
+
+    This is an abstract class that should not be instantiated directly.
+    """
+
+    def poll(self, budget: float) -> bool:
+        """Apply pending changes to the tree, spending roughly at most
+        <budget> seconds, and return True iff the tree changed.
+        """
+        raise NotImplementedError
+
+    def is_done(self) -> bool:
+        """Return True iff this source will not change the tree any more.
+        """
+        return False
+
+    def close(self) -> None:
+        """Stop producing changes and release any resources held.
+        """
+
+
+class FileSystemTreeStream(TreeSource):
+    """A FileSystemTree that is built progressively by a background scan.
+
+    The tree starts out as just the scanned folder. Each call to poll() adds
+    the contents of the folders read since the last call, and updates the
+    data_size of their ancestors. Folders whose contents have not been read yet
+    have a data_size of 0. Once the scan is over, the tree is the same as the
+    one built by FileSystemTree(path).
+
+    Folders that cannot be read are left empty. If the scan is stopped early
+    by an error, the folders it did not reach are left empty too, and the
+    error is kept in the scan's error attribute rather than raised by poll().
+
+    === Public Attributes ===
+    tree:
+        The tree being built.
+
+    === Private Attributes ===
+    _scan:
+        The background scan providing the folders.
+    _pending:
+        The tree for each folder whose contents have not been added yet, keyed
+        by the id of the folder's ScanEntry.
+    """
+    tree: FileSystemTree
+    _scan: BackgroundScan
+    _pending: Dict[int, FileSystemTree]
+
+    def __init__(self, path: str, scanner: Optional[Scanner] = None) -> None:
+        """Start building the tree for the file or folder at <path>, read by
+        <scanner>, or by a default ScandirScanner if <scanner> is None.
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        self._scan = BackgroundScan(path, scanner or ScandirScanner())
+        root = self._scan.root
+        if root.is_dir:
+            self.tree = FileSystemTree._placeholder(root.name)
+            self._pending = {id(root): self.tree}
+        else:
+            self.tree = FileSystemTree._from_entry(root)
+            self._pending = {}
+
+    def poll(self, budget: float) -> bool:
+        """Add the contents of the folders read since the last call, spending
+        roughly at most <budget> seconds, and return True iff the tree changed.
+        """
+        deadline = time.perf_counter() + budget
+        changed = False
+        while time.perf_counter() < deadline:
+            folders = self._scan.collect(64)
+            if not folders:
+                break
+            for entry in folders:
+                self._add_folder(entry)
+            changed = True
+        return changed
+
+    def _add_folder(self, entry: ScanEntry) -> None:
+        """Add the children of the folder <entry> to its tree.
+        """
+        tree = self._pending.pop(id(entry))
+        for child in entry.children:
+            if child.is_dir:
+                subtree = FileSystemTree._placeholder(child.name)
+                self._pending[id(child)] = subtree
+            else:
+                subtree = FileSystemTree._from_entry(child)
+            subtree._parent_tree = tree
+            tree._subtrees.append(subtree)
+
+        if tree._subtrees:
+            size = sum(subtree.data_size for subtree in tree._subtrees)
+        else:
+            size = entry.size
+        tree._add_to_size(size - tree.data_size)
+
+    def is_done(self) -> bool:
+        """Return True iff the whole tree has been built, or the scan has
+        stopped early and will add nothing more.
+        """
+        return self._scan.is_done() and \
+            (not self._pending or self._scan.error is not None)
+
+
 if __name__ == '__main__':
     # x = FileSystemTree(test_path)
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'math', 'random', 'os', '__future__'
+            'python_ta', 'typing', 'math', 'random', 'os', 'time', 'array',
+            'bisect', '__future__', 'fs_scanner', 'treemap_layouts',
+            'threading'
         ]
     })
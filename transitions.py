@@ -0,0 +1,243 @@
+"""Assignment 2: Treemap transitions
+
+=== Module Description ===
+This module contains Transition, which animates the treemap from one draw
+list to the next, for example from before to after a tree is expanded, moved
+or zoomed in on.
+
+The rectangles of both draw lists are matched up once, when the transition is
+made. Each frame then only interpolates the edges of every rectangle, all at
+once in NumPy arrays if NumPy is installed, so a frame costs the same however
+the tree was changed, and nothing is laid out again until the next change.
+"""
+from __future__ import annotations
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tm_trees import DrawList, TMTree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The left, top, right and bottom edges of a rectangle.
+Edges = Tuple[float, float, float, float]
+
+
+class Transition:
+    """An animation of the rectangles of one draw list moving to where they
+    are in another.
+
+    Every rectangle moves its edges in a straight line, from where it starts
+    to where it ends. The rectangles of a frame may overlap, so a frame must
+    be drawn by a rasteriser that draws them in order, such as draw_rects.
+
+    === Private Attributes ===
+    _start:
+        The left, top, right and bottom edges of every rectangle at the start
+        of the transition, one sequence per edge.
+    _delta:
+        How far each edge in _start moves by the end of the transition.
+    _red, _green, _blue:
+        The colour of each rectangle.
+    _trees:
+        The tree drawn by each rectangle.
+
+    === Representation Invariants ===
+    - _start, _delta and each of their sequences, the colours and _trees all
+      have the same length.
+    """
+    _start: Sequence[Sequence[float]]
+    _delta: Sequence[Sequence[float]]
+    _red: array
+    _green: array
+    _blue: array
+    _trees: List[TMTree]
+
+    def __init__(self, start: DrawList, end: DrawList) -> None:
+        """Initialize a new Transition from the rectangles of <start> to those
+        of <end>.
+
+        A tree drawn in both draw lists moves from one rectangle to the other.
+        When a tree in <end> was drawn as part of a tree in <start>, as when
+        it was expanded or zoomed in on, it grows out of where that tree was;
+        when trees in <start> are drawn as part of a tree in <end>, as when it
+        was collapsed, they shrink into it, and it grows out of where they
+        were. Every other rectangle grows out of, or shrinks into, its centre.
+        """
+        start_index = {tree: i for i, tree in enumerate(start.trees)}
+        end_index = {tree: i for i, tree in enumerate(end.trees)}
+        start_edges = _all_edges(start)
+        end_edges = _all_edges(end)
+
+        # Where each rectangle in <end> starts, if it was drawn in <start>, or
+        # inside a tree that was.
+        from_start: Dict[int, Edges] = {}
+        matched = set()
+        for j, tree in enumerate(end.trees):
+            i = start_index.get(tree)
+            if i is None:
+                ancestor = _find_ancestor(tree, start_index)
+                if ancestor is None:
+                    continue
+                i = start_index[ancestor]
+                x, y, width, height = ancestor.rect
+                from_start[j] = _map(end_edges[j],
+                                     (x, y, x + width, y + height),
+                                     start_edges[i])
+            else:
+                from_start[j] = start_edges[i]
+            matched.add(i)
+
+        # The rest of <start> is either inside a tree in <end>, or gone. The
+        # area covered by the rectangles inside each tree is where it starts.
+        inside, gone = [], []
+        covered: Dict[TMTree, Edges] = {}
+        for i, tree in enumerate(start.trees):
+            if i in matched:
+                continue
+            ancestor = _find_ancestor(tree, end_index)
+            if ancestor is None:
+                gone.append(i)
+                continue
+            inside.append((i, ancestor))
+            left, top, right, bottom = start_edges[i]
+            area = covered.get(ancestor, start_edges[i])
+            covered[ancestor] = (min(area[0], left), min(area[1], top),
+                                 max(area[2], right), max(area[3], bottom))
+
+        moving = [j for j, tree in enumerate(end.trees)
+                  if j in from_start or tree in covered]
+        appearing = [j for j, tree in enumerate(end.trees)
+                     if j not in from_start and tree not in covered]
+
+        # The rectangles are drawn in layers: those appearing and
+        # disappearing at the bottom, and those shrinking into a tree on top.
+        layers = [
+            (end, appearing, [_centre(end_edges[j]) for j in appearing],
+             [end_edges[j] for j in appearing]),
+            (start, gone, [start_edges[i] for i in gone],
+             [_centre(start_edges[i]) for i in gone]),
+            (end, moving,
+             [from_start.get(j) or covered[end.trees[j]] for j in moving],
+             [end_edges[j] for j in moving]),
+            (start, [i for i, _ in inside],
+             [start_edges[i] for i, _ in inside],
+             [_map(start_edges[i], covered[ancestor],
+                   end_edges[end_index[ancestor]])
+              for i, ancestor in inside]),
+        ]
+        starts: List[Edges] = []
+        ends: List[Edges] = []
+        self._red, self._green, self._blue = array('B'), array('B'), array('B')
+        self._trees = []
+        for draw_list, indices, first, last in layers:
+            starts.extend(first)
+            ends.extend(last)
+            self._red.extend(array('B', [draw_list.red[i] for i in indices]))
+            self._green.extend(array('B',
+                                     [draw_list.green[i] for i in indices]))
+            self._blue.extend(array('B', [draw_list.blue[i] for i in indices]))
+            self._trees.extend([draw_list.trees[i] for i in indices])
+
+        if numpy is not None:
+            first_edges = numpy.array(starts, numpy.float64).reshape(-1, 4).T
+            last_edges = numpy.array(ends, numpy.float64).reshape(-1, 4).T
+            self._start = numpy.ascontiguousarray(first_edges)
+            self._delta = numpy.ascontiguousarray(last_edges - first_edges)
+        else:
+            self._start = [list(edge) for edge in zip(*starts)] \
+                or [[], [], [], []]
+            self._delta = [[b - a for a, b in zip(first, last)]
+                           for first, last in zip(zip(*starts), zip(*ends))] \
+                or [[], [], [], []]
+
+    def __len__(self) -> int:
+        """Return the number of rectangles in each frame of this transition.
+        """
+        return len(self._trees)
+
+    def frame(self, progress: float) -> DrawList:
+        """Return the draw list of the frame <progress> of the way through
+        this transition, from 0.0 for the start to 1.0 for the end.
+
+        The rectangles ease in and out, moving slowest near the start and end.
+        """
+        progress = min(max(progress, 0.0), 1.0)
+        eased = progress * progress * (3 - 2 * progress)
+        frame = DrawList()
+        if numpy is not None:
+            left, top, right, bottom = numpy.rint(
+                self._start + self._delta * eased).astype(numpy.int32)
+            frame.x.frombytes(left.tobytes())
+            frame.y.frombytes(top.tobytes())
+            frame.width.frombytes((right - left).tobytes())
+            frame.height.frombytes((bottom - top).tobytes())
+        else:
+            left, top, right, bottom = (
+                [round(a + d * eased) for a, d in zip(first, delta)]
+                for first, delta in zip(self._start, self._delta))
+            frame.x = array('i', left)
+            frame.y = array('i', top)
+            frame.width = array('i', [r - l for l, r in zip(left, right)])
+            frame.height = array('i', [b - t for t, b in zip(top, bottom)])
+        frame.red = self._red
+        frame.green = self._green
+        frame.blue = self._blue
+        frame.trees = self._trees
+        return frame
+
+
+def _all_edges(draw_list: DrawList) -> List[Edges]:
+    """Return the edges of every rectangle in <draw_list>.
+    """
+    return [(x, y, x + width, y + height) for x, y, width, height
+            in zip(draw_list.x, draw_list.y, draw_list.width,
+                   draw_list.height)]
+
+
+def _centre(edges: Edges) -> Edges:
+    """Return the edges of a rectangle with no area at the centre of the
+    rectangle with the given <edges>.
+    """
+    left, top, right, bottom = edges
+    x, y = (left + right) / 2, (top + bottom) / 2
+    return x, y, x, y
+
+
+def _map(edges: Edges, source: Edges, target: Edges) -> Edges:
+    """Return the edges of the rectangle with the given <edges> within the
+    rectangle <source>, when <source> is stretched onto <target>.
+    """
+    left, top, right, bottom = edges
+    source_left, source_top, source_right, source_bottom = source
+    target_left, target_top, target_right, target_bottom = target
+    x_scale = (target_right - target_left) / (source_right - source_left) \
+        if source_right != source_left else 0.0
+    y_scale = (target_bottom - target_top) / (source_bottom - source_top) \
+        if source_bottom != source_top else 0.0
+    return (target_left + (left - source_left) * x_scale,
+            target_top + (top - source_top) * y_scale,
+            target_left + (right - source_left) * x_scale,
+            target_top + (bottom - source_top) * y_scale)
+
+
+def _find_ancestor(tree: TMTree,
+                   index: Dict[TMTree, int]) -> Optional[TMTree]:
+    """Return the closest proper ancestor of <tree> that is in <index>, or
+    None if there is none.
+    """
+    tree = tree.get_parent()
+    while tree is not None and tree not in index:
+        tree = tree.get_parent()
+    return tree
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': ['python_ta', 'typing', 'array', 'numpy',
+                                   'tm_trees', '__future__']
+    })
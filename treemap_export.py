@@ -0,0 +1,242 @@
+"""Assignment 2: Headless treemap export
+
+=== Module Description ===
+This module renders treemaps straight to image files, without opening a
+window, so that they can be made by scripts and scheduled jobs such as cron.
+It is the headless counterpart of run_treemap_file_system and
+run_treemap_papers in treemap_visualiser.
+
+Each root to export is a file or folder, whose file structure is scanned, or
+a CSV file of papers in the format of cs1_papers.csv. Its treemap is written
+as a PNG image, drawn on an off-screen pygame surface, or as an SVG image,
+written as text.
+
+export_treemaps exports many roots at once, each in its own process, and
+reports how long each one took. To use it from the command line, run this
+module with the roots to export, for example:
+
+    python treemap_export.py /home /var -o treemaps -f svg
+"""
+from __future__ import annotations
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Never open a window, even if something initializes pygame's display.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from fs_scanner import SnapshotScanner, default_snapshot_path
+from papers import PaperTree, PaperTreeStream
+from rasterisers import DEFAULT_RASTERISER, RASTERISERS
+from tm_trees import DrawList, FileSystemTree, LOD_THRESHOLD, TMTree
+from treemap_layouts import DEFAULT_LAYOUT, LAYOUTS
+
+
+def write_png(draw_list: DrawList, size: Tuple[int, int], path: str) -> None:
+    """Write the rectangles in <draw_list>, on a black background of the given
+    <size>, to the PNG file <path>.
+    """
+    surface = pygame.Surface(size)
+    RASTERISERS[DEFAULT_RASTERISER](surface, draw_list)
+    pygame.image.save(surface, path)
+
+
+def write_svg(draw_list: DrawList, size: Tuple[int, int], path: str) -> None:
+    """Write the rectangles in <draw_list>, on a black background of the given
+    <size>, to the SVG file <path>.
+
+    Rectangles with no area are left out.
+    """
+    width, height = size
+    with open(path, 'w') as svg:
+        svg.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+                  f'height="{height}" viewBox="0 0 {width} {height}" '
+                  f'shape-rendering="crispEdges">\n'
+                  f'<rect width="{width}" height="{height}" fill="#000"/>\n')
+        svg.writelines(
+            f'<rect x="{x}" y="{y}" width="{w}" height="{h}" '
+            f'fill="#{r:02x}{g:02x}{b:02x}"/>\n'
+            for x, y, w, h, r, g, b in zip(draw_list.x, draw_list.y,
+                                           draw_list.width, draw_list.height,
+                                           draw_list.red, draw_list.green,
+                                           draw_list.blue)
+            if w > 0 and h > 0)
+        svg.write('</svg>\n')
+
+
+# The image writers, by the file format they write.
+WRITERS: Dict[str, Callable[[DrawList, Tuple[int, int], str], None]] = {
+    'png': write_png,
+    'svg': write_svg,
+}
+
+
+def load_tree(root: str, snapshot: bool = False,
+              max_depth: Optional[int] = None) -> TMTree:
+    """Return the tree to export for <root>: a PaperTree if <root> is a CSV
+    file, and a FileSystemTree of <root> otherwise.
+
+    If <snapshot>, scan a file system with the same snapshot as
+    run_treemap_file_system, so that only the folders changed since the last
+    scan of <root> are read again. Files rewritten in place in an otherwise
+    unchanged folder then keep their old sizes.
+
+    If <max_depth> is not None, read a CSV file with a PaperTreeStream that
+    keeps trees only down to <max_depth>, so that a very large file is read
+    in bounded memory.
+
+    Precondition: <root> is a valid path to a file or folder.
+    """
+    if os.path.isfile(root) and root.lower().endswith('.csv'):
+        if max_depth is not None:
+            return PaperTreeStream(os.path.basename(root), root,
+                                   max_depth=max_depth).finish()
+        return PaperTree(os.path.basename(root), [], all_papers=True,
+                         data_file=root)
+    scanner = SnapshotScanner(default_snapshot_path(root)) if snapshot \
+        else None
+    return FileSystemTree(root, scanner)
+
+
+def export_treemap(root: str, path: str, width: int = 1200,
+                   height: int = 670, layout: str = DEFAULT_LAYOUT,
+                   snapshot: bool = False,
+                   max_depth: Optional[int] = None) -> Dict[str, float]:
+    """Write the treemap of <root>, of the given <width> and <height> and laid
+    out by <layout>, to the image file <path>, and return how long loading,
+    laying out and writing it took, in seconds.
+
+    The format of the image is chosen by the extension of <path>, which must
+    be in WRITERS. <root> is loaded by load_tree, with <snapshot> and
+    <max_depth>.
+
+    Precondition: <root> is a valid path to a file or folder.
+    """
+    writer = WRITERS[os.path.splitext(path)[1][1:].lower()]
+    start = time.perf_counter()
+    tree = load_tree(root, snapshot, max_depth)
+    loaded = time.perf_counter()
+    tree.set_layout(layout)
+    tree.set_lod_threshold(LOD_THRESHOLD)
+    tree.update_rectangles((0, 0, width, height))
+    draw_list = tree.get_draw_list()
+    laid_out = time.perf_counter()
+    writer(draw_list, (width, height), path)
+    written = time.perf_counter()
+    return {'load': loaded - start, 'layout': laid_out - loaded,
+            'write': written - laid_out}
+
+
+def export_treemaps(roots: List[str], output: str, image_format: str = 'png',
+                    processes: Optional[int] = None,
+                    **options: object) -> Dict[str, Dict[str, float]]:
+    """Export the treemap of each of <roots> to a file in the folder <output>,
+    with export_treemap and the given <options>, and return how long each
+    root took.
+
+    The images are written in <image_format>, and named after the path of
+    their root. Up to <processes> roots, or one per CPU if <processes> is
+    None, are exported at once, each in its own process.
+
+    The time taken by each root is printed as it finishes. A root that cannot
+    be exported is reported, and left out of the result.
+    """
+    os.makedirs(output, exist_ok=True)
+    paths = {root: os.path.join(output, _image_name(root, image_format))
+             for root in roots}
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(processes) as pool:
+        futures = {root: pool.submit(export_treemap, root, paths[root],
+                                     **options)
+                   for root in paths}
+        for root, future in futures.items():
+            try:
+                times = future.result()
+            except Exception as error:  # Report it, and go on to the others.
+                print(f'{root}: failed, {type(error).__name__}: {error}')
+                continue
+            results[root] = times
+            print(f'{root}: load {times["load"] * 1000:8.1f} ms, '
+                  f'layout {times["layout"] * 1000:8.1f} ms, '
+                  f'write {times["write"] * 1000:8.1f} ms -> {paths[root]}')
+    print(f'{len(results)} of {len(roots)} treemaps exported in '
+          f'{time.perf_counter() - start:.2f} s')
+    return results
+
+
+def _image_name(root: str, image_format: str) -> str:
+    """Return the name of the image file, in <image_format>, for the treemap
+    of <root>, made from its absolute path so that roots with the same name
+    do not share an image.
+
+    The path's separators become '_', which makes some paths look alike, such
+    as /a_b and /a/b, so a short hash of the whole path is added to the name.
+    """
+    path = os.path.abspath(root)
+    name = path.strip(os.sep).replace(os.sep, '_')
+    key = hashlib.sha1(os.fsencode(path)).hexdigest()[:8]
+    return f'{name or "root"}-{key}.{image_format}'
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Export the treemaps given by the command line arguments <args>, or by
+    sys.argv if <args> is None, and return the exit status: 0 if every
+    treemap was exported, and 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(
+        description='Export treemaps of files and folders, or of CSV files '
+                    'of papers, to images without opening a window.')
+    parser.add_argument('roots', nargs='+',
+                        help='files or folders to scan, or CSV files of '
+                             'papers')
+    parser.add_argument('-o', '--output', default='.',
+                        help='folder to write the images to')
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS),
+                        default='png', help='image format')
+    parser.add_argument('-s', '--size', type=int, nargs=2,
+                        default=(1200, 670), metavar=('WIDTH', 'HEIGHT'),
+                        help='image size in pixels')
+    parser.add_argument('-l', '--layout', choices=sorted(LAYOUTS),
+                        default=DEFAULT_LAYOUT, help='layout engine')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='roots to export at once (default: one per CPU)')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='re-read only the folders changed since the '
+                             'last snapshot; files rewritten in place keep '
+                             'their old sizes')
+    parser.add_argument('-d', '--max-depth', type=int, default=None,
+                        help='read CSV files of papers a chunk at a time, '
+                             'keeping categories only down to this depth')
+    options = parser.parse_args(args)
+    width, height = options.size
+    results = export_treemaps(options.roots, options.output, options.format,
+                              options.processes, width=width, height=height,
+                              layout=options.layout,
+                              snapshot=options.snapshot,
+                              max_depth=options.max_depth)
+    return 0 if len(results) == len(options.roots) else 1
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'argparse', 'concurrent.futures',
+            'hashlib', 'os',
+            'sys', 'time', 'pygame', 'fs_scanner', 'papers', 'rasterisers',
+            'tm_trees', 'treemap_layouts', '__future__'
+        ],
+        'allowed-io': ['write_svg', 'export_treemaps'],
+        'generated-members': 'pygame.*'
+    })
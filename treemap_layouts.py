@@ -0,0 +1,166 @@
+"""Assignment 2: Treemap layout engines
+
+=== Module Description ===
+This module contains the layout engines that TMTree can use to divide a
+tree's rectangle between its subtrees. Every engine is a function that takes
+the pygame rectangle to fill and the data_size of each subtree, and returns a
+rectangle for each subtree, in the same order. The rectangles always fill the
+given rectangle exactly, without overlapping.
+
+slice_and_dice is the original treemap algorithm: it cuts the rectangle into
+slices along its longer side. squarified is the algorithm of Bruls, Huizing
+and van Wijk, which groups the subtrees into rows so that the rectangles are
+as close to square as it can make them.
+"""
+from __future__ import annotations
+import math
+from typing import Callable, Dict, List, Tuple
+
+Rect = Tuple[int, int, int, int]
+
+
+def slice_and_dice(rect: Rect, sizes: List[int]) -> List[Rect]:
+    """Return the rectangles for <sizes> when <rect> is divided along its
+    longer side, in proportion to <sizes>.
+
+    The last rectangle takes whatever is left, so the rectangles always fill
+    <rect> exactly.
+    """
+    x, y, width, height = rect
+    total_data_size = sum(sizes)
+    last = len(sizes) - 1
+    rects = []
+
+    # Divide the rectangles horizontally or vertically based on the aspect ratio
+    if width > height:
+        nx = x
+        for i, size in enumerate(sizes):
+            if i == last:
+                new_width = (width + x) - nx
+            elif total_data_size == 0:
+                new_width = 0
+            else:
+                new_width = math.floor(width * (size / total_data_size))
+            rects.append((nx, y, new_width, height))
+            nx += new_width
+    else:
+        ny = y
+        for i, size in enumerate(sizes):
+            if i == last:
+                new_height = (height + y) - ny
+            elif total_data_size == 0:
+                new_height = 0
+            else:
+                new_height = math.floor(height * (size / total_data_size))
+            rects.append((x, ny, width, new_height))
+            ny += new_height
+    return rects
+
+
+def squarified(rect: Rect, sizes: List[int]) -> List[Rect]:
+    """Return the rectangles for <sizes> when <rect> is divided by the
+    squarified treemap algorithm.
+
+    The sizes are placed from largest to smallest in rows along the shorter
+    side of the space that is left, and a row is closed as soon as adding the
+    next size would make its worst aspect ratio worse. The rectangles are
+    returned in the order of <sizes>, not in the order they were placed.
+    """
+    x, y, width, height = rect
+    total = sum(sizes)
+    if total == 0 or width <= 0 or height <= 0:
+        return slice_and_dice(rect, sizes)
+
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i])
+    scale = width * height / total
+    areas = [sizes[i] * scale for i in order]
+    placed = [(0.0, 0.0, 0.0, 0.0)] * len(order)
+
+    # The space that is left, as floats, so that rounding errors do not
+    # build up from row to row.
+    fx, fy, fw, fh = float(x), float(y), float(width), float(height)
+    start = 0
+    while start < len(areas):
+        side = min(fw, fh)
+        end = start + 1
+        row_sum = areas[start]
+        worst = _worst_ratio(row_sum, areas[start], areas[start], side)
+        while end < len(areas) and areas[end] > 0:
+            new_sum = row_sum + areas[end]
+            new_worst = _worst_ratio(new_sum, areas[start], areas[end], side)
+            if new_worst > worst:
+                break
+            row_sum, worst = new_sum, new_worst
+            end += 1
+        if end == len(areas) or areas[end] == 0:
+            # Anything left has no area; put it in this last row.
+            end = len(areas)
+
+        if fw >= fh:
+            # A column on the left of the space left.
+            row_width = fw if end == len(areas) else row_sum / fh
+            offset = fy
+            for i in range(start, end):
+                extent = areas[i] / row_width if row_width else 0.0
+                placed[i] = (fx, offset, row_width, extent)
+                offset += extent
+            placed[end - 1] = (fx, placed[end - 1][1], row_width,
+                               fy + fh - placed[end - 1][1])
+            fx, fw = fx + row_width, fw - row_width
+        else:
+            # A row along the top of the space left.
+            row_height = fh if end == len(areas) else row_sum / fw
+            offset = fx
+            for i in range(start, end):
+                extent = areas[i] / row_height if row_height else 0.0
+                placed[i] = (offset, fy, extent, row_height)
+                offset += extent
+            placed[end - 1] = (placed[end - 1][0], fy,
+                               fx + fw - placed[end - 1][0], row_height)
+            fy, fh = fy + row_height, fh - row_height
+        start = end
+
+    rects = [(0, 0, 0, 0)] * len(sizes)
+    for i, (px, py, pw, ph) in zip(order, placed):
+        # Round the edges, not the sizes, so that neighbours share edges.
+        left, top = round(px), round(py)
+        rects[i] = (left, top, round(px + pw) - left, round(py + ph) - top)
+    return rects
+
+
+def _worst_ratio(row_sum: float, largest: float, smallest: float,
+                 side: float) -> float:
+    """Return the worst aspect ratio in a row of total area <row_sum>, whose
+    largest and smallest areas are <largest> and <smallest>, laid along a side
+    of length <side>.
+    """
+    if smallest <= 0 or row_sum <= 0:
+        return math.inf
+    side_squared = side * side
+    sum_squared = row_sum * row_sum
+    return max(side_squared * largest / sum_squared,
+               sum_squared / (side_squared * smallest))
+
+
+def aspect_ratios(rects: List[Rect]) -> List[float]:
+    """Return the aspect ratio, longer side over shorter side, of each
+    rectangle in <rects> that has a non-zero area.
+    """
+    return [max(w, h) / min(w, h) for _, _, w, h in rects if w > 0 and h > 0]
+
+
+# The layout engines, by the name used to select them.
+LAYOUTS: Dict[str, Callable[[Rect, List[int]], List[Rect]]] = {
+    'slice_and_dice': slice_and_dice,
+    'squarified': squarified,
+}
+DEFAULT_LAYOUT = 'slice_and_dice'
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': ['python_ta', 'typing', 'math',
+                                   '__future__']
+    })
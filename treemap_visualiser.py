@@ -22,17 +22,141 @@ to them.
 
 from os import getcwd
 from sys import platform
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 import pygame
 
-from papers import PaperTree
-from tm_trees import TMTree, FileSystemTree
+from fs_scanner import SnapshotScanner, default_snapshot_path
+from fs_watcher import FileSystemWatcher
+from papers import GROUPINGS, PaperTable, PaperTreeStream, load_paper_table
+from profiling import Profiler
+from rasterisers import DEFAULT_RASTERISER, RASTERISERS, draw_rects
+from tm_trees import TMTree, DrawList, FileSystemTree, FileSystemTreeStream, \
+    LayoutWorker, LOD_THRESHOLD, SavedLayout, TreeSource
+from treemap_layouts import LAYOUTS
+from transitions import Transition
+
+# How often, in milliseconds, the tree sources are polled for changes, and
+# how long each poll may take, in seconds.
+SOURCE_POLL_INTERVAL = 250
+SOURCE_POLL_BUDGET = 0.05
+# The most times a second the display is redrawn.
+MAX_FPS = 60
+# How many rendered texts are kept, so that going back to a recent selection
+# does not render its text again.
+TEXT_CACHE_SIZE = 64
+# How long, in milliseconds, the window size must stay the same before the
+# tree is laid out for it. Until then, the last layout is stretched to fit.
+RESIZE_SETTLE_TIME = 150
+# How long, in milliseconds, the treemap takes to move from one layout to the
+# next. Frames are timed against it, so a slow frame skips ahead rather than
+# making the transition last longer.
+TRANSITION_TIME = 250
+# Layouts with more rectangles than this are shown straight away, without a
+# transition, because their frames could not be drawn in time.
+TRANSITION_MAX_RECTS = 50000
+# How often, in milliseconds, the profiling overlay is refreshed while it is
+# shown, even if nothing else changes.
+PROFILE_REFRESH = 500
+# The event posted by the layout worker when it is done with the tree.
+LAYOUT_DONE = pygame.event.custom_type()
+
+
+class ZoomLevel:
+    """A level of the visualiser's zoom stack: what it displayed just before
+    zooming in on one of the trees shown.
+
+    === Public Attributes ===
+    root:
+        The tree displayed at this level.
+    layout:
+        The saved layout of the tree that was zoomed in on, or None if that
+        tree must be laid out again when this level is displayed.
+    treemap:
+        The treemap surface displayed at this level, or None if it must be
+        drawn again.
+    draw_list:
+        The draw list treemap was drawn from.
+    """
+    root: TMTree
+    layout: Optional[SavedLayout]
+    treemap: Optional[pygame.Surface]
+    draw_list: Optional[DrawList]
+
+    def __init__(self, root: TMTree, treemap: Optional[pygame.Surface],
+                 draw_list: Optional[DrawList]) -> None:
+        """Initialize a new ZoomLevel displaying <root> with the given
+        <treemap>, drawn from <draw_list>. Its layout is saved later.
+        """
+        self.root = root
+        self.layout = None
+        self.treemap = treemap
+        self.draw_list = draw_list
 
 
 class Visualiser:
     """
     A class that uses pygame to visualise a tm_tree object.
+
+    The treemap is drawn once into an off-screen surface, which is only drawn
+    again when the tree's draw list changes. Each frame copies from it just
+    the parts of the screen that changed: the hover and selection outlines,
+    and the text when it changes.
+
+    === Public Attributes ===
+    rasteriser:
+        The name of the rasteriser in RASTERISERS used to draw the treemap.
+    transitions:
+        Whether or not the treemap moves smoothly from each layout to the
+        next, instead of changing at once.
+    profiler:
+        The timing counters of the scans, edits, layouts, hit tests and
+        drawing done for the visualisation.
+    show_profile:
+        Whether or not the frame rate and the time of each phase in profiler
+        are shown over the treemap.
+    profile_path:
+        The JSON file profiler is written to when the window is closed, or
+        None if it is not written.
+    paper_table:
+        The table of papers whose tree is displayed, so that the papers can
+        be regrouped, or None if the displayed tree is not from one.
+
+    === Private Attributes ===
+    _treemap_cache:
+        The off-screen surface the treemap was last drawn into, or None if it
+        must be drawn again.
+    _cached_draw_list:
+        The draw list _treemap_cache was drawn from.
+    _outlines:
+        The area of the screen covered by each outline drawn over the
+        treemap in the last frame.
+    _resize_preview:
+        While the window is being resized, the tree's draw list, the size it
+        was stretched to, and the stretched draw list; otherwise None.
+    _drawn_text:
+        The text shown at the bottom of the screen, or None if it must be
+        drawn again.
+    _display_text:
+        The text for the current selection, as returned by _get_display_text,
+        or None if it must be worked out again.
+    _fonts:
+        The font for each text size used so far.
+    _text_surfaces:
+        The rendered surface for each text and screen width shown recently,
+        oldest first.
+    _worker:
+        The layout worker that changes and lays out the tree in the
+        background. It posts a LAYOUT_DONE event when each change is done.
+    _zoom_stack:
+        The levels zoomed in from to reach the displayed tree, innermost
+        last.
+    _transition:
+        The transition being shown, and the time in milliseconds when it
+        started, or None if there is none.
+    _next_transition:
+        The transition to the layout made by the layout worker's current job,
+        set by that job, or None if there is none.
     """
     width: int
     height: int
@@ -41,6 +165,25 @@ class Visualiser:
     screen: Optional[pygame.Surface]
     hover_node: Optional[TMTree]
     selected_node: Optional[TMTree]
+    sources: List[TreeSource]
+    rasteriser: str
+    transitions: bool
+    profiler: Profiler
+    show_profile: bool
+    profile_path: Optional[str]
+    paper_table: Optional[PaperTable]
+    _treemap_cache: Optional[pygame.Surface]
+    _cached_draw_list: Optional[DrawList]
+    _outlines: List[pygame.Rect]
+    _resize_preview: Optional[Tuple[DrawList, Tuple[int, int], DrawList]]
+    _drawn_text: Optional[str]
+    _display_text: Optional[str]
+    _fonts: Dict[int, pygame.font.Font]
+    _text_surfaces: Dict[Tuple[str, int], pygame.Surface]
+    _worker: LayoutWorker
+    _zoom_stack: List[ZoomLevel]
+    _transition: Optional[Tuple[Transition, int]]
+    _next_transition: Optional[Transition]
 
     def __init__(self) -> None:
         # You may adjust the height and width as you'd like, depending on your screen resolution
@@ -53,19 +196,53 @@ class Visualiser:
         self.screen = None
         self.hover_node = None
         self.selected_node = None
-
-    def run_visualisation(self, tree: TMTree) -> None:
+        self.sources = []
+        self.rasteriser = DEFAULT_RASTERISER
+        self.transitions = True
+        self.profiler = Profiler()
+        self.show_profile = False
+        self.profile_path = None
+        self.paper_table = None
+        self._treemap_cache = None
+        self._cached_draw_list = None
+        self._outlines = []
+        self._resize_preview = None
+        self._drawn_text = None
+        self._display_text = None
+        self._fonts = {}
+        self._text_surfaces = {}
+        self._worker = LayoutWorker(self._post_layout_done)
+        self._zoom_stack = []
+        self._transition = None
+        self._next_transition = None
+
+    def run_visualisation(self, tree: TMTree,
+                          source: Optional[TreeSource] = None) -> None:
         """Display an interactive graphical display of the given tree's treemap.
+
+        If <source> is not None, keep polling it for changes to the tree, and
+        redraw the treemap as they arrive.
         """
 
         # Setup pygame
         pygame.init()
         self.screen = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE)
+        self._treemap_cache = None
+        self._cached_draw_list = None
+        self._display_text = None
+        self._zoom_stack = []
+        self._transition = None
+        self._next_transition = None
         self.tree = tree
+        if source is not None:
+            self.sources.append(source)
 
-        # Render the initial display of the static treemap.
-        self.render_display()
-        tree.update_rectangles((0, 0, self.width, self.height - self.font_height))
+        # Lay the treemap out on the layout worker; the event loop shows it
+        # once it is ready.
+        if tree.get_lod_threshold() != LOD_THRESHOLD:
+            self._start_job(lambda: tree.set_lod_threshold(LOD_THRESHOLD))
+        else:
+            self._start_job()
 
         # Start an event loop to respond to events.
         self.event_loop()
@@ -75,42 +252,158 @@ class Visualiser:
 
         Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
         screen vertically into the treemap and text comments.
+
+        Only the parts of the screen that changed since the last frame are
+        drawn and sent to the display.
         """
-        # First, clear the screen
-        pygame.draw.rect(self.screen, pygame.Color('black'),
-                         (0, 0, self.width, self.height))
+        with self.profiler.phase('frame'):
+            self._render_frame()
+        self.profiler.frame_drawn()
 
+    def _render_frame(self) -> None:
+        """Render the frame for render_display.
+        """
         try:
             subscreen = self.screen.subsurface((0, 0, self.width, self.height - self.font_height))
         except ValueError:
             return
 
-        # Uncomment this after you have completed Task 2
-        for rect, colour in self.tree.get_rectangles():
-            # Note that the arguments are in the opposite order
-            pygame.draw.rect(subscreen, colour, rect)
+        size = subscreen.get_size()
+        if self._worker.is_busy():
+            # The tree is being changed on the layout worker, so keep showing
+            # the treemap of the last frame, if there is one.
+            if self._cached_draw_list is None:
+                return
+            draw_list = self._cached_draw_list
+        elif self._transition is not None and self.tree.rect[2:] == size:
+            # Move the treemap from the last layout towards this one.
+            transition, started = self._transition
+            progress = (pygame.time.get_ticks() - started) / TRANSITION_TIME
+            if progress < 1:
+                draw_list = transition.frame(progress)
+            else:
+                self._transition = None
+                draw_list = self.tree.get_draw_list()
+        elif self.tree.rect[2:] == size:
+            # The draw list is cached by the tree, so this does not walk the
+            # tree unless its display changed.
+            draw_list = self.tree.get_draw_list()
+            self._resize_preview = None
+        else:
+            draw_list = self.tree.get_draw_list()
+            # The window is being resized: stretch the last layout until the
+            # tree is laid out for the new size.
+            if self._resize_preview is None \
+                    or self._resize_preview[0] is not draw_list \
+                    or self._resize_preview[1] != size:
+                self._resize_preview = (
+                    draw_list, size,
+                    draw_list.scaled(self.tree.rect[2:], size))
+            draw_list = self._resize_preview[2]
+        if self._treemap_cache is None \
+                or draw_list is not self._cached_draw_list \
+                or self._treemap_cache.get_size() != size:
+            # The rectangles of a transition's frame may overlap, so they
+            # are drawn in order.
+            self._treemap_cache = self._draw_treemap(
+                draw_list, size,
+                draw_rects if self._transition is not None else None)
+            self._cached_draw_list = draw_list
+            self.screen.fill(pygame.Color('black'))
+            subscreen.blit(self._treemap_cache, (0, 0))
+            dirty = [self.screen.get_rect()]
+            self._drawn_text = None
+        else:
+            # Remove last frame's outlines by copying the treemap back.
+            dirty = self._outlines
+            for rect in self._outlines:
+                subscreen.blit(self._treemap_cache, rect, rect)
 
         # add the hover rectangle
+        self._outlines = []
         if self.selected_node is not None:
-            pygame.draw.rect(subscreen, (255, 255, 255), self.selected_node.rect, 4)
+            self._outlines.append(pygame.draw.rect(
+                subscreen, (255, 255, 255), self.selected_node.rect, 4))
         if self.hover_node is not None:
-            pygame.draw.rect(subscreen, (255, 255, 255), self.hover_node.rect, 2)
-
-        self._render_text()
+            self._outlines.append(pygame.draw.rect(
+                subscreen, (255, 255, 255), self.hover_node.rect, 2))
+        if self.show_profile:
+            self._outlines.append(self._render_profile(subscreen))
+        dirty = dirty + self._outlines
+
+        if self._display_text is None and not self._worker.is_busy():
+            self._display_text = self._get_display_text()
+        text = self._display_text
+        if text is not None and text != self._drawn_text:
+            dirty.append(self._render_text(text))
+            self._drawn_text = text
 
         # This must be called *after* all other pygame functions have run.
-        pygame.display.flip()
-
-    def _render_text(self) -> None:
-        """Render text at the bottom of the display.
+        pygame.display.update(dirty)
+
+    def _draw_treemap(self, draw_list: DrawList, size: Tuple[int, int],
+                      rasterise: Optional[Callable[[pygame.Surface, DrawList],
+                                                   None]] = None) \
+            -> pygame.Surface:
+        """Return a new surface of the given <size> with every rectangle in
+        <draw_list> drawn on it by <rasterise>, or by this visualiser's
+        rasteriser if <rasterise> is None.
+        """
+        surface = pygame.Surface(size)
+        with self.profiler.phase('draw'):
+            (rasterise or RASTERISERS[self.rasteriser])(surface, draw_list)
+        return surface
+
+    def _render_profile(self, subscreen: pygame.Surface) -> pygame.Rect:
+        """Render the frame rate and the time of each phase in profiler at the
+        top left of <subscreen>, and return the area that was drawn.
         """
-        # The font we want to use
-        font = pygame.font.SysFont('Consolas', self.font_height - 8)
-        text_surface = font.render(self._get_display_text(), True, pygame.Color('white'))
+        font = self._get_font(14)
+        lines = [font.render(line, True, pygame.Color('white'))
+                 for line in self.profiler.overlay_lines()]
+        area = pygame.Rect(0, 0, max(line.get_width() for line in lines) + 8,
+                           sum(line.get_height() for line in lines) + 8)
+        area = area.clip(subscreen.get_rect())
+        subscreen.fill(pygame.Color('black'), area)
+        y = 4
+        for line in lines:
+            subscreen.blit(line, (4, y))
+            y += line.get_height()
+        return area
+
+    def _render_text(self, text: str) -> pygame.Rect:
+        """Render <text> at the bottom of the display, and return the area of
+        the screen that was drawn.
+        """
+        area = pygame.Rect(0, self.height - self.font_height,
+                           self.width, self.font_height)
+        self.screen.fill(pygame.Color('black'), area)
+
+        key = (text, self.width)
+        text_surface = self._text_surfaces.get(key)
+        if text_surface is None:
+            if len(self._text_surfaces) >= TEXT_CACHE_SIZE:
+                # Forget the oldest text.
+                del self._text_surfaces[next(iter(self._text_surfaces))]
+            font = self._get_font(self.font_height - 8)
+            text_surface = font.render(text, True, pygame.Color('white'))
+            self._text_surfaces[key] = text_surface
 
         # Where to render the text_surface
         text_pos = (0, self.height - self.font_height + 4)
         self.screen.blit(text_surface, text_pos)
+        return area
+
+    def _get_font(self, size: int) -> pygame.font.Font:
+        """Return the font used for text of the given <size>, looking it up
+        only the first time it is needed.
+        """
+        font = self._fonts.get(size)
+        if font is None:
+            # The font we want to use
+            font = pygame.font.SysFont('Consolas', size)
+            self._fonts[size] = font
+        return font
 
     def event_loop(self) -> None:
         """Respond to events (mouse clicks, key presses) and update the display.
@@ -119,85 +412,350 @@ class Visualiser:
         the next event, determines the event's type, and then updates the state
         of the visualisation or the tree itself, updating the display if necessary.
         This loop ends only when the user closes the window.
+
+        The loop sleeps until an event arrives or a tree source is due to be
+        polled, and handles every event waiting at once, so a burst of mouse
+        motion costs a single hover lookup. The display is redrawn only when
+        the hover, the selection, the layout or the window changed, and at
+        most MAX_FPS times a second.
+
+        Changes that may touch the whole tree, and every layout, run on the
+        layout worker. Until the worker is done, the last frame stays on the
+        screen, and clicks and key presses are held back, then handled in
+        order.
         """
         selected_node = self.tree
+        next_poll = 0
+        next_frame = 0
+        settle_at = None
+        next_profile = 0
+        redraw = True
+        held = []
 
         while True:
-            # Wait for an event
-            event = pygame.event.poll()
-            if event.type == pygame.QUIT:
-                return
-
-            if event.type == pygame.VIDEORESIZE:
-                self.width = int(event.w) if event.w else self.width
-                self.height = int(event.h) if event.h else self.height
-                self.run_visualisation(self.tree)
-                return
+            busy = self._worker.is_busy()
+
+            # Sleep until there is something to do.
+            now = pygame.time.get_ticks()
+            timeout = None
+            if redraw or (held and not busy):
+                timeout = next_frame - now if redraw else 0
+            if self.sources and not busy:
+                until_poll = next_poll - now
+                timeout = until_poll if timeout is None \
+                    else min(timeout, until_poll)
+            if settle_at is not None and not busy:
+                until_settled = settle_at - now
+                timeout = until_settled if timeout is None \
+                    else min(timeout, until_settled)
+            if self.show_profile:
+                until_profile = next_profile - now
+                timeout = until_profile if timeout is None \
+                    else min(timeout, until_profile)
+            events = self._wait_for_events(timeout)
+            if held and not busy:
+                events, held = held + events, []
+
+            for event in events:
+                if event.type == pygame.QUIT:
+                    # A job still on the worker would stop the next
+                    # visualisation from starting its own.
+                    self._worker.wait()
+                    for source in self.sources:
+                        source.close()
+                    self.sources = []
+                    if self.profile_path is not None:
+                        self.profiler.dump(self.profile_path)
+                    return
 
-            # get the hover position and the corresponding node
-            hover_node = self.tree.get_tree_at_position(pygame.mouse.get_pos())
-
-            if event.type == pygame.MOUSEBUTTONUP:
-                selected_node = \
-                    self._handle_click(event.button, event.pos, selected_node)
-
-            elif event.type == pygame.KEYUP and selected_node is not None:
-                drawable_height = self.height - self.font_height
-                k = event.key
-                if k == pygame.K_UP:
-                    selected_node.change_size(0.01)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-
-                elif k == pygame.K_DOWN:
-                    selected_node.change_size(-0.01)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-
-                elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
-                    if selected_node.delete_self():
-                        self.tree.update_data_sizes()
-                        self.tree.update_rectangles((0, 0, self.width, drawable_height))
+                if event.type == LAYOUT_DONE:
+                    if self._worker.collect():
+                        redraw = True
+                        self._display_text = None
+                        if self._next_transition is not None:
+                            self._transition = (self._next_transition,
+                                                pygame.time.get_ticks())
+                            self._next_transition = None
+
+                if event.type == pygame.VIDEORESIZE:
+                    self.width = int(event.w) if event.w else self.width
+                    self.height = int(event.h) if event.h else self.height
+                    self.screen = pygame.display.get_surface()
+                    # Wait for the size to settle before laying out again.
+                    settle_at = pygame.time.get_ticks() + RESIZE_SETTLE_TIME
+                    self._transition = None
+                    self._display_text = None
+                    redraw = True
+
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    redraw = True
+
+                if event.type in (pygame.MOUSEBUTTONUP, pygame.KEYUP) \
+                        and (self._worker.is_busy() or held):
+                    # The tree is being changed; handle this once it is done.
+                    held.append(event)
+                    continue
+
+                if event.type == pygame.MOUSEBUTTONUP:
+                    selected_node = \
+                        self._handle_click(event.button, event.pos, selected_node)
+
+                elif event.type == pygame.KEYUP and selected_node is not None:
+                    k = event.key
+                    redraw = True
+                    # The selected tree's path or size may change.
+                    self._display_text = None
+                    if k == pygame.K_UP:
+                        with self.profiler.phase('edit'):
+                            selected_node.change_size(0.01)
+                        self._start_job()
+
+                    elif k == pygame.K_DOWN:
+                        with self.profiler.phase('edit'):
+                            selected_node.change_size(-0.01)
+                        self._start_job()
+
+                    elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
+                        with self.profiler.phase('edit'):
+                            deleted = selected_node.delete_self()
+                        if deleted:
+                            self._start_job()
+                            selected_node = None
+
+                    elif k == pygame.K_m:
+                        with self.profiler.phase('hit test'):
+                            hover_node = self.tree.get_tree_at_position(
+                                pygame.mouse.get_pos())
+                        with self.profiler.phase('edit'):
+                            selected_node.move(hover_node)
+                        self._start_job()
+                        selected_node = hover_node
+
+                    elif k == pygame.K_e:
+                        self._start_job(selected_node.expand)
                         selected_node = None
 
-                elif k == pygame.K_m:
-                    selected_node.move(hover_node)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-                    selected_node = hover_node
+                    elif k == pygame.K_a:
+                        self._start_job(selected_node.expand_all)
+                        selected_node = None
 
-                elif k == pygame.K_e:
-                    selected_node.expand()
+                    elif k == pygame.K_c:
+                        self._start_job(selected_node.collapse)
+                        if selected_node is not self.tree:
+                            selected_node = selected_node.get_parent()
+
+                    elif k == pygame.K_x:
+                        self._start_job(selected_node.collapse_all)
+                        selected_node = self.tree
+
+                    elif k == pygame.K_q and selected_node is not self.tree:
+                        self._zoom_in(selected_node)
+                        selected_node = self.tree
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_b:
+                    if self._zoom_out():
+                        selected_node = self.tree
+                        redraw = True
+                        self._display_text = None
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_l:
+                    self._start_job(self._next_layout)
+                    redraw = True
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_g \
+                        and self.paper_table is not None:
+                    # The trees zoomed into and selected are not in the new
+                    # grouping, so show it from the root.
+                    self._zoom_stack = []
+                    self.tree = self.paper_table.tree
                     selected_node = None
+                    self._display_text = None
+                    self._start_job(self._next_grouping)
+                    redraw = True
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_p:
+                    self.show_profile = not self.show_profile
+                    redraw = True
+
+            busy = self._worker.is_busy()
+            if self.sources and not busy \
+                    and pygame.time.get_ticks() >= next_poll:
+                if self._poll_sources():
+                    self._start_job()
+                    busy = True
+                next_poll = pygame.time.get_ticks() + SOURCE_POLL_INTERVAL
+
+            if settle_at is not None and not busy \
+                    and pygame.time.get_ticks() >= settle_at:
+                settle_at = None
+                self._start_job(edit=False)
+                busy = True
+
+            # get the hover position and the corresponding node, once for all
+            # of the mouse motion handled above. While the window is being
+            # resized, the rectangles do not match the display, and while the
+            # worker is busy, they may be changing.
+            if settle_at is not None:
+                hover_node = None
+            elif busy:
+                hover_node = self.hover_node
+            else:
+                with self.profiler.phase('hit test'):
+                    hover_node = self.tree.get_tree_at_position(
+                        pygame.mouse.get_pos())
+            if hover_node is not self.hover_node:
+                redraw = True
+            if selected_node is not self.selected_node:
+                redraw = True
+                self._display_text = None
+            self.selected_node = selected_node
+            self.hover_node = hover_node
 
-                elif k == pygame.K_a:
-                    selected_node.expand_all()
-                    selected_node = None
+            if self._transition is not None:
+                redraw = True
+            if self.show_profile and pygame.time.get_ticks() >= next_profile:
+                redraw = True
+                next_profile = pygame.time.get_ticks() + PROFILE_REFRESH
+
+            # Update display, unless the last frame was drawn too recently.
+            now = pygame.time.get_ticks()
+            if redraw and now >= next_frame:
+                self.render_display()
+                next_frame = now + 1000 // MAX_FPS
+                redraw = False
+
+    @staticmethod
+    def _post_layout_done() -> None:
+        """Wake the event loop up, from the layout worker's thread, because
+        the worker is done with the tree.
+        """
+        try:
+            pygame.event.post(pygame.event.Event(LAYOUT_DONE))
+        except pygame.error:
+            pass  # pygame has shut down, so nothing is waiting for it.
+
+    def _zoom_in(self, tree: TMTree) -> None:
+        """Display <tree>, which is displayed inside the current tree, on its
+        own, and remember the current level so that _zoom_out can go back to
+        it without laying it out again.
+        """
+        level = ZoomLevel(self.tree, self._treemap_cache,
+                          self._cached_draw_list)
+        self._zoom_stack.append(level)
+        self.tree = tree
 
-                elif k == pygame.K_c:
-                    selected_node.collapse()
-                    if selected_node is not self.tree:
-                        selected_node = selected_node.get_parent()
+        def save_and_zoom() -> None:
+            level.layout = tree.save_layout()
 
-                elif k == pygame.K_x:
-                    selected_node.collapse_all()
-                    selected_node = self.tree
+        self._start_job(save_and_zoom, edit=False)
 
-                elif k == pygame.K_q and selected_node is not self.tree:
-                    self.run_visualisation(selected_node)
-                    return
+    def _zoom_out(self) -> bool:
+        """Display the level zoomed in from to reach the current tree, or the
+        current tree's parent if there is no such level, and return True iff
+        the displayed tree changed.
 
-            if event.type == pygame.KEYUP and event.key == pygame.K_b:
-                if self.tree.get_parent():
-                    self.tree.get_parent().collapse_all()
-                    self.run_visualisation(self.tree.get_parent())
-                    return
+        The level's layout and treemap are reused if nothing has changed
+        since it was zoomed in from.
+        """
+        tree = self.tree
+        if self._zoom_stack:
+            level = self._zoom_stack.pop()
+            self.tree = level.root
+            if level.treemap is not None and not self.transitions:
+                # Show the level straight away, while its layout is restored,
+                # rather than moving to it from the current treemap.
+                self._treemap_cache = level.treemap
+                self._cached_draw_list = level.draw_list
+            layout = level.layout
+            self._start_job(lambda: tree.restore_layout(layout), edit=False)
+        elif tree.get_parent():
+            self.tree = tree.get_parent()
+            self._start_job(self.tree.collapse_all)
+        else:
+            return False
+        return True
 
-            self.selected_node = selected_node
-            self.hover_node = hover_node
+    def _start_job(self, change: Optional[Callable[[], object]] = None,
+                   edit: bool = True) -> None:
+        """Call <change>, if it is not None, then lay the tree out for the
+        display and build its draw list, all on the layout worker.
+
+        If <edit>, the tree has been or will be changed, so the layouts saved
+        in the zoom stack can no longer be reused.
 
-            # Update display
-            self.render_display()
+        If transitions are on, the job also makes the transition from the
+        treemap on the screen to the new layout, unless either has too many
+        rectangles.
+
+        Precondition: the layout worker is not busy.
+        """
+        if edit:
+            for level in self._zoom_stack:
+                level.layout = None
+                level.treemap = None
+        tree = self.tree
+        rect = (0, 0, self.width, self.height - self.font_height)
+        start = self._cached_draw_list if self.transitions else None
+        self._transition = None
+
+        profiler = self.profiler
+
+        def job() -> None:
+            if change is not None:
+                with profiler.phase('edit'):
+                    change()
+            with profiler.phase('layout'):
+                tree.update_rectangles(rect)
+            with profiler.phase('draw list'):
+                draw_list = tree.get_draw_list()
+            if start is not None and draw_list is not start \
+                    and len(start) <= TRANSITION_MAX_RECTS \
+                    and len(draw_list) <= TRANSITION_MAX_RECTS:
+                with profiler.phase('transition'):
+                    self._next_transition = Transition(start, draw_list)
+
+        self._worker.submit(job)
+
+    @staticmethod
+    def _wait_for_events(timeout: Optional[int]) -> List[pygame.event.Event]:
+        """Return every event waiting to be handled, after waiting for the
+        first one for at most <timeout> milliseconds, or for as long as it
+        takes if <timeout> is None. The list is empty if the wait timed out.
+        """
+        if timeout is None:
+            first = pygame.event.wait()
+        elif timeout > 0:
+            first = pygame.event.wait(timeout)
+        else:
+            first = pygame.event.poll()
+        if first.type == pygame.NOEVENT:
+            return []
+        return [first] + pygame.event.get()
+
+    def _poll_sources(self) -> bool:
+        """Apply the pending changes from each tree source, and return True
+        iff any of them changed the tree, which then needs laying out again.
+        """
+        changed = False
+        with self.profiler.phase('scan'):
+            for source in self.sources:
+                changed = source.poll(SOURCE_POLL_BUDGET) or changed
+        return changed
+
+    def _next_layout(self) -> None:
+        """Switch the whole tree to the next layout engine in LAYOUTS.
+        """
+        names = list(LAYOUTS)
+        current = names.index(self.tree.get_layout())
+        self.tree.set_layout(names[(current + 1) % len(names)])
+
+    def _next_grouping(self) -> None:
+        """Regroup the papers in paper_table by the next grouping in
+        GROUPINGS.
+        """
+        grouping = self.paper_table.grouping
+        current = GROUPINGS.index(grouping) if grouping in GROUPINGS else -1
+        self.paper_table.regroup(GROUPINGS[(current + 1) % len(GROUPINGS)])
 
     def _handle_click(self, button: int, pos: tuple[int, int],
                       old_selected_leaf: Optional[TMTree]) -> Optional[TMTree]:
@@ -209,7 +767,8 @@ class Visualiser:
 
         # left mouse click
         if button == 1:
-            selected_leaf = self.tree.get_tree_at_position(pos)
+            with self.profiler.phase('hit test'):
+                selected_leaf = self.tree.get_tree_at_position(pos)
             if selected_leaf is None:
                 return old_selected_leaf
             elif selected_leaf is old_selected_leaf:
@@ -241,8 +800,30 @@ class Visualiser:
             return leaf_path + leaf.get_suffix()
 
 
-def run_treemap_file_system(path: str) -> None:
+def run_treemap_file_system(path: str, streaming: bool = True,
+                            snapshot: bool = False, watch: bool = False,
+                            profile: Optional[str] = None,
+                            lazy: bool = False) -> None:
     """Run a treemap visualisation for the given path's file structure.
+
+    If <streaming>, open the window straight away and fill the treemap in as
+    the folders are scanned, instead of waiting for the whole scan.
+
+    If <snapshot>, keep a snapshot of the scan in the user's cache folder, and
+    on later runs re-read only the folders that changed since. A file that
+    was rewritten in place, in a folder that has not otherwise changed, then
+    keeps the size it had in the snapshot, so this is off by default.
+
+    If <watch>, keep the treemap up to date with changes to the files and
+    folders while it is displayed.
+
+    If <lazy>, find only the total size of each folder up front, and read the
+    contents of a folder when it is first expanded, instead of keeping the
+    whole file structure in memory. This takes precedence over <streaming>.
+
+    If <profile> is not None, write the visualiser's timing counters to the
+    JSON file <profile> when the window is closed.
+
     Precondition: <path> is a valid path to a file or folder.
     """
     instructions = '\n==== Instructions for use ====\n' \
@@ -256,20 +837,60 @@ def run_treemap_file_system(path: str) -> None:
                    '"Up" and "Down" arrow keys to change the size of a file (in visualization)\n' \
                    '"M" to move a file (while selecting a file and hovering over a folder)\n' \
                    '"Del" to delete a file or folder from the visualization\n' \
+                   '"L" to switch between the slice-and-dice and squarified layouts\n' \
+                   '"P" to show or hide the frame rate and timings\n' \
                    '(Drag window to resize)'
-    file_tree = FileSystemTree(path)
     print(instructions)
-    visualizer.run_visualisation(file_tree)
-
-
-def run_treemap_papers() -> None:
+    scanner = SnapshotScanner(default_snapshot_path(path)) if snapshot else None
+    if lazy:
+        with visualizer.profiler.phase('scan'):
+            file_tree, source = FileSystemTree(path, scanner, lazy=True), None
+    elif streaming:
+        stream = FileSystemTreeStream(path, scanner)
+        file_tree, source = stream.tree, stream
+    else:
+        with visualizer.profiler.phase('scan'):
+            file_tree, source = FileSystemTree(path, scanner), None
+    if watch:
+        visualizer.sources.append(
+            FileSystemWatcher(file_tree, path, after=source))
+    visualizer.profile_path = profile
+    visualizer.run_visualisation(file_tree, source)
+
+
+def run_treemap_papers(profile: Optional[str] = None,
+                       data_file: Optional[str] = None,
+                       streaming: bool = False,
+                       max_depth: Optional[int] = None) -> None:
     """Run a treemap visualization for CS Education research papers data.
 
     You can try changing the value of the named argument by_year, but the
     others should stay the same.
+
+    If <profile> is not None, write the visualiser's timing counters to the
+    JSON file <profile> when the window is closed.
+
+    The papers are read from <data_file>, or from DATA_FILE in papers if
+    <data_file> is None. If <streaming>, or <max_depth> is not None, open the
+    window straight away and fill the treemap in as the file is read, a chunk
+    at a time, keeping trees only down to <max_depth> if it is not None, so
+    that even a very large file is shown in bounded memory.
+
+    Otherwise, the papers are loaded once into a PaperTable, and "G" regroups
+    them by each grouping in GROUPINGS in turn.
     """
-    paper_tree = PaperTree('CS1', [], all_papers=True, by_year=True)
-    visualizer.run_visualisation(paper_tree)
+    if streaming or max_depth is not None:
+        stream = PaperTreeStream('CS1', data_file, by_year=True,
+                                 max_depth=max_depth)
+        paper_tree, source = stream.tree, stream
+    else:
+        print('"G" to group the papers by year, category, first author or '
+              'number of citations')
+        with visualizer.profiler.phase('load'):
+            visualizer.paper_table = load_paper_table('CS1', data_file)
+        paper_tree, source = visualizer.paper_table.tree, None
+    visualizer.profile_path = profile
+    visualizer.run_visualisation(paper_tree, source)
 
 
 if __name__ == '__main__':
@@ -277,7 +898,9 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'pygame', 'tm_trees', 'papers'
+            'python_ta', 'typing', 'pygame', 'tm_trees', 'papers',
+            'fs_scanner', 'fs_watcher', 'treemap_layouts', 'rasterisers',
+            'transitions', 'profiling'
         ],
         'generated-members': 'pygame.*'
     })